@@ -0,0 +1,64 @@
+""" Measures the cold-start latency of importing climatic, in fresh interpreters.
+
+Usage:
+    python benchmarks/import_time.py [-n RUNS] [statement]
+
+The default statement is 'from climatic.cli.Linux import SshLinux'. The time of an empty
+interpreter is measured the same way and subtracted, and the slowest modules imported by the
+statement are listed, as reported by 'python -X importtime'.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_STATEMENT = 'from climatic.cli.Linux import SshLinux'
+
+
+def run_cold(statement: str) -> float:
+    """ Returns the time spent running the statement in a fresh interpreter, in seconds.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', statement], env=env, check=True)
+    return time.perf_counter() - start
+
+
+def slowest_modules(statement: str, count: int = 10) -> list:
+    """ Returns the (cumulative microseconds, module) of the slowest modules imported.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    report = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], env=env,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    modules = []
+    for line in report.splitlines()[1:]:
+        (_, cumulative, name) = line.split('|')
+        modules.append((int(cumulative), name.strip()))
+    return sorted(modules, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('statement', nargs='?', default=DEFAULT_STATEMENT)
+    parser.add_argument('-n', '--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    # Compiles the modules once, so the runs do not measure the bytecode compilation
+    run_cold(args.statement)
+    baseline = statistics.median([run_cold('pass') for _ in range(args.runs)])
+    timings = [run_cold(args.statement) for _ in range(args.runs)]
+
+    print("{0}: median {1:.1f} ms, min {2:.1f} ms over {3} runs (interpreter start "
+          "subtracted: {4:.1f} ms)".format(
+              args.statement, (statistics.median(timings) - baseline) * 1000,
+              (min(timings) - baseline) * 1000, args.runs, baseline * 1000))
+    for (cumulative, name) in slowest_modules(args.statement):
+        print("  {0:8.1f} ms  {1}".format(cumulative / 1000.0, name))
+
+
+if __name__ == '__main__':
+    main()
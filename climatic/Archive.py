@@ -0,0 +1,417 @@
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Union
+
+# Index entry of a record: data offset, timestamp, duration, output size, device size,
+# command size and flags
+INDEX_FORMAT = '<QddIHIB'
+INDEX_SIZE = struct.calcsize(INDEX_FORMAT)
+
+# Record flags
+FLAG_FAILED = 1
+
+DATA_SUFFIX = '.data'
+INDEX_SUFFIX = '.idx'
+
+
+def _to_bytes(text: Union[str, bytes]) -> bytes:
+    if isinstance(text, bytes):
+        return text
+    return text.encode('utf-8', 'surrogateescape')
+
+####################################################################################################
+## ArchiveWriter
+
+class ArchiveWriter(object):
+    """ Append-only archive of the commands run in CLI sessions.
+
+    The archive is made of two files:
+    - '<path>.data': the records, each one made of the device, the command and the output;
+    - '<path>.idx': a fixed-size entry for each record, with its offset in the data file, the
+      timestamp and duration of the command, and the size of each field.
+    A record is written to the data file before its index entry, so readers never see an entry
+    for incomplete data. The writer may be shared by many CLIs.
+
+    Usage:
+        archive = ArchiveWriter("/var/log/regression/night")
+        cli = SshLinux("10.0.0.1", "user", "password", archive=archive)
+    """
+
+    def __init__(self, path: str):
+        """ Initialize ArchiveWriter. An existing archive is appended.
+        @param path  Path of the archive, without suffix.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = open(path + DATA_SUFFIX, 'ab')
+        self._index = open(path + INDEX_SUFFIX, 'ab')
+        # Discard an index entry partially written by a crashed writer
+        self._index.truncate(self._index.tell() - self._index.tell() % INDEX_SIZE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def append(self,
+               device: str,
+               command: str,
+               output: Union[str, bytes],
+               timestamp: Optional[float]=None,
+               duration: Optional[float]=0,
+               failed: Optional[bool]=False):
+        """ Append a record to the archive.
+        @param device     The device identifier.
+        @param command    The command.
+        @param output     The command output.
+        @param timestamp  When the command started. Defaults to now.
+        @param duration   The command duration, in seconds.
+        @param failed     If True, the command failed.
+        """
+        device = _to_bytes(device)
+        command = _to_bytes(command)
+        output = _to_bytes(output)
+        if timestamp == None:
+            timestamp = time.time() - duration
+
+        with self._lock:
+            offset = self._data.seek(0, os.SEEK_END)
+            self._data.write(device + command + output)
+            self._data.flush()
+            self._index.write(struct.pack(INDEX_FORMAT, offset, timestamp, duration, len(output),
+                                          len(device), len(command),
+                                          FLAG_FAILED if failed else 0))
+            self._index.flush()
+
+
+    def close(self):
+        """ Close the archive files.
+        """
+        with self._lock:
+            self._data.close()
+            self._index.close()
+
+####################################################################################################
+## ArchiveRecord
+
+class ArchiveRecord(object):
+    """ A command read from an archive.
+    """
+
+    def __init__(self, reader: 'ArchiveReader', record_id: int):
+        self._reader = reader
+        self.id = record_id
+        self.device = reader._devices[reader._device_ids[record_id]]
+        self.command = reader._commands[reader._command_ids[record_id]]
+        self.timestamp = reader._timestamps[record_id]
+        self.duration = reader._durations[record_id]
+        self.failed = bool(reader._flags[record_id] & FLAG_FAILED)
+
+    @property
+    def raw_output(self) -> bytes:
+        """ The output, as bytes. It is read from the archive on each access.
+        """
+        return self._reader._output_bytes(self.id)
+
+    @property
+    def output(self) -> str:
+        """ The output, decoded with the reader encoding.
+        """
+        return self.raw_output.decode(self._reader.encoding, self._reader.errors)
+
+    def __repr__(self) -> str:
+        return '<ArchiveRecord {0} {1} {2!r} at {3:.3f}>'.format(
+            self.id, self.device, self.command, self.timestamp)
+
+####################################################################################################
+## ArchiveReader
+
+class ArchiveReader(object):
+    """ Reads and queries an archive written by ArchiveWriter.
+
+    The archive files are memory-mapped: only the index is loaded, into compact arrays, and
+    the outputs are read from the mapping when they are searched or accessed. Substring and
+    regex searches run over the mapping, without copying the outputs.
+
+    With a trigram index, a substring search only checks the records which contain all the
+    trigrams of the substring. Building the index reads all the outputs once, so it pays off
+    when many searches are done on the same archive.
+
+    Usage:
+        with ArchiveReader("/var/log/regression/night") as archive:
+            for record in archive.query(contains="Kernel panic", since=time.time() - 3600):
+                print(record.device, record.command)
+    """
+
+    def __init__(self,
+                 path: str,
+                 trigrams: Optional[bool]=False,
+                 encoding: Optional[str]='utf-8',
+                 errors: Optional[str]='replace'):
+        """ Initialize ArchiveReader
+        @param path      Path of the archive, without suffix.
+        @param trigrams  If True, build a trigram index of the outputs. Default is False.
+        @param encoding  Encoding to decode the outputs.
+        @param errors    Policy for undecodable bytes. Default is 'replace'.
+        """
+        self.path = path
+        self.trigrams = trigrams
+        self.encoding = encoding
+        self.errors = errors
+
+        self._data_file = open(path + DATA_SUFFIX, 'rb')
+        self._index_file = open(path + INDEX_SUFFIX, 'rb')
+        self._data = b''
+        self._index = b''
+
+        self._offsets = array('Q')
+        self._output_starts = array('Q')
+        self._output_ends = array('Q')
+        self._timestamps = array('d')
+        # Running maximum and reversed running minimum of the timestamps, both sorted, to bound
+        # the time range queries (timestamps are almost sorted, but not strictly)
+        self._timestamps_max = array('d')
+        self._timestamps_min = array('d')
+        self._durations = array('d')
+        self._flags = array('B')
+        self._device_ids = array('I')
+        self._command_ids = array('I')
+        self._devices = []
+        self._commands = []
+        self._device_index = {}
+        self._command_index = {}
+        self._by_device = {}
+        self._trigram_index = {}
+
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, record_id: int) -> ArchiveRecord:
+        if not 0 <= record_id < len(self):
+            raise IndexError("Record {0} not in archive".format(record_id))
+        return ArchiveRecord(self, record_id)
+
+
+    def refresh(self) -> int:
+        """ Map the records appended since the archive was opened (or last refreshed).
+        @return  The number of new records.
+        """
+        index_size = os.fstat(self._index_file.fileno()).st_size
+        count = index_size // INDEX_SIZE
+        first = len(self)
+        if count == first:
+            return 0
+
+        self._remap()
+        for record_id in range(first, count):
+            (offset, timestamp, duration, output_size, device_size, command_size,
+             flags) = struct.unpack_from(INDEX_FORMAT, self._index, record_id * INDEX_SIZE)
+            command_start = offset + device_size
+            output_start = command_start + command_size
+            device = self._data[offset:command_start].decode('utf-8', 'surrogateescape')
+            command = self._data[command_start:output_start].decode('utf-8', 'surrogateescape')
+
+            self._offsets.append(offset)
+            self._output_starts.append(output_start)
+            self._output_ends.append(output_start + output_size)
+            self._timestamps.append(timestamp)
+            self._timestamps_max.append(max(timestamp, self._timestamps_max[-1])
+                                        if record_id else timestamp)
+            self._timestamps_min.append(timestamp)
+            previous = record_id - 1
+            while previous >= 0 and self._timestamps_min[previous] > timestamp:
+                self._timestamps_min[previous] = timestamp
+                previous -= 1
+            self._durations.append(duration)
+            self._flags.append(flags)
+            self._device_ids.append(self._intern(device, self._devices, self._device_index))
+            self._command_ids.append(self._intern(command, self._commands, self._command_index))
+            self._by_device.setdefault(device, array('I')).append(record_id)
+            if self.trigrams:
+                self._index_trigrams(record_id)
+        return count - first
+
+
+    def devices(self) -> List[str]:
+        """ Returns the devices found in the archive.
+        """
+        return sorted(self._devices)
+
+
+    def query(self,
+              device: Optional[str]=None,
+              command: Optional[str]=None,
+              since: Optional[float]=None,
+              until: Optional[float]=None,
+              contains: Optional[Union[str, bytes]]=None,
+              regex: Optional[Union[str, bytes]]=None,
+              failed: Optional[bool]=None,
+              limit: Optional[int]=None) -> List[ArchiveRecord]:
+        """ Finds the records matching all the given criteria, in archive order.
+        @param device    Only the records of this device.
+        @param command   Only the records of this command.
+        @param since     Only the commands started at this timestamp or later.
+        @param until     Only the commands started before this timestamp.
+        @param contains  Only the records whose output contains this substring.
+        @param regex     Only the records whose output matches this regex.
+        @param failed    If set, only the records of failed (True) or succeeded (False) commands.
+        @param limit     Maximum number of records returned.
+        @return          The list of matching records.
+        """
+        if device != None and device not in self._device_index:
+            return []
+        if command != None and command not in self._command_index:
+            return []
+        if contains != None:
+            contains = _to_bytes(contains)
+        if regex != None:
+            regex = re.compile(_to_bytes(regex))
+
+        filters = []
+        if command != None:
+            command_id = self._command_index[command]
+            filters.append(lambda record_id: self._command_ids[record_id] == command_id)
+        if since != None:
+            filters.append(lambda record_id: self._timestamps[record_id] >= since)
+        if until != None:
+            filters.append(lambda record_id: self._timestamps[record_id] < until)
+        if failed != None:
+            filters.append(lambda record_id: bool(self._flags[record_id] & FLAG_FAILED) == failed)
+
+        # Only the records in [first, last) may be in the time range
+        first = bisect_left(self._timestamps_max, since) if since != None else 0
+        last = bisect_left(self._timestamps_min, until) if until != None else len(self)
+
+        if device != None:
+            record_ids = self._by_device[device]
+            candidates = record_ids[bisect_left(record_ids, first):
+                                     bisect_left(record_ids, last)]
+        elif contains != None and self.trigrams and len(contains) >= 3:
+            candidates = [record_id for record_id in self._trigram_candidates(contains)
+                          if first <= record_id < last]
+        elif contains != None and first < last:
+            # Single pass over the mapping
+            candidates = self._scan(contains, first, last)
+            contains = None
+        elif regex != None and first < last:
+            candidates = self._scan(regex, first, last)
+            regex = None
+        else:
+            candidates = range(first, last)
+
+        records = []
+        for record_id in candidates:
+            if limit != None and len(records) >= limit:
+                break
+            if not all([check(record_id) for check in filters]):
+                continue
+            (start, end) = (self._output_starts[record_id], self._output_ends[record_id])
+            if contains != None and self._search(contains, start, end) < 0:
+                continue
+            if regex != None and self._search(regex, start, end) < 0:
+                continue
+            records.append(ArchiveRecord(self, record_id))
+        return records
+
+
+    def close(self):
+        """ Close the archive files.
+        """
+        for mapping in (self._data, self._index):
+            if isinstance(mapping, mmap.mmap):
+                mapping.close()
+        self._data_file.close()
+        self._index_file.close()
+
+
+    ################################################################################################
+    ## Internals
+
+    def _remap(self):
+        """ Maps the archive files again, as they grew.
+        """
+        for (attribute, archive_file) in (('_data', self._data_file),
+                                          ('_index', self._index_file)):
+            old_mapping = getattr(self, attribute)
+            if os.fstat(archive_file.fileno()).st_size > 0:
+                setattr(self, attribute, mmap.mmap(archive_file.fileno(), 0,
+                                                   access=mmap.ACCESS_READ))
+            if isinstance(old_mapping, mmap.mmap):
+                old_mapping.close()
+
+
+    def _output_bytes(self, record_id: int) -> bytes:
+        return self._data[self._output_starts[record_id]:self._output_ends[record_id]]
+
+
+    def _search(self, pattern, start: int, end: int) -> int:
+        """ Searches a substring (bytes) or a compiled regex in the data mapping.
+        @return  The position of the first match between start and end, or -1.
+        """
+        if isinstance(pattern, bytes):
+            return self._data.find(pattern, start, end)
+        match = pattern.search(self._data, start, end)
+        return match.start() if match else -1
+
+
+    def _scan(self, pattern, first: int, last: int):
+        """ Finds the records in [first, last) whose output matches pattern, searching the data
+        of all these records at once.
+        """
+        (position, end) = (self._output_starts[first], self._output_ends[last - 1])
+        while position < end:
+            position = self._search(pattern, position, end)
+            if position < 0:
+                return
+            # The match may be in the device, the command or across records: check the record
+            record_id = bisect_right(self._offsets, position) - 1
+            (start, record_end) = (self._output_starts[record_id], self._output_ends[record_id])
+            if self._search(pattern, start, record_end) >= 0:
+                yield record_id
+            position = record_end
+
+
+    def _index_trigrams(self, record_id: int):
+        output = self._output_bytes(record_id)
+        for trigram in set([output[i:i + 3] for i in range(len(output) - 2)]):
+            self._trigram_index.setdefault(trigram, array('I')).append(record_id)
+
+
+    def _trigram_candidates(self, needle: bytes) -> List[int]:
+        """ Returns the records containing all the trigrams of needle.
+        """
+        postings = []
+        for trigram in set([needle[i:i + 3] for i in range(len(needle) - 2)]):
+            if trigram not in self._trigram_index:
+                return []
+            postings.append(self._trigram_index[trigram])
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+        return sorted(candidates)
+
+
+    @staticmethod
+    def _intern(name: str, names: List[str], index: Dict[str, int]) -> int:
+        if name not in index:
+            index[name] = len(names)
+            names.append(name)
+        return index[name]
@@ -0,0 +1,265 @@
+import difflib
+import hashlib
+import re
+import threading
+
+from typing import Callable, Dict, List, Optional, Union
+
+####################################################################################################
+## Masks
+
+class Mask(object):
+    """ Replaces a volatile field of the outputs by a placeholder, so outputs only differing by
+    this field are considered equal.
+
+    Any callable taking and returning a string may be used as a mask too.
+    """
+
+    def __init__(self, pattern: str, replacement: str, flags: Optional[int]=0):
+        """ Initialize Mask
+        @param pattern      Regex of the volatile field.
+        @param replacement  The placeholder, as in re.sub: it may reference the regex groups.
+        @param flags        The regex flags.
+        """
+        self.regex = re.compile(pattern, flags)
+        self.replacement = replacement
+
+    def __call__(self, text: str) -> str:
+        return self.regex.sub(self.replacement, text)
+
+    def __repr__(self) -> str:
+        return "Mask({0!r}, {1!r})".format(self.regex.pattern, self.replacement)
+
+
+_MONTHS = r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)'
+_COUNTERS = r'(?:packets|bytes|octets|frames|errors|drops|dropped|overruns|collisions|carrier)'
+
+# Dates with time. Ex: '2024-03-01 10:22:03.120', 'Mar  1 10:22:03 2024'
+TIMESTAMP_MASK = Mask(r'\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?'
+                      r'(?:Z|[+-]\d{2}:?\d{2})?'
+                      r'|\b' + _MONTHS + r'\s+\d{1,2}\s+\d{2}:\d{2}:\d{2}(?:\s+\d{4})?',
+                      '<TIMESTAMP>')
+
+# Times of day. Ex: '10:22:03', '10:22:03.120'
+TIME_MASK = Mask(r'\b\d{1,2}:\d{2}:\d{2}(?:\.\d+)?\b', '<TIME>')
+
+# Uptimes. Ex: 'up 3 days,  4:05', 'uptime is 2 weeks, 3 days, 5 hours, 12 minutes'
+_UPTIME_ITEM = r'\d+(?:\s+(?:years?|weeks?|days?|hours?|minutes?|mins?|seconds?|secs?)\b|:\d{2})'
+UPTIME_MASK = Mask(r'\b(uptime is|up)\s+' + _UPTIME_ITEM + r'(?:(?:,\s*|\s+)' + _UPTIME_ITEM +
+                   r')*', r'\1 <UPTIME>', re.IGNORECASE)
+
+# Traffic counters. Ex: '1024 packets input', 'RX packets:1024 errors:0'
+COUNTER_MASK = Mask(r'\b\d+(?=\s+' + _COUNTERS + r'\b)', '<N>')
+COUNTER_FIELD_MASK = Mask(r'\b(' + _COUNTERS + r')(:\s*|=\s*|\s+)\d+\b', r'\1\2<N>')
+
+DEFAULT_MASKS = (TIMESTAMP_MASK, TIME_MASK, UPTIME_MASK, COUNTER_MASK, COUNTER_FIELD_MASK)
+
+####################################################################################################
+## Comparator
+
+class Cluster(object):
+    """ A group of devices with the same normalized output for a command.
+    """
+
+    def __init__(self, digest: str, lines: List[str], devices: List[str]):
+        """ Initialize Cluster
+        @param digest   Digest of the normalized output.
+        @param lines    Lines of the normalized output.
+        @param devices  The devices of the cluster, the representative first.
+        """
+        self.digest = digest
+        self.lines = lines
+        self.devices = devices
+        # Diff from the majority normalized output, None for the majority cluster itself
+        self.diff = None
+
+    @property
+    def representative(self) -> str:
+        return self.devices[0]
+
+    def __len__(self) -> int:
+        return len(self.devices)
+
+
+class CommandComparison(object):
+    """ The devices of a command clustered by normalized output, with the diff of each
+    minority cluster from the majority one.
+    """
+
+    def __init__(self, command: str, clusters: List[Cluster], context: int):
+        """ Initialize CommandComparison
+        @param command   The command.
+        @param clusters  The clusters, the largest first.
+        @param context   Number of context lines of the diffs.
+        """
+        self.command = command
+        self.clusters = clusters
+        self.majority = clusters[0] if clusters else None
+        self._clusters_by_device = {}
+        for cluster in clusters:
+            for device in cluster.devices:
+                self._clusters_by_device[device] = cluster
+            if cluster is not self.majority:
+                # Only one diff per cluster, between the representatives
+                cluster.diff = list(difflib.unified_diff(
+                    self.majority.lines, cluster.lines, fromfile=self.majority.representative,
+                    tofile=cluster.representative, n=context, lineterm=''))
+
+    def outliers(self) -> List[str]:
+        """ Returns the devices whose output differs from the majority.
+        """
+        return [device for cluster in self.clusters[1:] for device in cluster.devices]
+
+    def cluster_of(self, device: str) -> Cluster:
+        """ Returns the cluster of a device.
+        """
+        return self._clusters_by_device[device]
+
+    def diff(self, device: str) -> List[str]:
+        """ Returns the diff lines of the output of a device from the majority one, empty if
+        it is in the majority.
+        """
+        return self.cluster_of(device).diff or []
+
+    def __str__(self) -> str:
+        if not self.clusters:
+            return "{0}: no outputs".format(self.command)
+        report = ["{0}: {1} devices, {2} distinct outputs, majority {3} ({4} devices)".format(
+            self.command, len(self._clusters_by_device), len(self.clusters),
+            self.majority.representative, len(self.majority))]
+        for cluster in self.clusters[1:]:
+            report.append("  {0} device(s): {1}".format(len(cluster), ', '.join(cluster.devices)))
+            report += ["    " + line for line in cluster.diff]
+        return '\n'.join(report)
+
+
+class Comparator(object):
+    """ Finds the devices of a fleet whose outputs differ from the majority, for each command.
+
+    The outputs are normalized by masks replacing their volatile fields (timestamps, counters,
+    uptimes...) and the devices are clustered by digest of their normalized output. Then only
+    one line diff per cluster is computed, against the largest cluster: the cost is linear
+    on the number of outputs, instead of pairwise diffs. Identical raw outputs are only
+    normalized once.
+
+    Usage:
+        comparator = Comparator()
+        for (device, cli) in clis.items():
+            comparator.add(device, "show version", cli.run("show version"))
+        print(comparator.compare("show version"))
+    """
+
+    def __init__(self,
+                 masks: Optional[List[Callable[[str], str]]]=DEFAULT_MASKS,
+                 context: Optional[int]=0,
+                 encoding: Optional[str]='utf-8',
+                 errors: Optional[str]='replace'):
+        """ Initialize Comparator
+        @param masks     Functions normalizing the outputs, applied in order, such as Mask
+                         objects. Default are the timestamps, times, uptimes and traffic
+                         counters masks.
+        @param context   Number of context lines in the diffs. Default is 0.
+        @param encoding  Encoding to decode the bytes outputs. Default is 'utf-8'.
+        @param errors    Policy for undecodable bytes. Default is 'replace'.
+        """
+        self.masks = list(masks or [])
+        self.context = context
+        self.encoding = encoding
+        self.errors = errors
+
+        self._lock = threading.Lock()
+        # Digest of each raw output -> digest of its normalized output
+        self._normalized = {}
+        # Digest of each normalized output -> its lines
+        self._lines = {}
+        # Command -> device -> digest of its normalized output
+        self._outputs = {}
+
+
+    def add(self, device: str, command: str, output) -> str:
+        """ Adds the output of a command run on a device. A device has a single output per
+        command: the last one added.
+        @param device   The device identifier.
+        @param command  The command.
+        @param output   The output, as a string, bytes or RunResults.
+        @return         The digest of the normalized output.
+        """
+        if hasattr(output, 'raw_output'):
+            output = output.raw_output
+        data = output if isinstance(output, bytes) else output.encode('utf-8', 'surrogatepass')
+        return self._add(device, command, hashlib.sha256(data).hexdigest(), lambda: output)
+
+
+    def add_store(self, store, commands: Optional[List[str]]=None) -> int:
+        """ Adds the outputs of an OutputStore. Its digests are reused, so each distinct output
+        is read and normalized once.
+        @param store     The OutputStore.
+        @param commands  The commands to add. Default is all the commands of the store.
+        @return          The number of outputs added.
+        """
+        if commands == None:
+            commands = store.commands()
+        added = 0
+        for command in commands:
+            for (key, devices) in store.group_by_output(command).items():
+                for device in devices:
+                    self._add(device, command, key, lambda: store.get_bytes(key))
+                added += len(devices)
+        return added
+
+
+    def commands(self) -> List[str]:
+        """ Returns the commands with outputs, in the order they were first added.
+        """
+        with self._lock:
+            return list(self._outputs)
+
+
+    def compare(self, command: str) -> CommandComparison:
+        """ Clusters the devices by normalized output of a command, and diffs each cluster from
+        the largest one.
+        @param command  The command.
+        """
+        clusters = {}
+        with self._lock:
+            for (device, key) in self._outputs.get(command, {}).items():
+                clusters.setdefault(key, []).append(device)
+            clusters = [Cluster(key, self._lines[key], sorted(devices))
+                        for (key, devices) in clusters.items()]
+        # Largest first, then by representative so the result does not depend on the order
+        clusters.sort(key=lambda cluster: (-len(cluster), cluster.representative))
+        return CommandComparison(command, clusters, self.context)
+
+
+    def compare_all(self) -> Dict[str, CommandComparison]:
+        """ Compares the outputs of all the commands.
+        @return  A dictionary of the comparison of each command.
+        """
+        return dict([(command, self.compare(command)) for command in self.commands()])
+
+
+    def normalize(self, output: Union[str, bytes]) -> str:
+        """ Returns an output with its volatile fields masked, its trailing spaces and carriage
+        returns removed.
+        """
+        if isinstance(output, bytes):
+            output = output.decode(self.encoding, self.errors)
+        output = '\n'.join([line.rstrip() for line in output.splitlines()])
+        for mask in self.masks:
+            output = mask(output)
+        return output
+
+
+    def _add(self, device: str, command: str, raw_key: str, load: Callable) -> str:
+        with self._lock:
+            key = self._normalized.get(raw_key)
+        if key == None:
+            normalized = self.normalize(load())
+            key = hashlib.sha256(normalized.encode('utf-8', 'surrogatepass')).hexdigest()
+            with self._lock:
+                self._normalized[raw_key] = key
+                if key not in self._lines:
+                    self._lines[key] = normalized.splitlines()
+        with self._lock:
+            self._outputs.setdefault(command, {})[device] = key
+        return key
@@ -0,0 +1,110 @@
+import threading
+import zlib
+
+from collections import OrderedDict
+from itertools import count
+from typing import Callable, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Default minimum size, in bytes, of the outputs which are compressed
+COMPRESS_THRESHOLD = 4096
+
+# Default number of decompressed outputs kept in the cache
+DECOMPRESSED_CACHE_SIZE = 16
+
+# zlib level: the CLI outputs are repetitive, higher levels barely compress them more
+ZLIB_LEVEL = 6
+
+
+def default_codec() -> str:
+    """ Returns the best available codec: 'zstd' when the zstandard package is installed,
+    otherwise 'zlib'.
+    """
+    return 'zstd' if zstandard != None else 'zlib'
+
+
+def compress(data: bytes, codec: Optional[str]=None) -> Tuple[str, bytes]:
+    """ Compresses data.
+    @param data   The data.
+    @param codec  'zlib' or 'zstd'. Defaults to the best available codec.
+    @return       A tuple with the codec used and the compressed data.
+    """
+    if codec == None:
+        codec = default_codec()
+    if codec == 'zstd':
+        if zstandard == None:
+            raise ValueError("The zstd codec requires the 'zstandard' package")
+        return (codec, zstandard.ZstdCompressor().compress(data))
+    if codec == 'zlib':
+        return (codec, zlib.compress(data, ZLIB_LEVEL))
+    raise ValueError("Unknown compression codec '{0}'".format(codec))
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    """ Decompresses data compressed by compress.
+    @param codec  The codec used.
+    @param data   The compressed data.
+    """
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+####################################################################################################
+## DecompressedCache
+
+class DecompressedCache(object):
+    """ Least recently used cache of decompressed data, so repeated accesses to the same
+    outputs do not decompress them each time, while the memory used stays bounded.
+    """
+
+    def __init__(self, size: Optional[int]=DECOMPRESSED_CACHE_SIZE):
+        """ Initialize DecompressedCache
+        @param size  Maximum number of entries. Default is 16.
+        """
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._keys = count()
+        self._lock = threading.Lock()
+
+    def new_key(self) -> int:
+        """ Returns an unique key for a new compressed data.
+        """
+        return next(self._keys)
+
+    def get(self, key: int, load: Callable):
+        """ Returns the entry of a key, loading it on a miss.
+        @param key   The entry key.
+        @param load  Callable returning the entry value.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        value = load()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return value
+
+    def discard(self, key: int):
+        """ Removes the entry of a key, if cached.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Cache shared by all the compressed outputs
+decompressed_cache = DecompressedCache()
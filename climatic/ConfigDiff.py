@@ -0,0 +1,202 @@
+import re
+
+from typing import List, Optional
+
+# Prefix of the commands that remove a configuration line
+NEGATE_PREFIX = 'no '
+
+# Command leaving a configuration block
+EXIT_COMMAND = 'exit'
+
+# Prefixes of the comment lines, which are ignored
+COMMENT_PREFIXES = ('!',)
+
+####################################################################################################
+## ConfigNode
+
+class ConfigNode(object):
+    """ A configuration line, with the indented lines of its block.
+    """
+
+    def __init__(self, line: str, indent: int):
+        self.line = line
+        self.indent = indent
+        self.children = []
+
+    def size(self) -> int:
+        """ Returns the number of lines of the block, including this one.
+        """
+        return 1 + sum([child.size() for child in self.children])
+
+
+def parse_config(config: str,
+                 comments: Optional[tuple]=COMMENT_PREFIXES,
+                 ignore: Optional[List[str]]=None) -> List[ConfigNode]:
+    """ Parses an indented configuration into a tree of blocks.
+
+    A line belongs to the block of the closest previous line with a smaller indentation.
+    Blank lines, comments and the lines matching the ignore regexes are skipped.
+
+    @param config    The configuration text.
+    @param comments  Prefixes of the comment lines.
+    @param ignore    List of regexes of lines to skip, such as volatile headers.
+    @return          The top-level blocks.
+    """
+    ignore = [re.compile(pattern) for pattern in (ignore or [])]
+    root = ConfigNode(None, -1)
+    stack = [root]
+    for raw_line in config.splitlines():
+        line = raw_line.strip()
+        if not line or line.startswith(comments) or any([p.search(line) for p in ignore]):
+            continue
+        indent = len(raw_line) - len(raw_line.lstrip())
+        while stack[-1].indent >= indent:
+            stack.pop()
+        node = ConfigNode(line, indent)
+        stack[-1].children.append(node)
+        stack.append(node)
+    return root.children
+
+####################################################################################################
+## ConfigDiff
+
+class ConfigDiff(object):
+    """ The commands changing a configuration into another, block by block.
+
+    The lines are compared within their block, regardless of their order: a changed line is
+    removed with its negation ('no <line>') and the new line is added. Only the blocks with
+    changes are entered, and they are left with the exit command. Removing a block only sends
+    the negation of its first line.
+
+    Usage:
+        diff = ConfigDiff(current_config, desired_config)
+        print(diff)
+    """
+
+    def __init__(self,
+                 current: str,
+                 desired: str,
+                 negate: Optional[str]=NEGATE_PREFIX,
+                 exit_cmd: Optional[str]=EXIT_COMMAND,
+                 comments: Optional[tuple]=COMMENT_PREFIXES,
+                 ignore: Optional[List[str]]=None):
+        """ Initialize ConfigDiff
+        @param current   The current configuration.
+        @param desired   The desired configuration.
+        @param negate    Prefix of the commands removing a line. Default is 'no '.
+        @param exit_cmd  Command leaving a block. Set to None if the CLI does not need it.
+        @param comments  Prefixes of the comment lines, which are ignored.
+        @param ignore    List of regexes of lines to ignore in both configurations.
+        """
+        self.negate = negate
+        self.exit_cmd = exit_cmd
+        self.added = 0
+        self.removed = 0
+
+        desired_nodes = parse_config(desired, comments, ignore)
+        # Number of lines sent by a full push of the desired configuration
+        self.full_size = sum([node.size() for node in desired_nodes])
+        self.commands = self._diff(parse_config(current, comments, ignore), desired_nodes, 0)
+
+    def __bool__(self) -> bool:
+        return bool(self.commands)
+
+    def __len__(self) -> int:
+        return len(self.commands)
+
+    def __str__(self) -> str:
+        return '\n'.join(self.commands)
+
+
+    def _diff(self, current: List[ConfigNode], desired: List[ConfigNode],
+              depth: int) -> List[str]:
+        """ Returns the commands changing the current blocks into the desired ones.
+        """
+        current_lines = dict([(node.line, node) for node in current])
+        desired_lines = dict([(node.line, node) for node in desired])
+        commands = []
+        negations = set()
+
+        # Removals first, so the replaced lines do not conflict with the new ones
+        for (line, node) in current_lines.items():
+            if line not in desired_lines:
+                negations.add(self._negation(line))
+                commands.append(self._indent(self._negation(line), depth))
+                self.removed += 1
+
+        for (line, node) in desired_lines.items():
+            if line in negations and not node.children:
+                # Already sent as the removal of its negation. Ex: 'no shutdown' -> 'shutdown'
+                continue
+            if line not in current_lines:
+                commands += self._block(node, depth)
+            elif node.children or current_lines[line].children:
+                changes = self._diff(current_lines[line].children, node.children, depth + 1)
+                if changes:
+                    commands += [self._indent(line, depth)] + changes + self._exit(depth)
+        return commands
+
+
+    def _block(self, node: ConfigNode, depth: int) -> List[str]:
+        """ Returns the commands adding a whole block.
+        """
+        self.added += 1
+        commands = [self._indent(node.line, depth)]
+        if node.children:
+            for child in node.children:
+                commands += self._block(child, depth + 1)
+            commands += self._exit(depth)
+        return commands
+
+
+    def _negation(self, line: str) -> str:
+        if line.startswith(self.negate):
+            return line[len(self.negate):]
+        return self.negate + line
+
+
+    def _exit(self, depth: int) -> List[str]:
+        return [self._indent(self.exit_cmd, depth + 1)] if self.exit_cmd != None else []
+
+
+    @staticmethod
+    def _indent(line: str, depth: int) -> str:
+        return ' ' * depth + line
+
+####################################################################################################
+## PushResults
+
+class PushResults(object):
+    """ Represents the results of a configuration push with the push_config method
+    """
+
+    def __init__(self,
+                 diff: ConfigDiff,
+                 duration: float,
+                 verified: bool,
+                 round_trips: int,
+                 round_trips_full: int):
+        """ Initialize PushResults
+        @param diff              The ConfigDiff which was sent.
+        @param duration          The time spent pushing the configuration, including the reads.
+        @param verified          True if the configuration was read back and matched the desired
+                                 one.
+        @param round_trips       Number of commands run (each one waiting for the prompt),
+                                 including the configuration reads.
+        @param round_trips_full  Number of commands a full push of the desired configuration
+                                 would have run.
+        """
+        self.diff = diff
+        self.duration = duration
+        self.verified = verified
+        self.lines_sent = len(diff)
+        self.lines_full = diff.full_size
+        self.lines_saved = self.lines_full - self.lines_sent
+        self.round_trips = round_trips
+        self.round_trips_full = round_trips_full
+        self.round_trips_saved = round_trips_full - round_trips
+
+    def __str__(self) -> str:
+        return ("Sent {0} of {1} lines ({2} saved) in {3} round trips ({4} saved), "
+                "{5:.2f}s".format(self.lines_sent, self.lines_full, self.lines_saved,
+                                  self.round_trips, self.round_trips_saved, self.duration))
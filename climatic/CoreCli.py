@@ -3,30 +3,260 @@ import re
 import sys
 import time
 
-from expects import expect, match
-from io import StringIO
+from io import BytesIO, StringIO
 from string import printable
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional, Union
 
 from . import Logger
 
 # Object to skip error marker cheks in commands
 NO_ERROR_MARKER = object()
 
+
+class SessionError(AssertionError):
+    """ Raised when the session stops responding while running a command: the command timed
+    out or the connection was closed. The session may be opened again with 'reconnect'.
+    """
+
 ####################################################################################################
 ## RunResults
 
 class RunResults(object):
     """ Represents the results of the execution of a CLI command with the run method
+
+    The output may be stored compressed, to bound the memory used by long runs keeping all the
+    results: it is then decompressed on each access, through a small cache of the outputs
+    recently accessed.
     """
 
-    def __init__(self, duration: time, output: str):
+    def __init__(self,
+                 duration: time,
+                 output: Union[str, bytes],
+                 encoding: Optional[str]='utf-8',
+                 errors: Optional[str]='replace',
+                 exit_codes: Optional[List[int]]=None,
+                 compress_threshold: Optional[int]=None):
         """ Initialize RunResults
-        @duration  The time spent between the execution of the commands;
-        @output    A string with the output of the commands.
+        @duration            The time spent between the execution of the commands;
+        @output              A string with the output of the commands. When the CLI runs in bytes
+                             mode, the raw bytes are kept and only decoded when 'output' is
+                             accessed.
+        @encoding            Encoding used to decode a bytes output. Default is 'utf-8'.
+        @errors              Policy for undecodable bytes, as in bytes.decode. Default is 'replace'.
+        @exit_codes          The exit status of each command, when the CLI is able to report them.
+        @compress_threshold  If set, the output is stored compressed when its size in bytes
+                             reaches this threshold. See compress.
         """
         self.duration = duration
+        self.exit_codes = exit_codes
+        # Content address of the output, when stored in an OutputStore
+        self.digest = None
+        self.encoding = encoding
+        self.errors = errors
+        self._compressed = None
         self.output = output
+        if compress_threshold != None:
+            self.compress(compress_threshold)
+
+    @property
+    def output(self) -> str:
+        """ The output of the commands. A bytes output is decoded on the first access.
+        """
+        if self._compressed != None:
+            output = self.raw_output
+            return output.decode(self.encoding, self.errors) if isinstance(output, bytes) \
+                else output
+        if self._output is None:
+            self._output = self._raw_output.decode(self.encoding, self.errors)
+        return self._output
+
+    @output.setter
+    def output(self, output: Union[str, bytes]):
+        if self._compressed != None:
+            from .Compression import decompressed_cache
+            decompressed_cache.discard(self._cache_key)
+            self._compressed = None
+        self._raw_output = output
+        self._output = None if isinstance(output, bytes) else output
+
+    @property
+    def raw_output(self) -> Union[str, bytes]:
+        """ The output of the commands, not decoded in bytes mode.
+        """
+        if self._compressed != None:
+            from .Compression import decompressed_cache
+            return decompressed_cache.get(self._cache_key, self._decompress)
+        return self._raw_output
+
+    @property
+    def compressed(self) -> bool:
+        """ True if the output is stored compressed.
+        """
+        return self._compressed != None
+
+    @property
+    def size(self) -> int:
+        """ Size of the output, in bytes.
+        """
+        if self._compressed != None:
+            return self._size
+        return len(self._encode(self._raw_output))
+
+    @property
+    def stored_size(self) -> int:
+        """ Size of the output as stored, in bytes.
+        """
+        if self._compressed != None:
+            return len(self._compressed[1])
+        return self.size
+
+    @property
+    def compression_ratio(self) -> float:
+        """ Size of the output divided by its stored size. 1.0 when it is not compressed.
+        """
+        stored_size = self.stored_size
+        return self.size / float(stored_size) if stored_size else 1.0
+
+    def compress(self, threshold: Optional[int]=None, codec: Optional[str]=None) -> bool:
+        """ Stores the output compressed, if its size reaches the threshold.
+
+        The output is compressed with zstd when the zstandard package is installed, otherwise
+        with zlib.
+
+        @param threshold  Minimum size of the output, in bytes. Default is 4096.
+        @param codec      'zlib' or 'zstd'. Defaults to the best available codec.
+        @return           True if the output is stored compressed.
+        """
+        if self._compressed != None:
+            return True
+        # Only imported when needed: most runs keep their outputs uncompressed
+        from .Compression import COMPRESS_THRESHOLD, compress, decompressed_cache
+
+        if threshold == None:
+            threshold = COMPRESS_THRESHOLD
+        data = self._encode(self._raw_output)
+        if len(data) < threshold:
+            return False
+        self._compressed = compress(data, codec) + (isinstance(self._raw_output, str),)
+        self._size = len(data)
+        self._cache_key = decompressed_cache.new_key()
+        self._raw_output = None
+        self._output = None
+        return True
+
+    def _decompress(self) -> Union[str, bytes]:
+        from .Compression import decompress
+
+        (codec, data, text) = self._compressed
+        output = decompress(codec, data)
+        return output.decode('utf-8', 'surrogatepass') if text else output
+
+    @staticmethod
+    def _encode(output: Union[str, bytes]) -> bytes:
+        # Lossless for any string, so the decompressed output is always the original one
+        return output.encode('utf-8', 'surrogatepass') if isinstance(output, str) else output
+
+
+class _LazyLog(object):
+    """ Defers the decoding of a bytes log until the logger really formats the message.
+    """
+
+    def __init__(self, log: bytes, encoding: str, errors: str):
+        self.log = log
+        self.encoding = encoding
+        self.errors = errors
+
+    def __str__(self) -> str:
+        return self.log.decode(self.encoding, self.errors)
+
+####################################################################################################
+## MonitoredLog
+
+class MonitoredLog(object):
+    """ A terminal logfile which also feeds a monitor (such as a StreamChecker, or the
+    LoginTimeline) with the data.
+    Exceptions raised by the monitor interrupt the current 'expect'.
+    """
+
+    def __init__(self, logfile, monitor):
+        """ Initialize MonitoredLog
+        @param logfile  The logfile keeping the data.
+        @param monitor  Object with a 'feed' method, called with each chunk of data.
+        """
+        self.logfile = logfile
+        self.monitor = monitor
+
+    def write(self, data):
+        self.logfile.write(data)
+        self.monitor.feed(data)
+
+    def flush(self):
+        self.logfile.flush()
+
+    def getvalue(self):
+        return self.logfile.getvalue()
+
+    def close(self):
+        self.logfile.close()
+
+####################################################################################################
+## LoginTimeline
+
+class LoginTimeline(object):
+    """ Records when each phase of the opening of a CLI session ends:
+    - spawn: the connection is open (the client process is spawned);
+    - banner: the first output is received (host key question, password prompt, banner...);
+    - auth: the credentials are sent, when the CLI asks for them;
+    - prompt: the login is complete.
+    """
+
+    def __init__(self):
+        self.start_time = time.time()
+        # Time of the end of each phase since the start
+        self.marks = {}
+
+    def mark(self, phase: str):
+        """ Records the end of a phase. Only the first mark of a phase is kept.
+        """
+        if phase not in self.marks:
+            self.marks[phase] = time.time() - self.start_time
+
+    def write(self, data: Union[str, bytes]):
+        """ Receives the output of the session, as a terminal 'logfile_read', to detect the
+        banner.
+        """
+        if data:
+            self.mark('banner')
+
+    def feed(self, data: Union[str, bytes]):
+        """ Receives the output of the commands run during the login, as the monitor of their
+        logfile.
+        """
+        self.write(data)
+
+    def flush(self):
+        pass
+
+    def phases(self) -> Dict[str, float]:
+        """ Returns the duration of each phase, in the order they ended.
+        """
+        durations = {}
+        previous = 0
+        for (phase, elapsed) in sorted(self.marks.items(), key=lambda mark: mark[1]):
+            durations[phase] = elapsed - previous
+            previous = elapsed
+        return durations
+
+    @property
+    def total(self) -> float:
+        """ The time from the start to the last mark.
+        """
+        return max(self.marks.values()) if self.marks else 0
+
+    def __str__(self) -> str:
+        return "{0} (total {1:.3f}s)".format(", ".join(
+            ["{0} {1:.3f}s".format(phase, duration)
+             for (phase, duration) in self.phases().items()]), self.total)
 
 ####################################################################################################
 ## CoreCli
@@ -58,7 +288,11 @@ class CoreCli(object):
                  wait_cmd: Optional[bool]=True,
                  wait_cmd_timeout: Optional[int]=2,
                  strip_cmds: Optional[bool]=True,
-                 pty_winsize_cols: Optional[int]=80):
+                 pty_winsize_cols: Optional[int]=80,
+                 device: Optional[str]=None,
+                 output_store=None,
+                 archive=None,
+                 compress_threshold: Optional[int]=None):
         """ Initialize BaseCLI.
         @param connection        The connection object to be used for accessing the CLI.
         @param username          String with username to login into the connection that provides
@@ -80,6 +314,15 @@ class CoreCli(object):
                                  Set to None to use the global timeout defined on constructor.
         @param strip_cmds        Remove trailing spaces and empty lines. Default is True.
         @param pty_winsize_cols  The number of columns of the window.
+        @param device            Identifier of the device, used to reference its outputs.
+                                 Defaults to 'ip:port' of the connection, or the CLI name.
+        @param output_store      Optional OutputStore where the outputs of the commands run are
+                                 stored, referenced by device and command.
+        @param archive           Optional ArchiveWriter where each run is recorded, with its device,
+                                 commands, timestamp, duration and output, including the runs
+                                 which failed.
+        @param compress_threshold  If set, the outputs of at least this size in bytes are kept
+                                   compressed in the results. See RunResults.compress.
         """
         if not hasattr(self, 'name'):
             self.name = self.__class__.__name__
@@ -103,6 +346,16 @@ class CoreCli(object):
             self.wait_cmd_timeout = wait_cmd_timeout
         if not hasattr(self, 'strip_cmds'):
             self.strip_cmds = strip_cmds
+        if not hasattr(self, 'device'):
+            if device == None and hasattr(connection, 'ip'):
+                device = '{0}:{1}'.format(connection.ip, getattr(connection, 'port', ''))
+            self.device = device if device != None else self.name
+        if not hasattr(self, 'output_store'):
+            self.output_store = output_store
+        if not hasattr(self, 'archive'):
+            self.archive = archive
+        if not hasattr(self, 'compress_threshold'):
+            self.compress_threshold = compress_threshold
 
         self.logger = Logger.start(self.name)
         self.connection = connection
@@ -110,19 +363,31 @@ class CoreCli(object):
         # Number of columns of the window
         self.pty_winsize_cols = pty_winsize_cols
 
-        # Connect to the CLI
-        startup_log = StringIO()
+        self._open_session()
+
+
+    def _open_session(self):
+        """ Connects to the CLI and logs in.
+        """
+        self.login_timeline = LoginTimeline()
+        startup_log = self._new_logfile()
         self.connection.connect(startup_log, logger=self.logger)  # [Connection]
+        self.login_timeline.mark('spawn')
+        self.connection.terminal.logfile_read = self.login_timeline
         try:
             self.login()  # [CLI]
+            self.login_timeline.mark('prompt')
+            self.logger.debug("Login timeline: %s", self.login_timeline)
         except:
             self.connection.terminal.close()
-            self.logger.error("Error while trying to login. Output -->\n" + startup_log.getvalue() +
+            self.logger.error("Error while trying to login. Output -->\n" +
+                              self._decode(startup_log.getvalue()) +
                               "\n<-- End of output\n", exc_info=True)
             raise
         finally:
             # Close temporary file as it was only used for startup debugging.
             self.connection.terminal.logfile = None
+            self.connection.terminal.logfile_read = None
             self.logger.debug(startup_log.close())
 
 
@@ -137,6 +402,24 @@ class CoreCli(object):
         self.connection.disconnect(logger=self.logger)
 
 
+    def reconnect(self):
+        """ Opens the session again, with the connection 'connect' and the CLI 'login', after
+        it was lost (network drop, device reboot, hung session...).
+        """
+        self.logger.info("Reconnecting to %s.", self.device)
+        if self.connection.terminal != None:
+            try:
+                self.connection.terminal.close(force=True)
+            except Exception:
+                self.logger.warning("Error while closing the lost terminal.", exc_info=True)
+            # Even if the terminal did not close: the connection may still hold a socket or channel
+            try:
+                self.connection.disconnect(logger=self.logger)
+            except Exception:
+                self.logger.warning("Error while disconnecting the lost session.", exc_info=True)
+        self._open_session()
+
+
     def run(self,
             cmds: str,
             timeout: Optional[int]=None,
@@ -146,7 +429,8 @@ class CoreCli(object):
             sync_timeout: Optional[int]=None,
             wait_cmd: Optional[bool]=None,
             wait_cmd_timeout: Optional[int]=None,
-            strip_cmds: Optional[bool]=None) -> RunResults:
+            strip_cmds: Optional[bool]=None,
+            monitor=None) -> RunResults:
         """ Runs CLI commands
         @param cmds              Commands in a multi-line string. Each line is a command.
         @param timeout           Maximum time to wait for command completion. Defaults to the
@@ -166,6 +450,11 @@ class CoreCli(object):
                                  timeout defined on the constructor.
         @param strip_cmds        Remove trailing spaces and empty lines. Defaults to the
                                  option defined the constructor.
+        @param monitor           Optional object watching the output as it is received, such as
+                                 a StreamChecker. Its 'start' method is called with each command
+                                 just before sending it, and its 'feed' method with each chunk
+                                 of output. When 'feed' raises a StreamCheckFailure, the command
+                                 is aborted with Ctrl-C and an AssertionError is raised.
         @return                  The results as an object of RunResults. They include:
                                  - duration: The time spent between the execution of the commands;
                                  - output: A string with the output of the commands.
@@ -187,12 +476,21 @@ class CoreCli(object):
                                                wait_cmd_timeout,
                                                strip_cmds)
 
+        # In bytes mode, the patterns are encoded once to match the raw terminal output
+        marker = self._terminal_pattern(marker)
+        error_marker = self._terminal_pattern(error_marker)
+
         # Initialize list of unexpected elements
         unexpected = [pexpect.TIMEOUT, pexpect.EOF]
         if error_marker != NO_ERROR_MARKER:
             unexpected.append(error_marker)
 
-        self._open_logfile()
+        # Only a monitor raises stream check failures: without one, nothing is caught for them
+        check_failure = ()
+        if monitor != None:
+            from .StreamCheck import StreamCheckFailure as check_failure
+
+        self._open_logfile(monitor)
         start_time = time.time()
 
         # Sync prompt: ignore all previews occurrences of the prompt marker.
@@ -218,17 +516,36 @@ class CoreCli(object):
                 prompt_size = self._get_prompt_size()
                 cmd_echo_expects = self._prepare_expect_for_cmd_echo(cmd, prompt_size)
 
-            # Send command to terminal (Finally!)
-            self.connection.terminal.sendline(cmd)
+            if monitor != None:
+                monitor.start(cmd)
+            cmd_time = time.time()
 
-            # Check that all the command was sent
-            if wait_cmd == True:
-                for cmd_echo in cmd_echo_expects:
-                    self.connection.terminal.expect(re.escape(cmd_echo), timeout=wait_cmd_timeout)
+            try:
+                # Send command to terminal (Finally!)
+                self.connection.terminal.sendline(cmd)
+
+                # Check that all the command was sent
+                if wait_cmd == True:
+                    self._wait_echo(cmd_echo_expects, wait_cmd_timeout)
+
+                # Wait for the marker or unexpected elements (errors)
+                expectations = [marker] + unexpected
+                index = self.connection.terminal.expect(expectations, timeout=timeout)
+
+            except check_failure as failure:
+                # The output is already known to be wrong: do not wait for the command to finish
+                elapsed = time.time() - cmd_time
+                # The output received while aborting (Ctrl-C echo, leftovers) is not checked
+                self._detach_monitor()
+                self._abort_command(marker, sync_timeout)
 
-            # Wait for the marker or unexpected elements (errors)
-            expectations = [marker] + unexpected
-            index = self.connection.terminal.expect(expectations, timeout=timeout)
+                self._archive_output(cmds, self.register_log(self._close_logfile(), quiet=quiet),
+                                     time.time() - start_time, failed=True)
+
+                raise AssertionError("{0} while executing '{1}'. Command aborted after {2:.2f}s, "
+                                     "saving up to {3:.2f}s of the '{4}' timeout".format(
+                                         failure, cmd, elapsed, max(timeout - elapsed, 0),
+                                         timeout))
 
             # Only the marker is accepted. All the others are errors
             if index != 0:
@@ -238,7 +555,8 @@ class CoreCli(object):
                 except:
                     pass
 
-                self.register_log(self._close_logfile(), quiet=quiet)
+                self._archive_output(cmds, self.register_log(self._close_logfile(), quiet=quiet),
+                                     time.time() - start_time, failed=True)
 
                 if index == 1:  # timeout
                     assertion_msg = "Timeout expecting '{0}' while executing '{1}'. Current "\
@@ -247,35 +565,145 @@ class CoreCli(object):
                     assertion_msg = "Expected '{0}' but received '{1}' while executing "\
                                     "'{2}'".format(marker, expectations[index], cmd)
                 # Raise error
+                if index in (1, 2):
+                    raise SessionError(assertion_msg)
                 raise AssertionError(assertion_msg)
 
         current_log = self.register_log(self._close_logfile(), quiet=quiet)
 
-        return RunResults(duration=time.time() - start_time, output=current_log)
+        results = RunResults(duration=time.time() - start_time, output=current_log,
+                             encoding=self.connection.encoding,
+                             errors=self.connection.codec_errors)
+        self._store_output(cmds, results, strip_echo=True)
+        return results
+
+
+    def run_journaled(self,
+                      cmds: str,
+                      journal: Union[str, 'Journal'],
+                      max_reconnects: Optional[int]=3,
+                      is_applied: Optional[Callable[['CoreCli', str], bool]]=None,
+                      reconnect_delay: Optional[float]=1,
+                      **run_opts) -> List[RunResults]:
+        """ Runs a long script of commands, one by one, recording each completed command in a
+        journal. When the session is lost, it reconnects and resumes from the first uncompleted
+        command. Running the script again with the same journal, for instance after the process
+        died, also resumes it: the completed commands are not run again.
+
+        The first uncompleted command of a resumed script may have been applied just before the
+        failure. When given, the 'is_applied' check is called before running it again.
+
+        @param cmds             A multi-line string with commands to be executed.
+        @param journal          The Journal, or its file path.
+        @param max_reconnects   Maximum number of reconnection attempts. Default is 3.
+        @param is_applied       Optional idempotency check, called with the CLI and a command.
+                                If it returns True, the command is recorded as completed
+                                without running it.
+        @param reconnect_delay  Time to wait before the first reconnection attempt, doubled
+                                after each failed attempt (ex: device still rebooting).
+                                Default is 1 second.
+        @param run_opts         Same options as run method.
+        @return                 The results of each command. The results of the commands
+                                completed in a previous run are read from the journal.
+        """
+        commands = cmds.splitlines()
+        if run_opts.get('strip_cmds', self.strip_cmds) == True:
+            commands = [cmd.strip(' \t') for cmd in commands if cmd.strip(' \t')]
+
+        own_journal = isinstance(journal, str)
+        if own_journal:
+            from .Journal import Journal
+            journal = Journal(journal)
+        try:
+            resumed = journal.script != None and not journal.ended
+            journal.begin(self.device, commands)
+            done = journal.completed()
+            if resumed:
+                self.logger.info("Resuming the script from the journal '%s': %d of %d commands "
+                                 "completed.", journal.path, len(done), len(commands))
+
+            all_results = []
+            reconnects = 0
+            # True while the session is lost, until a reconnection succeeds
+            lost = False
+            # True while the next command may have been applied before a failure
+            uncertain = resumed
+            for (index, cmd) in enumerate(commands):
+                if index in done:
+                    all_results.append(RunResults(done[index]['duration'], done[index]['output'],
+                                                  exit_codes=done[index]['exit_codes']))
+                    continue
+
+                while True:
+                    try:
+                        if lost:
+                            self.reconnect()
+                            lost = False
+                        if uncertain and is_applied != None and is_applied(self, cmd):
+                            results = RunResults(0, '')
+                            journal.record(index, cmd, 0, '', skipped=True)
+                            break
+                        results = self.run(cmd, **run_opts)
+                    except (SessionError, pexpect.TIMEOUT, pexpect.EOF, OSError) as error:
+                        if reconnects >= max_reconnects:
+                            raise
+                        if lost:
+                            self.logger.warning("Reconnection to %s failed: %s", self.device,
+                                                error)
+                        else:
+                            self.logger.warning("Session lost on command %d of %d: %s",
+                                                index + 1, len(commands), error)
+                        time.sleep(reconnect_delay * 2 ** reconnects)
+                        reconnects += 1
+                        lost = True
+                        uncertain = True
+                        continue
+                    journal.record(index, cmd, results.duration, results.output,
+                                   results.exit_codes)
+                    break
+
+                uncertain = False
+                all_results.append(results)
+
+            journal.end()
+            return all_results
+        finally:
+            if own_journal:
+                journal.close()
 
 
     def cli(self,
             cmds: str,
+            fail_fast: Optional[bool]=False,
+            forbidden: Optional[List[str]]=None,
             **run_opts) -> List[RunResults]:
         """ Runs CLI commands and assert outputs
-        @param cmds      Commands in a multi-line string. Each line which contains the
-                         marker is split and the contents after the marker is a command
-                         to be executed. The lines without marker are the expected
-                         outputs which are asserted, and they may contain regexes.
-        @param run_opts  Same options as run method.
+        @param cmds       Commands in a multi-line string. Each line which contains the
+                          marker is split and the contents after the marker is a command
+                          to be executed. The lines without marker are the expected
+                          outputs which are asserted, and they may contain regexes.
+        @param fail_fast  If True, the expected outputs are checked as the output streams in,
+                          and the command is aborted as soon as an expected line is missing.
+                          In this mode, the expected lines must be the first lines of the
+                          command output. Default is False.
+        @param forbidden  List of regexes that must not appear in any output line. The command
+                          is aborted as soon as one of them is received.
+        @param run_opts   Same options as run method.
         @return                  A list of the results for each command, as an object of RunResults.
                                  They include:
                                  - duration: The time spent between the execution of the commands;
                                  - output: A string with the output of the commands.
         """
+        # Only imported when needed: most tools never assert outputs with the 'cli' method
+        from expects import expect, match
 
         (marker, _1_, _2_, _3_, _4_, _5_, _6_, strip_cmds) = self._prepare_run_inits(**run_opts)
 
         return_result = []
-        expected_output = ""
-        cmd_run = RunResults(0, "")
 
-        # Each line is executed as separate command
+        # First parse the session: each command followed by its expected output lines. The
+        # expected lines before the first command are matched against an empty output.
+        steps = [(None, [])]
         for line in cmds.splitlines():
 
             if strip_cmds == True:
@@ -293,28 +721,186 @@ class CoreCli(object):
             # New cmd
             if (len(split_line) == 2):
                 # If split, the command was found.
-
-                # First assert the current content of expected output with the previous
-                # command output
-                expect(cmd_run.output).to(match(expected_output))
-
-                # Then extract the new command and clear the expected output
-                expected_output = ""
-                cmd = split_line[1]
-                cmd_run = self.run(cmd, **run_opts)
-                return_result.append(cmd_run)
+                steps.append((split_line[1], []))
 
             # New output line
             else:
                 # Remove line break at the beginning if it is an output
                 split_line = line.split("\n")
                 # If not split, or multi markers found consider as an output line
-                expected_output = expected_output + r"\s*" + split_line[1] + r"\s*"
+                steps[-1][1].append(split_line[1])
+
+        # Then execute each command and assert its output
+        for (cmd, expected_lines) in steps:
+            if cmd == None:
+                cmd_run = RunResults(0, "")
+            else:
+                if fail_fast or forbidden:
+                    from .StreamCheck import StreamChecker
+                    monitor = StreamChecker(expected_lines if fail_fast else None, forbidden,
+                                            encoding=self.connection.encoding)
+                    cmd_run = self.run(cmd, monitor=monitor, **run_opts)
+                else:
+                    cmd_run = self.run(cmd, **run_opts)
+                return_result.append(cmd_run)
+
+            expected_output = "".join([r"\s*" + line + r"\s*" for line in expected_lines])
+            expect(cmd_run.output).to(match(expected_output))
 
-        expect(cmd_run.output).to(match(expected_output))
         return return_result
 
 
+    def push_config(self,
+                    desired: str,
+                    show_cmd: Optional[str]='show running-config',
+                    config_cmd: Optional[str]=None,
+                    end_cmd: Optional[str]=None,
+                    verify: Optional[bool]=True,
+                    negate: Optional[str]=None,
+                    exit_cmd: Optional[str]=None,
+                    ignore: Optional[List[str]]=None,
+                    **run_opts) -> 'PushResults':
+        """ Pushes a configuration, sending only the lines that differ from the current one.
+
+        The current configuration is read with the show command and compared block by block
+        with the desired one (see ConfigDiff). The show command must print the whole
+        configuration, without pagination.
+
+        @param desired     The desired configuration, as printed by the show command.
+        @param show_cmd    Command printing the current configuration.
+                           Default is 'show running-config'.
+        @param config_cmd  Optional command entering the configuration mode. Ex: 'configure'.
+        @param end_cmd     Optional command leaving the configuration mode. Ex: 'end'.
+        @param verify      If True, read the configuration again after the push, and raise an
+                           AssertionError if it still differs from the desired one.
+        @param negate      Prefix of the commands removing a line. Default is 'no '.
+        @param exit_cmd    Command leaving a configuration block. Default is 'exit'.
+        @param ignore      List of regexes of lines to ignore in the configurations, such as
+                           timestamps.
+        @param run_opts    Same options as run method.
+        @return            The results of the push, as an object of PushResults. They include
+                           the lines and round trips saved compared with a full push.
+        """
+        from .ConfigDiff import ConfigDiff, PushResults, EXIT_COMMAND, NEGATE_PREFIX
+
+        if negate == None:
+            negate = NEGATE_PREFIX
+        if exit_cmd == None:
+            exit_cmd = EXIT_COMMAND
+        start_time = time.time()
+        mode_cmds = [cmd for cmd in (config_cmd, end_cmd) if cmd != None]
+
+        diff = ConfigDiff(self._show_config(show_cmd, **run_opts), desired, negate, exit_cmd,
+                          ignore=ignore)
+        round_trips = 1
+        verified = not diff
+
+        if diff:
+            commands = diff.commands
+            if config_cmd != None:
+                commands = [config_cmd] + commands
+            if end_cmd != None:
+                commands = commands + [end_cmd]
+            self.run("\n".join(commands), **run_opts)
+            round_trips += len(commands)
+
+            if verify:
+                remaining = ConfigDiff(self._show_config(show_cmd, **run_opts), desired, negate,
+                                       exit_cmd, ignore=ignore)
+                round_trips += 1
+                if remaining:
+                    raise AssertionError("The configuration differs from the desired one after "
+                                         "the push. Remaining changes:\n{0}".format(remaining))
+                verified = True
+
+        return PushResults(diff, time.time() - start_time, verified, round_trips,
+                           diff.full_size + len(mode_cmds))
+
+
+    def _show_config(self, show_cmd: str, **run_opts) -> str:
+        """ Reads the current configuration.
+
+        @param show_cmd  Command printing the configuration.
+        @param run_opts  Same options as run method.
+        @return          The configuration, without the command echo and the prompt.
+        """
+        from .StreamCheck import ANSI_ESCAPE
+
+        output = ANSI_ESCAPE.sub('', self.run(show_cmd, **run_opts).output).replace('\r', '')
+        # Without the line break before the prompt
+        return self._strip_echo_and_prompt(show_cmd, output)[:-1]
+
+
+    def _strip_echo_and_prompt(self, cmds: str, output: Union[str, bytes]) -> Union[str, bytes]:
+        """ Removes the echo of the commands and the trailing prompt from their output.
+
+        @param cmds    The commands.
+        @param output  The output of the commands, as received.
+        @return        The output lines between the echo of the first command and the prompt.
+        """
+        newline = '\n'
+        commands = self._command_lines(cmds)
+        echo = commands[0] if commands else None
+        if isinstance(output, bytes):
+            newline = b'\n'
+            if echo != None:
+                echo = echo.encode(self.connection.encoding, self.connection.codec_errors)
+        # The output starts after the echo of the command, and ends with the prompt
+        start = output.find(echo) if echo != None else -1
+        if start >= 0:
+            start = output.find(newline, start)
+            output = output[start + 1:] if start >= 0 else output[:0]
+        return output[:output.rfind(newline) + 1]
+
+
+    def _command_lines(self, cmds: str) -> List[str]:
+        """ Returns the commands of a multi-line string, without the extra spaces and the empty
+        lines, as they are sent by run.
+        """
+        return [cmd.strip(' \t') for cmd in cmds.splitlines() if cmd.strip(' \t')]
+
+
+    def _store_output(self,
+                      cmds: str,
+                      results: RunResults,
+                      strip_echo: Optional[bool]=False):
+        """ Stores the output of the commands in the output store and in the archive, if any,
+        then compresses it in the results if enabled.
+
+        @param cmds        The commands.
+        @param results     The results of the commands. Its digest is filled.
+        @param strip_echo  If True, the stored output is without the command echo and the
+                           prompt, which would keep identical outputs of different devices
+                           apart. The archive keeps the raw output. Default is False.
+        """
+        if self.output_store != None:
+            output = results.raw_output
+            if strip_echo:
+                output = self._strip_echo_and_prompt(cmds, output)
+            # Referenced by the commands as sent, so they are found from the plain command
+            results.digest = self.output_store.put(self.device,
+                                                   '\n'.join(self._command_lines(cmds)), output)
+        self._archive_output(cmds, results.raw_output, results.duration)
+        if self.compress_threshold != None:
+            results.compress(self.compress_threshold)
+
+
+    def _archive_output(self,
+                        cmds: str,
+                        output: Union[str, bytes],
+                        duration: float,
+                        failed: Optional[bool]=False):
+        """ Records a run in the archive, if any.
+
+        @param cmds      The commands.
+        @param output    The output of the commands.
+        @param duration  The time spent running the commands.
+        @param failed    If True, the run failed.
+        """
+        if self.archive != None:
+            self.archive.append(self.device, cmds, output, duration=duration, failed=failed)
+
+
     def _prepare_run_inits(self,
                            marker: Optional[str]=None,
                            error_marker: Optional[str]=None,
@@ -362,6 +948,48 @@ class CoreCli(object):
             continue
 
 
+    def _abort_command(self, marker: str, timeout: int):
+        """ Interrupts the running command with Ctrl-C and waits for the prompt marker.
+
+        Ctrl-C is sent again if the prompt does not show up, as the first one may arrive
+        while the CLI is not yet ready to handle it.
+
+        Override this method if your custom CLI is interrupted in another way.
+
+        @param marker   regex used to identify the start of a command line.
+        @param timeout  Maximum time to wait for the marker after each Ctrl-C.
+        """
+        for _ in range(3):
+            self.connection.terminal.sendcontrol('c')
+            try:
+                if self.connection.terminal.expect([marker, pexpect.TIMEOUT],
+                                                   timeout=timeout) == 0:
+                    return
+            except pexpect.EOF:
+                return
+
+
+    def _wait_echo(self, cmd_echo_expects: List[str], timeout: int):
+        """ Waits for the echo of the command, and reports the echo lag to the connection pacer,
+        if any.
+
+        @param cmd_echo_expects  The parts of the echo, see _prepare_expect_for_cmd_echo.
+        @param timeout           Maximum time to wait for each part of the echo.
+        """
+        pacer = getattr(self.connection, 'pacer', None)
+        sent_time = time.time()
+        try:
+            for cmd_echo in cmd_echo_expects:
+                self.connection.terminal.expect(
+                    self._terminal_pattern(re.escape(cmd_echo)), timeout=timeout)
+        except pexpect.TIMEOUT:
+            if pacer != None:
+                pacer.report_echo(None)
+            raise
+        if pacer != None:
+            pacer.report_echo(time.time() - sent_time)
+
+
     def _get_prompt_size(self) -> int:
         """ Returns the prompt size: the number of visible chars from the beginning of the
         line until the end of the marker
@@ -375,11 +1003,12 @@ class CoreCli(object):
         # the marker.
 
         # Get the length of visible marker that is the 'self.connection.terminal.after'.
-        prompt_size = len(self.connection.terminal.after)
+        prompt_size = len(self._decode(self.connection.terminal.after))
 
         # Iterate on chars from 'self.connection.terminal.before' (before the marker) until
         # the first non visible char (such as ANSI color code or \n).
-        for c in self.connection.terminal.before[::-1]:  # iterate over all char in reverse order
+        before = self._decode(self.connection.terminal.before)
+        for c in before[::-1]:  # iterate over all char in reverse order
             if c in printable and c != '\n':
                 prompt_size += 1
             else:
@@ -406,19 +1035,28 @@ class CoreCli(object):
         return expects
 
 
-    def register_log(self, log: str, quiet: Optional[bool]=False) -> str:
+    def register_log(self,
+                     log: Union[str, bytes],
+                     quiet: Optional[bool]=False) -> Union[str, bytes]:
         """ Clean the received log and add it to the logger
 
-        @param log    The log to be processed
+        @param log    The log to be processed. In bytes mode, it is only decoded if the logger
+                      really outputs it.
         @param quiet  If True, do not print command execution logs. Default is False.
-        @return       The processed log string
+        @return       The processed log string (or bytes, in bytes mode)
         """
         # remove extra blank lines
-        current_log = re.sub(r'\r\r', r'\r', log)
+        if isinstance(log, bytes):
+            current_log = re.sub(rb'\r\r', rb'\r', log)
+            message = _LazyLog(current_log, self.connection.encoding,
+                               self.connection.codec_errors)
+        else:
+            current_log = re.sub(r'\r\r', r'\r', log)
+            message = current_log
         if not quiet:
-            self.logger.info(current_log)
+            self.logger.info(message)
         else:
-            self.logger.debug(current_log)
+            self.logger.debug(message)
 
         return current_log
 
@@ -441,15 +1079,30 @@ class CoreCli(object):
     ################################################################################################
     ## Log manipulation
 
-    def _open_logfile(self):
+    def _open_logfile(self, monitor=None):
         """ Opens a logfile to save terminal output.
+
+        @param monitor  Optional monitor to be fed with the terminal output.
         """
+        logfile = self._new_logfile()
+        if isinstance(self.connection.terminal.logfile_read, LoginTimeline):
+            # Commands run by the login: the login timeline keeps receiving the output
+            logfile = MonitoredLog(logfile, self.connection.terminal.logfile_read)
         # When log is already created, close it before opening
-        if self.connection.terminal.logfile_read:
+        elif self.connection.terminal.logfile_read:
             self.logger.warning("Logfile already exists. Closing it!")
             if hasattr(self.connection.terminal.logfile_read, 'close'):
                 self.connection.terminal.logfile_read.close()
-        self.connection.terminal.logfile_read = StringIO()
+        if monitor != None:
+            logfile = MonitoredLog(logfile, monitor)
+        self.connection.terminal.logfile_read = logfile
+
+
+    def _detach_monitor(self):
+        """ Stops feeding the monitor of the logfile, if any. The output is still logged.
+        """
+        if isinstance(self.connection.terminal.logfile_read, MonitoredLog):
+            self.connection.terminal.logfile_read = self.connection.terminal.logfile_read.logfile
 
 
     def _close_logfile(self) -> str:
@@ -465,4 +1118,84 @@ class CoreCli(object):
             self.connection.terminal.logfile_read = None
             log = file.getvalue()
             file.close()
+            # The login timeline is attached again, for the rest of the login
+            while isinstance(file, MonitoredLog):
+                if isinstance(file.monitor, LoginTimeline):
+                    self.connection.terminal.logfile_read = file.monitor
+                file = file.logfile
         return log
+
+
+    def _new_logfile(self):
+        """ Creates an in-memory logfile matching the terminal mode.
+
+        @return  A BytesIO in bytes mode, otherwise a StringIO
+        """
+        if self._bytes_mode():
+            return BytesIO()
+        return StringIO()
+
+
+    ################################################################################################
+    ## Bytes mode
+
+    def _bytes_mode(self) -> bool:
+        """ Tells if the connection terminal works with bytes instead of strings.
+
+        @return  True if the connection was created in bytes mode
+        """
+        return getattr(self.connection, 'bytes_mode', False) is True
+
+
+    def _terminal_pattern(self, pattern):
+        """ Converts a string pattern to the type handled by the terminal.
+
+        Call it for any pattern passed to 'expect' in custom CLI implementations, so they
+        also work on bytes mode.
+
+        @param pattern  The pattern (a string, bytes or a pexpect special object)
+        @return         The bytes pattern in bytes mode, otherwise the unchanged pattern
+        """
+        if isinstance(pattern, str) and self._bytes_mode():
+            return pattern.encode(self.connection.encoding)
+        return pattern
+
+
+    def _decode(self, data: Union[str, bytes]) -> str:
+        """ Decodes terminal data according to the connection encoding and error policy.
+
+        @param data  Bytes or string read from the terminal
+        @return      The data as a string
+        """
+        if isinstance(data, bytes):
+            return data.decode(self.connection.encoding, self.connection.codec_errors)
+        return data
+
+####################################################################################################
+## Parallel login
+
+def prelogin(factory: Callable, hosts: List[str],
+             max_workers: Optional[int]=16) -> Dict[str, Union[CoreCli, Exception]]:
+    """ Opens the CLI sessions of many hosts in parallel, so their login times overlap.
+
+    Usage:
+        clis = prelogin(lambda host: SshLinux(host, "user", None, key_auth=True), hosts)
+
+    @param factory      Callable receiving a host and returning its logged in CLI.
+    @param hosts        The hosts.
+    @param max_workers  Maximum number of logins in progress at once. Default is 16.
+    @return             A dictionary with the CLI of each host, or the exception raised while
+                        opening it.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = dict([(host, executor.submit(factory, host)) for host in hosts])
+
+    clis = {}
+    for (host, future) in futures.items():
+        try:
+            clis[host] = future.result()
+        except Exception as e:
+            clis[host] = e
+    return clis
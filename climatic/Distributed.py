@@ -0,0 +1,526 @@
+import argparse
+import builtins
+import importlib
+import itertools
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .CoreCli import RunResults
+from .Scheduler import SessionScheduler
+
+# Messages are JSON objects, each one preceded by its size as a 4 bytes big-endian integer
+HEADER = struct.Struct('>I')
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+DEFAULT_PORT = 7820
+
+# Maximum time, in seconds, for a worker to introduce itself once connected
+HELLO_TIMEOUT = 10
+
+
+def send_message(sock: socket.socket, message: Dict):
+    """ Sends a message over a socket.
+    @param sock     The socket.
+    @param message  The message, a JSON serializable dictionary.
+    """
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock: socket.socket) -> Optional[Dict]:
+    """ Receives a message from a socket.
+    @param sock  The socket.
+    @return      The message, or None if the connection was closed.
+    """
+    header = _recv_exactly(sock, HEADER.size)
+    if header == None:
+        return None
+    (size,) = HEADER.unpack(header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError("Message of {0} bytes exceeds the maximum size".format(size))
+    data = _recv_exactly(sock, size)
+    if data == None:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    data = bytearray()
+    while len(data) < size:
+        try:
+            chunk = sock.recv(size - len(data))
+        except OSError:
+            return None
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def _parse_address(address: Union[str, Tuple[str, int]]) -> Tuple[str, int]:
+    if isinstance(address, str):
+        (host, _, port) = address.rpartition(':')
+        return (host or '127.0.0.1', int(port))
+    return address
+
+
+def _encode_results(results: RunResults) -> Dict:
+    return {'duration': results.duration, 'output': results.output,
+            'exit_codes': results.exit_codes, 'digest': results.digest}
+
+
+def _decode_results(encoded: Dict) -> RunResults:
+    results = RunResults(encoded['duration'], encoded['output'], exit_codes=encoded['exit_codes'])
+    results.digest = encoded['digest']
+    return results
+
+
+def _encode_error(e: Exception) -> Dict:
+    """ Encodes an exception raised on a worker. An exception of a type not built-in is sent
+    as its nearest built-in base type (ex: SessionError as AssertionError), with its type name
+    in the message.
+    """
+    for error_type in type(e).__mro__:
+        if getattr(builtins, error_type.__name__, None) is error_type:
+            break
+    message = str(e)
+    if error_type is not type(e):
+        message = "{0}: {1}".format(type(e).__name__, message)
+    return {'error': error_type.__name__, 'message': message}
+
+
+def _decode_error(error: str, message: str) -> Exception:
+    """ Rebuilds an exception raised on a worker. Only the built-in exception types are
+    rebuilt, the others are reported as RuntimeError.
+    """
+    error_type = getattr(builtins, error, None)
+    if isinstance(error_type, type) and issubclass(error_type, Exception):
+        return error_type(message)
+    return RuntimeError("{0}: {1}".format(error, message))
+
+####################################################################################################
+## Coordinator
+
+class _Job(object):
+    """ A CLI call distributed to the workers
+    """
+
+    def __init__(self, job_id: int, device: str, method: str, cmds: str, opts: Dict):
+        self.id = job_id
+        self.device = device
+        self.method = method
+        self.cmds = cmds
+        self.opts = opts
+        self.future = Future()
+        self.attempts = 0
+
+    def message(self) -> Dict:
+        return {'type': 'job', 'id': self.id, 'device': self.device, 'method': self.method,
+                'cmds': self.cmds, 'opts': self.opts}
+
+
+class _WorkerLink(object):
+    """ The coordinator side of a worker connection
+    """
+
+    def __init__(self, worker_id: int, name: str, sock: socket.socket):
+        self.id = worker_id
+        self.name = name
+        self.socket = sock
+        self.devices = set()
+        self.jobs = {}
+        self.send_lock = threading.Lock()
+
+
+class Coordinator(object):
+    """ Distributes CLI commands to worker processes, which own the CLI sessions.
+
+    Each device is assigned to a single worker (the one with fewer devices when the device is
+    first used), so its session is kept open on that worker and reused by the next commands.
+    When a worker dies, its devices are assigned to the remaining workers, and the commands it
+    was running are sent again to them (the commands may then run twice on the devices).
+    Commands submitted while no worker is connected wait for one.
+
+    Workers are started separately, on this host or on others. See Worker.
+
+    Usage:
+        coordinator = Coordinator(port=7820)
+        # On each worker host: python -m climatic.Distributed 10.0.0.5:7820 lab.devices:open_cli
+        coordinator.wait_for_workers(4)
+        results = coordinator.run_all(["10.0.1.{}".format(i) for i in range(500)], "uptime")
+    """
+
+    def __init__(self,
+                 host: Optional[str]='127.0.0.1',
+                 port: Optional[int]=DEFAULT_PORT,
+                 max_attempts: Optional[int]=2):
+        """ Initialize the coordinator and start accepting workers.
+        @param host          Address to listen on. Default is '127.0.0.1'. Use '0.0.0.0' to
+                             accept workers from other hosts.
+        @param port          Port to listen on. Set to 0 to pick a free port (see 'address').
+        @param max_attempts  Number of workers a command is sent to before giving up, when
+                             the workers running it die. Default is 2.
+        """
+        self.max_attempts = max_attempts
+        self._cond = threading.Condition()
+        self._workers = {}
+        self._assignment = {}
+        self._pending = []
+        self._worker_ids = itertools.count()
+        self._job_ids = itertools.count()
+        self._closed = False
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(socket.SOMAXCONN)
+        self.address = self._server.getsockname()[:2]
+        self._acceptor = threading.Thread(target=self._accept, name='climatic-coordinator',
+                                          daemon=True)
+        self._acceptor.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+    def submit(self, device: str, cmds: str, method: Optional[str]='run', **opts) -> Future:
+        """ Send a CLI call to the worker owning the device.
+        @param device  The device, as identified by the worker factory.
+        @param cmds    The commands.
+        @param method  The CLI method: 'run' or 'cli'. Default is 'run'.
+        @param opts    Options of the CLI method. They must be JSON serializable.
+        @return        A future for the results: a RunResults for 'run', a list of RunResults
+                       for 'cli'.
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Cannot submit calls to a coordinator after its shutdown.")
+            job = _Job(next(self._job_ids), device, method, cmds, opts)
+        self._dispatch(job)
+        return job.future
+
+
+    def run(self, device: str, cmds: str, **run_opts) -> Future:
+        """ Calls the 'run' method on the device session.
+        @param device    The device.
+        @param cmds      Same as CoreCli run method.
+        @param run_opts  Same options as CoreCli run method.
+        @return          A future for the RunResults.
+        """
+        return self.submit(device, cmds, 'run', **run_opts)
+
+
+    def cli(self, device: str, cmds: str, **run_opts) -> Future:
+        """ Calls the 'cli' method on the device session.
+        @param device    The device.
+        @param cmds      Same as CoreCli cli method.
+        @param run_opts  Same options as CoreCli cli method.
+        @return          A future for the list of RunResults.
+        """
+        return self.submit(device, cmds, 'cli', **run_opts)
+
+
+    def run_all(self, devices: List[str], cmds: str, timeout: Optional[float]=None,
+                **run_opts) -> Dict[str, Union[RunResults, Exception]]:
+        """ Runs commands on many devices, and waits for all the results.
+        @param devices   The devices.
+        @param cmds      Same as CoreCli run method.
+        @param timeout   Maximum time to wait for all the results.
+        @param run_opts  Same options as CoreCli run method.
+        @return          A dictionary with the RunResults of each device, or the exception
+                         raised while running the commands on it.
+        """
+        futures = dict([(device, self.run(device, cmds, **run_opts)) for device in devices])
+        results = {}
+        for (device, future) in futures.items():
+            try:
+                results[device] = future.result(timeout=timeout)
+            except Exception as e:
+                results[device] = e
+        return results
+
+
+    def wait_for_workers(self, count: int, timeout: Optional[float]=None) -> bool:
+        """ Waits until a number of workers are connected.
+        @param count    Number of workers.
+        @param timeout  Maximum time to wait.
+        @return         True if the workers are connected.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self._workers) >= count, timeout)
+
+
+    def workers(self) -> Dict[str, Dict]:
+        """ Returns the connected workers, with their devices and number of running calls.
+        """
+        with self._cond:
+            return dict([(worker.name, {'devices': sorted(worker.devices),
+                                        'running': len(worker.jobs)})
+                         for worker in self._workers.values()])
+
+
+    def worker_of(self, device: str) -> Optional[str]:
+        """ Returns the name of the worker owning the device, if any.
+        """
+        with self._cond:
+            worker_id = self._assignment.get(device)
+            return self._workers[worker_id].name if worker_id != None else None
+
+
+    def shutdown(self):
+        """ Stop the workers and fail the calls still waiting or running.
+        """
+        with self._cond:
+            self._closed = True
+            workers = list(self._workers.values())
+            jobs = self._pending + [job for worker in workers for job in worker.jobs.values()]
+            self._pending = []
+        self._server.close()
+        for worker in workers:
+            try:
+                with worker.send_lock:
+                    send_message(worker.socket, {'type': 'shutdown'})
+            except OSError:
+                pass
+            worker.socket.close()
+        for job in jobs:
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Coordinator shut down."))
+
+
+    ################################################################################################
+    ## Internals
+
+    def _accept(self):
+        """ Acceptor thread: hands each connection to its own thread, so a client that never
+        introduces itself does not delay the other workers.
+        """
+        while True:
+            try:
+                (sock, _) = self._server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            threading.Thread(target=self._register, args=(sock,), daemon=True,
+                             name='climatic-coordinator-worker').start()
+
+
+    def _register(self, sock: socket.socket):
+        """ Registers a worker once it introduced itself, then serves it.
+        """
+        sock.settimeout(HELLO_TIMEOUT)
+        try:
+            hello = recv_message(sock)
+        except ValueError:
+            hello = None
+        if not isinstance(hello, dict) or hello.get('type') != 'hello':
+            sock.close()
+            return
+        sock.settimeout(None)
+
+        with self._cond:
+            worker = _WorkerLink(next(self._worker_ids), hello['name'], sock)
+            self._workers[worker.id] = worker
+            (pending, self._pending) = (self._pending, [])
+            self._cond.notify_all()
+        threading.current_thread().name = 'climatic-coordinator-{0}'.format(worker.name)
+        for job in pending:
+            self._dispatch(job)
+        self._serve_worker(worker)
+
+
+    def _serve_worker(self, worker: _WorkerLink):
+        """ Reader thread of a worker: resolves the futures of the calls it completes.
+        """
+        while True:
+            message = recv_message(worker.socket)
+            if message == None:
+                break
+            with self._cond:
+                job = worker.jobs.pop(message['id'], None)
+            if job == None or job.future.done():
+                continue
+            if message['type'] == 'result':
+                if job.method == 'cli':
+                    job.future.set_result([_decode_results(r) for r in message['results']])
+                else:
+                    job.future.set_result(_decode_results(message['results']))
+            else:
+                job.future.set_exception(_decode_error(message['error'], message['message']))
+        self._worker_lost(worker)
+
+
+    def _dispatch(self, job: _Job):
+        """ Sends a job to the worker owning its device, assigning the device if needed.
+        """
+        with self._cond:
+            if self._closed:
+                job.future.set_exception(RuntimeError("Coordinator shut down."))
+                return
+            if not self._workers:
+                self._pending.append(job)
+                return
+            worker_id = self._assignment.get(job.device)
+            if worker_id == None:
+                worker_id = min(self._workers.values(), key=lambda w: len(w.devices)).id
+                self._assignment[job.device] = worker_id
+                self._workers[worker_id].devices.add(job.device)
+            worker = self._workers[worker_id]
+            worker.jobs[job.id] = job
+            job.attempts += 1
+
+        try:
+            with worker.send_lock:
+                send_message(worker.socket, job.message())
+        except OSError:
+            # The reader thread detects the lost worker and dispatches the job again
+            worker.socket.close()
+
+
+    def _worker_lost(self, worker: _WorkerLink):
+        """ Assigns the devices of a dead worker to the others, and sends its jobs again.
+        """
+        with self._cond:
+            if self._workers.pop(worker.id, None) == None or self._closed:
+                return
+            for device in worker.devices:
+                del self._assignment[device]
+            jobs = sorted(worker.jobs.values(), key=lambda job: job.id)
+            worker.jobs = {}
+        worker.socket.close()
+
+        for job in jobs:
+            if job.attempts >= self.max_attempts:
+                job.future.set_exception(ConnectionError(
+                    "Worker '{0}' was lost while running '{1}' on '{2}'".format(
+                        worker.name, job.cmds, job.device)))
+            else:
+                self._dispatch(job)
+
+####################################################################################################
+## Worker
+
+class Worker(object):
+    """ Runs the CLI calls sent by a coordinator.
+
+    The worker opens a session for each device it receives calls for, with the factory, and
+    keeps it open for the next calls. The calls to a device are run one at a time, in order,
+    while the calls to different devices run in parallel.
+
+    Usage:
+        def open_cli(device):
+            return SshLinux(device, "user", "password")
+
+        Worker("10.0.0.5:7820", open_cli).serve()
+
+    Or, from a shell: python -m climatic.Distributed 10.0.0.5:7820 lab.devices:open_cli
+    """
+
+    def __init__(self,
+                 coordinator: Union[str, Tuple[str, int]],
+                 factory: Callable,
+                 name: Optional[str]=None):
+        """ Initialize Worker
+        @param coordinator  Address of the coordinator, as 'host:port' or a (host, port) tuple.
+        @param factory      Callable receiving a device and returning its CLI (a CoreCli).
+        @param name         Name of the worker. Default is 'hostname:pid'.
+        """
+        self.coordinator = _parse_address(coordinator)
+        self.factory = factory
+        self.name = name if name != None else '{0}:{1}'.format(socket.gethostname(), os.getpid())
+        self._sessions = {}
+        self._socket = None
+        self._send_lock = threading.Lock()
+
+
+    def serve(self):
+        """ Connects to the coordinator and runs the calls until it shuts down.
+        """
+        self._socket = socket.create_connection(self.coordinator)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send({'type': 'hello', 'name': self.name})
+        try:
+            while True:
+                message = recv_message(self._socket)
+                if message == None or message['type'] == 'shutdown':
+                    break
+                self._execute(message)
+        finally:
+            for scheduler in self._sessions.values():
+                scheduler.shutdown(cancel_pending=True)
+            self._sessions = {}
+            self._socket.close()
+
+
+    def _execute(self, job: Dict):
+        """ Queues a call on the device session, opening it on the first call.
+        """
+        device = job['device']
+        if device not in self._sessions:
+            self._sessions[device] = SessionScheduler(None)
+        scheduler = self._sessions[device]
+
+        def call(cli):
+            if cli == None:
+                # Open the session in the scheduler thread. A failed login is tried again on
+                # the next call.
+                cli = scheduler.cli = self.factory(device)
+            return getattr(cli, job['method'])(job['cmds'], **job['opts'])
+
+        scheduler.submit(call).add_done_callback(lambda future: self._reply(job, future))
+
+
+    def _reply(self, job: Dict, future: Future):
+        """ Sends the result of a call to the coordinator.
+        """
+        try:
+            results = future.result()
+        except Exception as e:
+            message = {'type': 'error', 'id': job['id']}
+            message.update(_encode_error(e))
+        else:
+            if job['method'] == 'cli':
+                results = [_encode_results(r) for r in results]
+            else:
+                results = _encode_results(results)
+            message = {'type': 'result', 'id': job['id'], 'results': results}
+        try:
+            self._send(message)
+        except OSError:
+            pass
+
+
+    def _send(self, message: Dict):
+        with self._send_lock:
+            send_message(self._socket, message)
+
+
+def main(argv: Optional[List[str]]=None):
+    """ Starts a worker from the command line.
+    """
+    parser = argparse.ArgumentParser(prog='python -m climatic.Distributed',
+                                     description='Run a CLImatic worker.')
+    parser.add_argument('coordinator', help="Address of the coordinator, as 'host:port'")
+    parser.add_argument('factory', help="Function opening the CLI of a device, as "
+                                        "'module:function'")
+    parser.add_argument('--name', help="Name of the worker. Default is 'hostname:pid'")
+    args = parser.parse_args(argv)
+
+    (module, _, function) = args.factory.partition(':')
+    factory = getattr(importlib.import_module(module), function)
+    Worker(args.coordinator, factory, args.name).serve()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import time
+
+from typing import Dict, List, Optional
+
+
+def script_digest(commands: List[str]) -> str:
+    """ Returns the digest identifying a list of commands.
+    """
+    return hashlib.sha256('\n'.join(commands).encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class Journal(object):
+    """ Durable record of the commands of a script completed on a device, so the script can
+    resume from the first uncompleted command after a failure, even from another process.
+
+    The journal is a file of JSON lines, appended and synced to the disk after each command:
+    a 'begin' record identifying the script by the digest of its commands, a 'done' record
+    with the result of each completed command, and an 'end' record once the script completed.
+    A record torn by a crash while it was written is discarded on load.
+
+    Usage:
+        results = cli.run_journaled(config_lines, "push.journal")
+    """
+
+    def __init__(self, path: str, sync: Optional[bool]=True):
+        """ Initialize Journal. The records of an existing journal are loaded.
+        @param path  The journal file.
+        @param sync  If True, sync each record to the disk before returning. Default is True.
+        """
+        self.path = path
+        self.sync = sync
+        self.script = None
+        self.device = None
+        self.ended = False
+        self._done = {}
+
+        self._load()
+        self._file = open(path, 'a')
+
+    def begin(self, device: str, commands: List[str]):
+        """ Starts the journal of a script, or checks that an existing journal is the one of
+        this script on this device.
+        @param device    The device identifier.
+        @param commands  The commands of the script.
+        """
+        digest = script_digest(commands)
+        if self.script == None:
+            self.script = digest
+            self.device = device
+            self._append({'type': 'begin', 'script': digest, 'device': device,
+                          'commands': len(commands), 'time': time.time()})
+        elif self.script != digest:
+            raise ValueError("The journal '{0}' was written by another script".format(self.path))
+        elif self.device != device:
+            raise ValueError("The journal '{0}' was written for the device '{1}'".format(
+                self.path, self.device))
+
+    def record(self, index: int, command: str, duration: float, output: str,
+               exit_codes: Optional[List[int]]=None, skipped: Optional[bool]=False):
+        """ Records a completed command.
+        @param index       Index of the command in the script.
+        @param command     The command.
+        @param duration    The time spent running the command.
+        @param output      The command output.
+        @param exit_codes  The exit status of the command, if known.
+        @param skipped     True if the command was not run, as an idempotency check found it
+                           already applied.
+        """
+        entry = {'type': 'done', 'index': index, 'command': command, 'duration': duration,
+                 'output': output, 'exit_codes': exit_codes, 'skipped': skipped}
+        self._append(entry)
+        self._done[index] = entry
+
+    def end(self):
+        """ Records the completion of the script.
+        """
+        if not self.ended:
+            self._append({'type': 'end', 'time': time.time()})
+            self.ended = True
+
+    def completed(self) -> Dict[int, Dict]:
+        """ Returns the records of the completed commands, by index in the script.
+        """
+        return dict(self._done)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> 'Journal':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def _append(self, entry: Dict):
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        valid_size = 0
+        with open(self.path, 'rb') as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                valid_size += len(line)
+                if entry['type'] == 'begin':
+                    self.script = entry['script']
+                    self.device = entry['device']
+                elif entry['type'] == 'done':
+                    self._done[entry['index']] = entry
+                elif entry['type'] == 'end':
+                    self.ended = True
+        # Drops the record torn by a crash, so the next ones are appended to a valid journal
+        if valid_size < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as journal_file:
+                journal_file.truncate(valid_size)
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+from typing import Callable, Dict, List, Optional, Union
+
+# Average number of lines of a chunk, for the chunk-level deduplication
+CHUNK_LINES = 32
+
+# Maximum number of lines of a chunk
+MAX_CHUNK_LINES = 256
+
+# Size of a digest in the chunk manifests
+DIGEST_SIZE = 32
+
+
+def digest(data: bytes) -> str:
+    """ Returns the content address of data.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+####################################################################################################
+## OutputStore
+
+class OutputStore(object):
+    """ Content-addressed store of command outputs, for fleets of devices.
+
+    Each output is hashed and each unique output is stored only once, compressed, while each
+    device keeps a reference to the output of each command. Identical outputs from many
+    devices cost a single blob, and devices can be grouped by identical output without reading
+    the outputs.
+
+    With chunking enabled, the outputs are also split into content-defined chunks of lines, and
+    each unique chunk is stored once: near-identical outputs (ex: configurations differing only
+    by the hostname) share most of their chunks.
+
+    The store is kept in memory, and also in a directory when a path is given.
+
+    Usage:
+        store = OutputStore()
+        cli = SshLinux("10.0.0.1", "user", "password", output_store=store)
+        cli.run("uname -a")
+        store.group_by_output("uname -a")
+    """
+
+    def __init__(self,
+                 path: Optional[str]=None,
+                 chunking: Optional[bool]=False,
+                 normalize: Optional[Callable[[str], str]]=None,
+                 compress_level: Optional[int]=6):
+        """ Initialize OutputStore
+        @param path            Optional directory where the store is persisted. The existing
+                               store in this directory is loaded.
+        @param chunking        If True, deduplicate chunks of the outputs. Default is False.
+        @param normalize       Optional function applied to the outputs before storing them,
+                               for instance to remove prompts or volatile fields.
+        @param compress_level  The zlib compression level. Default is 6.
+        """
+        self.path = path
+        self.chunking = chunking
+        self.normalize = normalize
+        self.compress_level = compress_level
+
+        self._lock = threading.Lock()
+        self._blobs = {}
+        self._chunks = {}
+        self._refs = {}
+        self._raw_size = 0
+
+        if path != None:
+            for sub_dir in ('blobs', 'chunks'):
+                os.makedirs(os.path.join(path, sub_dir), exist_ok=True)
+            self._load()
+
+
+    def put(self, device: str, command: str, output: Union[str, bytes]) -> str:
+        """ Store the output of a command run on a device.
+        @param device   The device identifier.
+        @param command  The command.
+        @param output   The command output.
+        @return         The digest of the output.
+        """
+        if self.normalize != None:
+            output = self.normalize(output)
+        data = _to_bytes(output)
+        key = digest(data)
+
+        with self._lock:
+            self._raw_size += len(data)
+            if key not in self._blobs:
+                if self.chunking:
+                    manifest = [self._put_chunk(chunk) for chunk in _split_chunks(data)]
+                    blob = b'C' + b''.join([bytes.fromhex(chunk) for chunk in manifest])
+                else:
+                    blob = b'Z' + zlib.compress(data, self.compress_level)
+                self._blobs[key] = blob
+                self._persist('blobs', key, blob)
+            self._refs[(device, command)] = key
+            self._persist_ref(device, command, key)
+        return key
+
+
+    def get(self, key: str, encoding: Optional[str]='utf-8',
+            errors: Optional[str]='replace') -> str:
+        """ Returns an output from its digest.
+        @param key       The output digest.
+        @param encoding  Encoding to decode the output.
+        @param errors    Policy for undecodable bytes. Default is 'replace'.
+        """
+        return self.get_bytes(key).decode(encoding, errors)
+
+
+    def get_bytes(self, key: str) -> bytes:
+        """ Returns an output from its digest, as bytes.
+        @param key  The output digest.
+        """
+        with self._lock:
+            blob = self._blobs[key]
+            if blob[:1] == b'Z':
+                return zlib.decompress(blob[1:])
+            manifest = [blob[offset:offset + DIGEST_SIZE].hex()
+                        for offset in range(1, len(blob), DIGEST_SIZE)]
+            return b''.join([zlib.decompress(self._chunks[chunk]) for chunk in manifest])
+
+
+    def lookup(self, device: str, command: str) -> Optional[str]:
+        """ Returns the digest of the last output of a command on a device, if any.
+        """
+        with self._lock:
+            return self._refs.get((device, command))
+
+
+    def output(self, device: str, command: str) -> Optional[str]:
+        """ Returns the last output of a command on a device, if any.
+        """
+        key = self.lookup(device, command)
+        return self.get(key) if key != None else None
+
+
+    def devices(self) -> List[str]:
+        """ Returns the devices with stored outputs.
+        """
+        with self._lock:
+            return sorted(set([device for (device, _) in self._refs]))
+
+
+    def commands(self) -> List[str]:
+        """ Returns the commands with stored outputs.
+        """
+        with self._lock:
+            return sorted(set([command for (_, command) in self._refs]))
+
+
+    def group_by_output(self, command: str) -> Dict[str, List[str]]:
+        """ Groups the devices by identical output of a command. Only the references are read,
+        so it is fast regardless of the outputs size.
+        @param command  The command.
+        @return         A dictionary mapping each distinct output digest to the devices that
+                        printed it, the largest groups first.
+        """
+        groups = {}
+        with self._lock:
+            for ((device, cmd), key) in self._refs.items():
+                if cmd == command:
+                    groups.setdefault(key, []).append(device)
+        return dict(sorted(groups.items(), key=lambda group: -len(group[1])))
+
+
+    def stats(self) -> Dict:
+        """ Returns the store statistics:
+        - references: number of (device, command) references;
+        - blobs: number of distinct outputs;
+        - chunks: number of distinct chunks (with chunking);
+        - raw_size: total size of the outputs put in the store since it was created;
+        - stored_size: size of the stored data.
+        """
+        with self._lock:
+            stored = sum([len(blob) for blob in self._blobs.values()])
+            stored += sum([len(chunk) for chunk in self._chunks.values()])
+            return {'references': len(self._refs),
+                    'blobs': len(self._blobs),
+                    'chunks': len(self._chunks),
+                    'raw_size': self._raw_size,
+                    'stored_size': stored}
+
+
+    def _put_chunk(self, chunk: bytes) -> str:
+        """ Stores a chunk, if new, and returns its digest. Called with the lock held.
+        """
+        key = digest(chunk)
+        if key not in self._chunks:
+            self._chunks[key] = zlib.compress(chunk, self.compress_level)
+            self._persist('chunks', key, self._chunks[key])
+        return key
+
+
+    ################################################################################################
+    ## Persistence
+
+    def _persist(self, kind: str, key: str, data: bytes):
+        if self.path == None:
+            return
+        with open(os.path.join(self.path, kind, key), 'wb') as data_file:
+            data_file.write(data)
+
+
+    def _persist_ref(self, device: str, command: str, key: str):
+        if self.path == None:
+            return
+        with open(os.path.join(self.path, 'refs.jsonl'), 'a') as refs_file:
+            refs_file.write(json.dumps([device, command, key]) + '\n')
+
+
+    def _load(self):
+        for kind, storage in (('blobs', self._blobs), ('chunks', self._chunks)):
+            directory = os.path.join(self.path, kind)
+            for key in os.listdir(directory):
+                with open(os.path.join(directory, key), 'rb') as data_file:
+                    storage[key] = data_file.read()
+
+        refs_path = os.path.join(self.path, 'refs.jsonl')
+        if os.path.exists(refs_path):
+            with open(refs_path) as refs_file:
+                for line in refs_file:
+                    (device, command, key) = json.loads(line)
+                    self._refs[(device, command)] = key
+
+
+def _to_bytes(output: Union[str, bytes]) -> bytes:
+    if isinstance(output, bytes):
+        return output
+    return output.encode('utf-8', 'surrogateescape')
+
+
+def _split_chunks(data: bytes) -> List[bytes]:
+    """ Splits data in content-defined chunks of lines: a chunk ends at each line whose hash is
+    a multiple of CHUNK_LINES. As the boundaries depend only on the contents, a change in a
+    line only affects its own chunk.
+    """
+    chunks = []
+    current = []
+    for line in data.splitlines(True):
+        current.append(line)
+        if zlib.crc32(line) % CHUNK_LINES == 0 or len(current) >= MAX_CHUNK_LINES:
+            chunks.append(b''.join(current))
+            current = []
+    if current:
+        chunks.append(b''.join(current))
+    return chunks
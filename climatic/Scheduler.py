@@ -0,0 +1,229 @@
+import heapq
+import itertools
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+# Job priorities. Lower values run first.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+####################################################################################################
+## Job
+
+class _Job(object):
+    """ A call waiting in the scheduler queue
+    """
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, priority: int):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = Future()
+        self.submit_time = time.time()
+        self.start_time = None
+
+####################################################################################################
+## SessionScheduler
+
+class SessionScheduler(object):
+    """ Serializes the access of many threads to a single CLI session.
+
+    A CoreCli instance is not thread-safe. The scheduler owns the CLI and a single worker
+    thread that executes the submitted calls one at a time, in priority order (FIFO for calls
+    with the same priority). Callers receive futures, so they may wait for the results, or
+    cancel the calls that are still queued.
+
+    Usage:
+        scheduler = SessionScheduler(SshLinux("10.0.0.1", "user", "password"))
+        health = scheduler.run("uptime", priority=PRIORITY_HIGH)
+        bulk = scheduler.run("find / -name '*.log'", priority=PRIORITY_LOW)
+        print(health.result().output)
+    """
+
+    def __init__(self, cli, metrics_window: Optional[int]=1000):
+        """ Initialize the scheduler and start its worker thread.
+        @param cli             The CLI (a CoreCli instance) whose access is serialized.
+        @param metrics_window  Number of most recent calls considered for the latency metrics.
+        """
+        self.cli = cli
+        self._queue = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._running = None
+
+        # Metrics
+        self._counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'cancelled': 0}
+        self._wait_times = deque(maxlen=metrics_window)
+        self._run_times = deque(maxlen=metrics_window)
+        self._wait_times_by_priority = {}
+        self._metrics_window = metrics_window
+
+        self._worker = threading.Thread(target=self._serve, name='climatic-scheduler',
+                                        daemon=True)
+        self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+    def submit(self, fn: Callable, *args, priority: Optional[int]=PRIORITY_NORMAL,
+               **kwargs) -> Future:
+        """ Queue a call to be executed with exclusive access to the CLI.
+        @param fn        Callable receiving the CLI as first argument, followed by args and kwargs.
+        @param priority  Priority of the call. Lower values run first. Default is PRIORITY_NORMAL.
+        @return          A future for the result of the call.
+        """
+        job = _Job(fn, args, kwargs, priority)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Cannot submit calls to a scheduler after its shutdown.")
+            heapq.heappush(self._queue, (priority, next(self._sequence), job))
+            self._counters['submitted'] += 1
+            self._cond.notify()
+        return job.future
+
+
+    def run(self, cmds: str, priority: Optional[int]=PRIORITY_NORMAL, **run_opts) -> Future:
+        """ Queue the execution of the CLI 'run' method.
+        @param cmds      Same as CoreCli run method.
+        @param priority  Priority of the call. Default is PRIORITY_NORMAL.
+        @param run_opts  Same options as CoreCli run method.
+        @return          A future for the RunResults.
+        """
+        return self.submit(lambda cli: cli.run(cmds, **run_opts), priority=priority)
+
+
+    def cli(self, cmds: str, priority: Optional[int]=PRIORITY_NORMAL, **run_opts) -> Future:
+        """ Queue the execution of the CLI 'cli' method.
+        @param cmds      Same as CoreCli cli method.
+        @param priority  Priority of the call. Default is PRIORITY_NORMAL.
+        @param run_opts  Same options as CoreCli run method.
+        @return          A future for the list of RunResults.
+        """
+        return self.submit(lambda cli: cli.cli(cmds, **run_opts), priority=priority)
+
+
+    def cancel_pending(self, min_priority: Optional[int]=None) -> int:
+        """ Cancel the queued calls, for instance when they are stuck behind a hung command.
+        The call being executed is not affected.
+        @param min_priority  Only cancel calls with priority value equal or above this one (the
+                             less urgent ones). Default is to cancel all the queued calls.
+        @return              The number of cancelled calls.
+        """
+        cancelled = 0
+        with self._cond:
+            kept = []
+            for entry in self._queue:
+                job = entry[2]
+                if min_priority == None or job.priority >= min_priority:
+                    if job.future.cancel():
+                        cancelled += 1
+                else:
+                    kept.append(entry)
+            heapq.heapify(kept)
+            self._queue = kept
+            self._counters['cancelled'] += cancelled
+        return cancelled
+
+
+    def pending(self) -> int:
+        """ Returns the number of queued calls.
+        """
+        with self._cond:
+            return len(self._queue)
+
+
+    def metrics(self) -> Dict:
+        """ Returns the scheduler metrics. Latencies are in seconds and computed over the most
+        recent calls (see metrics_window):
+        - submitted, completed, failed, cancelled: call counters;
+        - pending: number of queued calls;
+        - running_for: time spent on the current call, or None when idle;
+        - queue_wait: statistics of the time spent by the calls in the queue;
+        - queue_wait_by_priority: same statistics for each priority;
+        - run_time: statistics of the execution time of the calls.
+        """
+        with self._cond:
+            metrics = dict(self._counters)
+            metrics['pending'] = len(self._queue)
+            metrics['running_for'] = (time.time() - self._running.start_time
+                                      if self._running else None)
+            metrics['queue_wait'] = _statistics(self._wait_times)
+            metrics['queue_wait_by_priority'] = {
+                priority: _statistics(waits)
+                for priority, waits in self._wait_times_by_priority.items()}
+            metrics['run_time'] = _statistics(self._run_times)
+        return metrics
+
+
+    def shutdown(self, wait: Optional[bool]=True, cancel_pending: Optional[bool]=False):
+        """ Stop accepting calls and stop the worker once the queue is empty.
+        @param wait            If True, block until the worker finishes. Default is True.
+        @param cancel_pending  If True, cancel the queued calls instead of running them.
+        """
+        if cancel_pending:
+            self.cancel_pending()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            self._worker.join()
+
+
+    def _serve(self):
+        """ Worker loop: executes the queued calls in priority order.
+        """
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                job = heapq.heappop(self._queue)[2]
+                if not job.future.set_running_or_notify_cancel():
+                    # Cancelled by the caller while queued
+                    self._counters['cancelled'] += 1
+                    continue
+                job.start_time = time.time()
+                wait_time = job.start_time - job.submit_time
+                self._wait_times.append(wait_time)
+                self._wait_times_by_priority.setdefault(
+                    job.priority, deque(maxlen=self._metrics_window)).append(wait_time)
+                self._running = job
+
+            try:
+                result = job.fn(self.cli, *job.args, **job.kwargs)
+            except BaseException as e:
+                job.future.set_exception(e)
+                counter = 'failed'
+            else:
+                job.future.set_result(result)
+                counter = 'completed'
+
+            with self._cond:
+                self._running = None
+                self._counters[counter] += 1
+                self._run_times.append(time.time() - job.start_time)
+
+
+def _statistics(values) -> Dict:
+    """ Computes count, mean, p50, p95 and max of a sequence of latencies.
+    """
+    values = sorted(values)
+    if not values:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'max': None}
+    return {'count': len(values),
+            'mean': sum(values) / len(values),
+            'p50': values[int(0.50 * (len(values) - 1))],
+            'p95': values[int(0.95 * (len(values) - 1))],
+            'max': values[-1]}
@@ -0,0 +1,284 @@
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+from typing import Dict, List, Optional
+
+####################################################################################################
+## SoakReport
+
+class SoakReport(object):
+    """ Time series of the samples taken during a soak run.
+
+    Each sample is a dictionary with:
+    - elapsed: seconds since the start of the run;
+    - commands, errors: number of commands run (and failed) during the interval;
+    - cmds_per_sec: throughput during the interval;
+    - latency_p50, latency_p90, latency_p99, latency_max: command latencies during the interval;
+    - rss: resident memory of the process, in bytes;
+    - traced_memory, traced_blocks: memory and number of blocks allocated by Python (tracemalloc);
+    - top_growth: the source lines whose allocations grew the most since the first sample;
+    - open_fds: number of open file descriptors;
+    - loggers: number of loggers created in the process.
+    Unavailable metrics are None.
+    """
+
+    # Metrics checked for regressions. True if higher values are worse.
+    CHECKED_METRICS = {
+        'latency_p50': True,
+        'latency_p99': True,
+        'cmds_per_sec': False,
+        'rss': True,
+        'traced_blocks': True,
+        'open_fds': True,
+        'loggers': True,
+    }
+
+    def __init__(self, samples: Optional[List[Dict]]=None):
+        """ Initialize SoakReport
+        @param samples  List of samples.
+        """
+        self.samples = samples if samples != None else []
+
+    @classmethod
+    def load(cls, path: str) -> 'SoakReport':
+        """ Load a report written by 'write'.
+        @param path  The report file.
+        """
+        with open(path) as report_file:
+            return cls(json.load(report_file)['samples'])
+
+    def write(self, path: str, baseline: Optional['SoakReport']=None,
+              tolerance: Optional[float]=0.2):
+        """ Write the report in JSON, including the regressions found.
+        @param path       The report file.
+        @param baseline   Optional report to compare to. See 'regressions'.
+        @param tolerance  Relative tolerance for the regressions. See 'regressions'.
+        """
+        with open(path, 'w') as report_file:
+            json.dump({'summary': self.summary(),
+                       'regressions': self.regressions(baseline, tolerance),
+                       'samples': self.samples}, report_file, indent=2)
+
+    def summary(self) -> Dict:
+        """ Summarizes the run: latencies and throughput are averaged over the samples, and the
+        resource usage is taken from the last sample.
+        """
+        summary = {}
+        if not self.samples:
+            return summary
+        for metric in ('latency_p50', 'latency_p99', 'cmds_per_sec'):
+            values = [sample[metric] for sample in self.samples if sample[metric] != None]
+            summary[metric] = sum(values) / len(values) if values else None
+        for metric in ('rss', 'traced_blocks', 'open_fds', 'loggers'):
+            summary[metric] = self.samples[-1][metric]
+        summary['commands'] = sum([sample['commands'] for sample in self.samples])
+        summary['errors'] = sum([sample['errors'] for sample in self.samples])
+        return summary
+
+    def regressions(self, baseline: Optional['SoakReport']=None,
+                    tolerance: Optional[float]=0.2) -> List[str]:
+        """ Flags the metrics that got worse by more than the tolerance.
+
+        With a baseline, this run summary is compared to the baseline summary. Without it, the
+        last sample is compared to the first one, to detect drifts along the run.
+
+        @param baseline   Optional report to compare to.
+        @param tolerance  Relative tolerance. Ex: 0.2 flags metrics 20% worse than the reference.
+        @return           A list of messages, one for each regression.
+        """
+        if baseline != None:
+            (reference, current, what) = (baseline.summary(), self.summary(), 'baseline')
+        elif len(self.samples) >= 2:
+            (reference, current, what) = (self.samples[0], self.samples[-1], 'first sample')
+        else:
+            return []
+
+        regressions = []
+        for (metric, higher_is_worse) in self.CHECKED_METRICS.items():
+            (before, after) = (reference.get(metric), current.get(metric))
+            if before == None or after == None:
+                continue
+            if higher_is_worse:
+                worse = after > before * (1 + tolerance) if before else after > 0
+            else:
+                worse = after < before * (1 - tolerance)
+            if worse:
+                regressions.append("{0} went from {1:g} ({2}) to {3:g}".format(
+                    metric, before, what, after))
+        return regressions
+
+####################################################################################################
+## Soak
+
+class Soak(object):
+    """ Soak driver: repeatedly runs a command mix against CLIs for a given duration, sampling
+    the latencies, the throughput and the resource usage of the process at regular intervals.
+
+    Each CLI is driven by its own thread, cycling over the commands.
+
+    Usage:
+        report = Soak([cli1, cli2], ["show version", "show interfaces"], duration=3600).run()
+        report.write("soak.json", baseline=SoakReport.load("baseline.json"))
+    """
+
+    def __init__(self,
+                 clis: List,
+                 commands: List[str],
+                 duration: float,
+                 sample_interval: Optional[float]=60,
+                 trace_memory: Optional[bool]=True,
+                 **run_opts):
+        """ Initialize Soak
+        @param clis             The CLIs (CoreCli instances) to run the commands on.
+        @param commands         The command mix. Repeat a command to run it more often.
+        @param duration         Duration of the run, in seconds.
+        @param sample_interval  Interval between samples, in seconds. Default is 60.
+        @param trace_memory     If True, trace the Python allocations with tracemalloc. It has
+                                some overhead, but tells which source lines are growing.
+        @param run_opts         Same options as CoreCli run method.
+        """
+        self.clis = clis
+        self.commands = commands
+        self.duration = duration
+        self.sample_interval = sample_interval
+        self.trace_memory = trace_memory
+        self.run_opts = run_opts
+
+        self._lock = threading.Lock()
+        self._latencies = []
+        self._errors = 0
+        self._stop = threading.Event()
+
+    def run(self) -> SoakReport:
+        """ Run the soak and return its report.
+        """
+        started_tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+
+        self._stop.clear()
+        report = SoakReport()
+        first_snapshot = None
+        start_time = time.time()
+        last_sample_time = start_time
+
+        threads = [threading.Thread(target=self._drive, args=(cli, offset), daemon=True)
+                   for (offset, cli) in enumerate(self.clis)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while not self._stop.is_set():
+                end_time = min(last_sample_time + self.sample_interval,
+                               start_time + self.duration)
+                self._stop.wait(max(end_time - time.time(), 0))
+                if time.time() >= start_time + self.duration:
+                    self._stop.set()
+
+                now = time.time()
+                with self._lock:
+                    (latencies, errors) = (self._latencies, self._errors)
+                    (self._latencies, self._errors) = ([], 0)
+
+                sample = _latency_sample(latencies, now - last_sample_time)
+                sample['elapsed'] = now - start_time
+                sample['errors'] = errors
+                sample.update(_resource_sample())
+                if tracemalloc.is_tracing():
+                    snapshot = tracemalloc.take_snapshot()
+                    if first_snapshot == None:
+                        first_snapshot = snapshot
+                    sample.update(_memory_sample(snapshot, first_snapshot))
+                else:
+                    sample.update({'traced_memory': None, 'traced_blocks': None,
+                                   'top_growth': []})
+                report.samples.append(sample)
+                last_sample_time = now
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            if started_tracing:
+                tracemalloc.stop()
+
+        return report
+
+    def _drive(self, cli, offset: int):
+        """ Thread loop: runs the command mix on a CLI until the end of the soak.
+        @param cli     The CLI.
+        @param offset  Start position in the command mix, so CLIs do not run in lockstep.
+        """
+        commands = itertools.islice(itertools.cycle(self.commands), offset, None)
+        for cmd in commands:
+            if self._stop.is_set():
+                return
+            start = time.time()
+            failed = False
+            try:
+                cli.run(cmd, **self.run_opts)
+            except Exception:
+                failed = True
+            latency = time.time() - start
+            with self._lock:
+                self._latencies.append(latency)
+                self._errors += failed
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    """ Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return None
+    return values[min(int(percent / 100.0 * len(values)), len(values) - 1)]
+
+
+def _latency_sample(latencies: List[float], interval: float) -> Dict:
+    """ Computes the latency and throughput metrics of an interval.
+    """
+    latencies = sorted(latencies)
+    return {'commands': len(latencies),
+            'cmds_per_sec': len(latencies) / interval if interval > 0 else None,
+            'latency_p50': _percentile(latencies, 50),
+            'latency_p90': _percentile(latencies, 90),
+            'latency_p99': _percentile(latencies, 99),
+            'latency_max': latencies[-1] if latencies else None}
+
+
+def _resource_sample() -> Dict:
+    """ Samples the process resident memory, file descriptors and loggers.
+    """
+    rss = None
+    try:
+        with open('/proc/self/statm') as statm:
+            rss = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+
+    open_fds = None
+    for fd_dir in ('/proc/self/fd', '/dev/fd'):
+        try:
+            open_fds = len(os.listdir(fd_dir))
+            break
+        except OSError:
+            pass
+
+    return {'rss': rss,
+            'open_fds': open_fds,
+            'loggers': len(logging.Logger.manager.loggerDict)}
+
+
+def _memory_sample(snapshot, first_snapshot, top: Optional[int]=5) -> Dict:
+    """ Computes the Python allocation metrics from a tracemalloc snapshot.
+    """
+    statistics = snapshot.statistics('filename')
+    growth = [str(stat) for stat in snapshot.compare_to(first_snapshot, 'lineno')[:top]
+              if stat.size_diff > 0]
+    return {'traced_memory': sum([stat.size for stat in statistics]),
+            'traced_blocks': sum([stat.count for stat in statistics]),
+            'top_growth': growth}
@@ -0,0 +1,121 @@
+import codecs
+import re
+
+from typing import List, Optional
+
+# ANSI escape sequences (colors, cursor moves, terminal modes...)
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;?]*[A-Za-z]')
+
+####################################################################################################
+## StreamCheckFailure
+
+class StreamCheckFailure(AssertionError):
+    """ Raised while the output is streaming in, as soon as it is known to be wrong.
+    """
+    pass
+
+####################################################################################################
+## StreamChecker
+
+class StreamChecker(object):
+    """ Checks the output of a command line by line, as it streams in.
+
+    The checker fails as soon as:
+    - a line matches one of the forbidden regexes;
+    - a line does not match the next expected regex. The expected lines must be the first
+      (non-blank) lines of the command output, in order. Once all of them are found, the
+      remaining output is only checked against the forbidden regexes.
+
+    The echo of the command is not checked: the first line after 'start' is called, and the
+    next lines while they continue the command text, as when the terminal wraps a long command.
+    """
+
+    def __init__(self,
+                 expected_lines: Optional[List[str]]=None,
+                 forbidden: Optional[List[str]]=None,
+                 encoding: Optional[str]='utf-8'):
+        """ Initialize StreamChecker
+        @param expected_lines  List of regexes for the first lines of the output.
+        @param forbidden       List of regexes which must not be found in any line.
+        @param encoding        Encoding used when the output is received as bytes.
+        """
+        self.expected_lines = [re.compile(line) for line in (expected_lines or [])]
+        self.forbidden = [re.compile(pattern) for pattern in (forbidden or [])]
+        self.encoding = encoding
+        self.started = False
+
+    def start(self, cmd: str):
+        """ Called just before the command is sent. The output received before is ignored.
+        @param cmd  The command.
+        """
+        self.cmd = cmd
+        self.started = True
+        # The part of the command echo still expected, None once the echo is over
+        self._echo = cmd
+        self._first_line = True
+        self._partial = ''
+        self._next_expected = 0
+        self._decoder = None
+
+    def feed(self, data):
+        """ Process a chunk of the output.
+        @param data  The chunk, as a string or bytes.
+        """
+        if not self.started:
+            return
+        if isinstance(data, bytes):
+            if self._decoder == None:
+                self._decoder = codecs.getincrementaldecoder(self.encoding)('replace')
+            data = self._decoder.decode(data)
+
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            line = ANSI_ESCAPE.sub('', line)
+            if self._echo != None and self._skip_echo(line.replace('\r', '')):
+                continue
+            self._check_line(line.strip())
+
+    def _skip_echo(self, line: str) -> bool:
+        """ Tells if a complete line is part of the command echo, as the expects of
+        CoreCli._prepare_expect_for_cmd_echo: the first line ends with the start of the command
+        (after the prompt), and each wrapped line continues it.
+        """
+        if self._first_line:
+            self._first_line = False
+            if self.cmd not in line:
+                # The longest start of the command ending the line is the first part of the echo
+                for size in range(len(self.cmd) - 1, 0, -1):
+                    if line.endswith(self.cmd[:size]):
+                        self._echo = self.cmd[size:]
+                        return True
+            # Without echo, the first line is not checked either
+            self._echo = None
+            return True
+        if line.startswith(self._echo):
+            self._echo = None
+            return True
+        if line and self._echo.startswith(line):
+            self._echo = self._echo[len(line):]
+            return True
+        # The echo is over: this line is output
+        self._echo = None
+        return False
+
+    def _check_line(self, line: str):
+        """ Check a complete line of the output.
+        """
+        if not line:
+            return
+
+        for pattern in self.forbidden:
+            if pattern.search(line):
+                raise StreamCheckFailure("Forbidden pattern '{0}' found in line '{1}'".format(
+                    pattern.pattern, line))
+
+        if self._next_expected < len(self.expected_lines):
+            pattern = self.expected_lines[self._next_expected]
+            if not pattern.search(line):
+                raise StreamCheckFailure("Expected line '{0}' is missing: received '{1}' "
+                                         "instead".format(pattern.pattern, line))
+            self._next_expected += 1
@@ -1,9 +1,13 @@
+import os
 import pexpect
+import re
+import time
 
-from typing import Optional
+from typing import List, Optional, Tuple, Union
 
-from ..CoreCli import CoreCli
-from ..connections.Ssh import Ssh, PTY_WINSIZE_COLS
+from ..CoreCli import CoreCli, RunResults, SessionError
+from ..connections.Registry import create_connection
+from ..connections.Ssh import PTY_WINSIZE_COLS
 from ..connections.Ssh import PTY_WINSIZE_COLS as SSH_PTY_WINSIZE_COLS
 
 
@@ -12,22 +16,250 @@ from ..connections.Ssh import PTY_WINSIZE_COLS as SSH_PTY_WINSIZE_COLS
 
 class Linux(CoreCli):
     """ Extend CoreCli with customizations for a Linux shell.
+
+    As a POSIX shell is available, commands can also run in framed mode: each command is
+    wrapped by unique begin/end sentinels printed by the shell itself, the end one including
+    the exit status of the command. The output is delimited exactly by the sentinels, so the
+    prompt marker, the sync and the echo verification are not needed, and every command
+    exit status is returned in the results.
     """
 
-    def run(self, cmds: str, **run_opts):
+    def __init__(self, connection, framed: Optional[bool]=False, **opts):
+        """ Initialize Linux Shell.
+        @param connection  The connection object to be used for accessing the shell.
+        @param framed      If True, run commands in framed mode. Default is False.
+        @param opts        Same options as CoreCli initializer.
+        """
+        if not hasattr(self, 'framed'):
+            self.framed = framed
+
+        # Framing is set up in the session (echo disabled) only once, on the first framed run
+        self._framing_ready = False
+        self._frame_session = os.urandom(4).hex()
+        self._frame_count = 0
+
+        CoreCli.__init__(self, connection, **opts)
+
+    def run(self, cmds: str, framed: Optional[bool]=None, **run_opts):
         """ Execute Linux shell commands
 
         @param cmds      A multi-line string with commands to be executed.
+        @param framed    If True, run the commands in framed mode. Defaults to the option
+                         defined on the constructor.
         @param run_opts  Same options as CoreCli run method.
         """
+        if framed == None:
+            framed = self.framed
+
+        if framed:
+            return self._run_framed(cmds, **run_opts)
+
         if not 'marker' in run_opts:
             run_opts['marker'] = self.marker
 
         if not 'error_marker' in run_opts:
             run_opts['error_marker'] = None
 
+        # The echo is disabled once framed mode is used in the session
+        if self._framing_ready and not 'wait_cmd' in run_opts:
+            run_opts['wait_cmd'] = False
+
         return super(Linux, self).run(cmds, **run_opts)
 
+    def reconnect(self):
+        """ Opens the session again. The framing is set up again in the new shell.
+        """
+        self._framing_ready = False
+        super(Linux, self).reconnect()
+
+    ################################################################################################
+    ## Framed execution
+
+    def _run_framed(self, cmds: str, **run_opts) -> RunResults:
+        """ Runs each command line wrapped by begin/end sentinels.
+
+        Neither the error marker nor the sync and echo options are used in this mode: the
+        command status is given by its exit code.
+
+        @param cmds      A multi-line string with commands to be executed.
+        @param run_opts  Same options as CoreCli run method.
+        @return          The results, including the exit code of each command.
+        """
+        (_1_, _2_, quiet, timeout, _3_, _4_, _5_, strip_cmds) = self._prepare_run_inits(**run_opts)
+
+        if not self._framing_ready:
+            self._setup_framing(timeout)
+
+        start_time = time.time()
+        outputs = []
+        exit_codes = []
+        empty = b'' if self._bytes_mode() else ''
+
+        for cmd in cmds.splitlines():
+
+            if strip_cmds == True:
+                # Remove extra spaces at the begin and end of the command
+                cmd = cmd.strip(' \t')
+
+                # Ignore empty lines
+                if not cmd:
+                    continue
+
+            try:
+                (output, exit_code) = self._run_framed_cmd(cmd, timeout)
+            except AssertionError:
+                self._archive_output(cmds, empty.join(outputs), time.time() - start_time,
+                                     failed=True)
+                raise
+            outputs.append(self.register_log(output, quiet=quiet))
+            exit_codes.append(exit_code)
+
+        output = empty.join(outputs)
+        results = RunResults(duration=time.time() - start_time, output=output,
+                             encoding=self.connection.encoding,
+                             errors=self.connection.codec_errors, exit_codes=exit_codes)
+        self._store_output(cmds, results)
+        return results
+
+    def _setup_framing(self, timeout: int):
+        """ Disables the terminal echo, as the framed commands do not need it.
+
+        @param timeout  Maximum time to wait for the shell to be ready.
+        """
+        frame_id = self._next_frame_id()
+        self.connection.terminal.sendline(
+            "stty -echo; printf '<<%s:%s>>\\n' R {0}".format(frame_id))
+        self.connection.terminal.expect(
+            self._terminal_pattern(re.escape('<<R:{0}>>'.format(frame_id))), timeout=timeout)
+        self._framing_ready = True
+
+    def _run_framed_cmd(self, cmd: str, timeout: int) -> Tuple[Union[str, bytes], int]:
+        """ Runs a single command between sentinels and waits for its end.
+
+        The command is evaluated with 'eval', so its exit status is the one printed by the end
+        sentinel whatever the command ends with ('&', comments...). The sentinels are printed
+        from a format string, so an eventual echo of the command line never matches them.
+
+        @param cmd      The command line.
+        @param timeout  Maximum time to wait for the command completion.
+        @return         A tuple with the command output and its exit code.
+        """
+        frame_id = self._next_frame_id()
+        self.connection.terminal.sendline(
+            "printf '<<%s:%s>>\\n' B {0}; eval '{1}'; "
+            "printf '\\n<<%s:%s:%s>>\\n' E {0} \"$?\"".format(frame_id, cmd.replace("'", "'\\''")))
+
+        begin = self._terminal_pattern(r'<<B:{0}>>\r?\n'.format(frame_id))
+        end = self._terminal_pattern(r'\r?\n<<E:{0}:(\d+)>>'.format(frame_id))
+        try:
+            self.connection.terminal.expect(begin, timeout=timeout)
+            self.connection.terminal.expect(end, timeout=timeout)
+        except (pexpect.TIMEOUT, pexpect.EOF):
+            raise SessionError("Timeout or EOF waiting for the end of '{0}'. Current timeout is "
+                               "set to '{1}'".format(cmd, timeout))
+
+        return (self.connection.terminal.before, int(self.connection.terminal.match.group(1)))
+
+    ################################################################################################
+    ## Parallel execution
+
+    def run_parallel(self, cmds: str, poll_interval: Optional[float]=0.5,
+                     **run_opts) -> List[RunResults]:
+        """ Runs the commands at the same time, as background jobs of the session.
+
+        Each command line is a job, with its output redirected to a file of a temporary
+        directory of the host. The jobs are launched one after the other, without waiting for
+        them, their completion is polled by listing the directory, and then the output and exit
+        status of each job are read back.
+        This gives N-way parallelism without N logins, for independent long-running commands
+        such as several 'iperf' runs.
+
+        The jobs have no terminal: their standard input is /dev/null. Runs in framed mode.
+
+        @param cmds           A multi-line string with commands to be executed, one per job.
+        @param poll_interval  Time between two completion polls, in seconds. Default is 0.5s.
+        @param run_opts       Same options as CoreCli run method. The timeout is the maximum
+                              time to wait for all the jobs to complete: they are killed after it.
+        @return               The results of each job, in the order of the commands. The duration
+                              of a job is the time until its completion was polled.
+        """
+        (_1_, _2_, quiet, timeout, _3_, _4_, _5_, strip_cmds) = self._prepare_run_inits(**run_opts)
+
+        jobs = cmds.splitlines()
+        if strip_cmds == True:
+            jobs = [cmd.strip(' \t') for cmd in jobs if cmd.strip(' \t')]
+        if not jobs:
+            return []
+
+        if not self._framing_ready:
+            self._setup_framing(timeout)
+
+        start_time = time.time()
+        jobs_dir = self._run_parallel_control('mktemp -d', timeout).strip()
+        for (index, cmd) in enumerate(jobs):
+            # The command runs in a subshell, so even an 'exit' leaves its status in the status
+            # file. This file is renamed once complete, so the poll never reads it partially.
+            # Launched from a subshell, the jobs are not in the session job table: no
+            # notifications. One line per job, as the terminal cuts the long input lines
+            self._run_parallel_control(
+                "( ( ( eval '{1}' ) </dev/null >{0}/{2}.out 2>&1; echo $? >{0}/{2}.tmp; "
+                "mv {0}/{2}.tmp {0}/{2}.rc ) & echo $! >{0}/{2}.pid )".format(
+                    jobs_dir, cmd.replace("'", "'\\''"), index), timeout)
+
+        durations = {}
+        while True:
+            listing = self._run_parallel_control('ls {0}'.format(jobs_dir), timeout)
+            for index in re.findall(r'(\d+)\.rc', listing):
+                durations.setdefault(int(index), time.time() - start_time)
+            if len(durations) == len(jobs):
+                break
+            if time.time() - start_time > timeout:
+                # Kills the process trees of the running jobs
+                pending = [index for index in range(len(jobs)) if index not in durations]
+                self._run_parallel_control(
+                    '_climatic_kill() {{ for c in $(pgrep -P $1); do _climatic_kill $c; done; '
+                    'kill $1; }}; for p in {0}/*.pid; do [ -e ${{p%.pid}}.rc ] || '
+                    '_climatic_kill $(cat $p); done 2>/dev/null; unset -f _climatic_kill; '
+                    'rm -rf {0}'.format(jobs_dir), timeout)
+                self._archive_output(cmds, b'' if self._bytes_mode() else '',
+                                     time.time() - start_time, failed=True)
+                raise AssertionError("Timeout waiting for the end of the parallel jobs {0}. "
+                                     "Current timeout is set to '{1}'".format(
+                                         [jobs[index] for index in pending], timeout))
+            time.sleep(poll_interval)
+
+        all_results = []
+        for (index, cmd) in enumerate(jobs):
+            # The exit status of the job is made the status of the collecting command
+            (output, exit_code) = self._run_framed_cmd(
+                'cat {0}/{1}.out; (exit $(cat {0}/{1}.rc))'.format(jobs_dir, index), timeout)
+            results = RunResults(duration=durations[index],
+                                 output=self.register_log(output, quiet=quiet),
+                                 encoding=self.connection.encoding,
+                                 errors=self.connection.codec_errors, exit_codes=[exit_code])
+            self._store_output(cmd, results)
+            all_results.append(results)
+
+        self._run_parallel_control('rm -rf {0}'.format(jobs_dir), timeout)
+        return all_results
+
+    def _run_parallel_control(self, cmd: str, timeout: int) -> str:
+        """ Runs a command handling the parallel jobs, and returns its decoded output.
+        """
+        (output, exit_code) = self._run_framed_cmd(cmd, timeout)
+        if isinstance(output, bytes):
+            output = output.decode(self.connection.encoding, self.connection.codec_errors)
+        if exit_code != 0:
+            raise AssertionError("Failed to handle the parallel jobs with '{0}': {1}".format(
+                cmd, output.strip()))
+        return output
+
+    def _next_frame_id(self) -> str:
+        """ Returns an unique sentinel identifier for the session.
+        """
+        self._frame_count += 1
+        return '{0}-{1}'.format(self._frame_session, self._frame_count)
+
 
 ####################################################################################################
 ## SshLinux
@@ -42,20 +274,56 @@ class SshLinux(Linux):
                  username: str,
                  password: str,
                  port: Optional[int]=22,
+                 bytes_mode: Optional[bool]=False,
+                 codec_errors: Optional[str]=None,
+                 background_reader: Optional[bool]=False,
+                 identity_file: Optional[str]=None,
+                 key_auth: Optional[bool]=False,
+                 known_hosts: Optional[str]=None,
+                 host_key_checking: Optional[str]=None,
+                 bastion=None,
+                 connection_type: Optional[str]=None,
                  **opts):
         """ Initialize Linux Shell.
-        @param ip        IP address of target. Ex: '234.168.10.12'
-        @param username  username for opening SSH connection
-        @param password  String with password corresponding to the username to login into
-                         the connection that provides access to the CLI.
-        @param port        Port used for SSH connection. Defaults to 22
-        @param opts      Same options as CoreCli initializer.
+        @param ip            IP address of target. Ex: '234.168.10.12'
+        @param username      username for opening SSH connection
+        @param password      String with password corresponding to the username to login into
+                             the connection that provides access to the CLI. May be None with
+                             key authentication.
+        @param port          Port used for SSH connection. Defaults to 22
+        @param bytes_mode    If True, the terminal works with bytes and outputs are decoded
+                             lazily. Default is False.
+        @param codec_errors  Policy for undecodable bytes in the outputs. Default is 'replace'
+                             in bytes mode, otherwise 'strict'.
+        @param background_reader  If True, the SSH output is continuously drained by a
+                                  background thread. Default is False.
+        @param identity_file      Private key file for the authentication.
+        @param key_auth           If True, authenticate with keys only (the identity file or the
+                                  SSH agent keys), never waiting for a password prompt.
+        @param known_hosts        Known hosts file, for instance pre-seeded with
+                                  seed_known_hosts, so the host key question never appears.
+        @param host_key_checking  The ssh StrictHostKeyChecking option. Ex: 'accept-new'.
+        @param bastion            Jump host to connect through, in a channel of its shared
+                                  connection. See Bastion.get.
+        @param connection_type    Name of the SSH connection type in the connection registry.
+                                  Default is 'ssh', or 'bastion-ssh' with a bastion. See
+                                  ConnectionRegistry.
+        @param opts          Same options as CoreCli initializer.
         """
         if not 'marker' in opts:
             opts['marker'] = '#|>'
 
         self.name = "Linux.SSH"
-        ssh = Ssh(ip, username, port=port)
+        ssh_opts = dict(port=port, bytes_mode=bytes_mode, codec_errors=codec_errors,
+                        background_reader=background_reader, identity_file=identity_file,
+                        key_auth=key_auth, known_hosts=known_hosts,
+                        host_key_checking=host_key_checking)
+        # The connection types are imported on first use: Bastion only with a bastion
+        if bastion != None:
+            ssh = create_connection(connection_type or 'bastion-ssh', bastion, ip, username,
+                                    **ssh_opts)
+        else:
+            ssh = create_connection(connection_type or 'ssh', ip, username, **ssh_opts)
         Linux.__init__(self,
                        ssh,
                        username=username,
@@ -68,15 +336,22 @@ class SshLinux(Linux):
         """
         while True:
             index = self.connection.terminal.expect(
-                ['Are you sure you want to continue connecting', '.assword', self.marker],
+                [self._terminal_pattern(p) for p in
+                 ['Are you sure you want to continue connecting', '.assword', 'Permission denied',
+                  self.marker]],
                 timeout=10)
 
             if index == 0:
                 self.connection.terminal.sendline('yes')
             if index == 1:
-                self.connection.terminal.waitnoecho()
+                # ssh disables the echo before printing the prompt, so the password is sent
+                # right away instead of polling the echo with 'waitnoecho'
                 self.connection.terminal.sendline(self.password)
-            if index >= 2:
+                self.login_timeline.mark('auth')
+            if index == 2:
+                raise AssertionError("SSH authentication failed for '{0}@{1}'".format(
+                    self.username, self.connection.ip))
+            if index >= 3:
                 break
 
     def logout(self):
@@ -0,0 +1,355 @@
+import atexit
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import pexpect
+
+from typing import Callable, List
+
+from .Connection import Connection
+from .Ssh import Ssh, SSH_PORT, PTY_WINSIZE_ROWS, PTY_WINSIZE_COLS
+from .Telnet import TELNET_PORT
+
+# Default maximum number of channels opened through a bastion at once. The Telnet channels are
+# sessions, limited by the sshd MaxSessions option (10 by default). The SSH channels are
+# direct-tcpip forwards, which MaxSessions does not limit: the cap only bounds their load
+MAX_CHANNELS = 10
+
+
+class Bastion(object):
+    """ A jump host shared by the connections to the devices behind it.
+
+    A single authenticated SSH connection to the bastion is kept open (an OpenSSH control
+    master), and each device connection is a channel multiplexed over it: SSH connections are
+    forwarded to the device (direct-tcpip, as 'ssh -W'), and Telnet connections run the
+    'telnet' client on the bastion. Only the first connection pays for the bastion login.
+
+    The number of channels open at once is capped: sshd limits the sessions of each connection
+    (MaxSessions), which run the Telnet clients, and the forwards of the SSH connections all
+    share the single bastion connection. The connections wait for a free channel.
+
+    Usage:
+        jump = Bastion.get("jump.lab", "me", key_auth=True)
+        cli1 = SshLinux("10.0.1.1", "user", "password", bastion=jump)
+        cli2 = SshLinux("10.0.1.2", "user", "password", bastion=jump)
+    """
+
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self,
+                 host: str,
+                 user: str,
+                 port: int = SSH_PORT,
+                 password: str = None,
+                 max_channels: int = MAX_CHANNELS,
+                 login_timeout: float = 30,
+                 **ssh_opts):
+        """ Initialize the bastion. The connection to it is only opened with the first channel.
+        @param host           The bastion host name or IP address.
+        @param user           The bastion user.
+        @param port           The bastion SSH port. Default is 22.
+        @param password       The bastion password, if it does not accept the user keys.
+        @param max_channels   Maximum number of channels open at once. Default is 10.
+        @param login_timeout  Maximum time to log in the bastion. Default is 30s.
+        @param ssh_opts       Same SSH options as Ssh initializer (identity_file, key_auth,
+                              known_hosts, host_key_checking, connect_timeout).
+        """
+        self.host = host
+        self.user = user
+        self.port = port
+        self.password = password
+        self.max_channels = max_channels
+        self.login_timeout = login_timeout
+        # The SSH options are formatted by an Ssh connection to the bastion
+        self.ssh = Ssh(host, user, port=port, **ssh_opts)
+
+        self._control_dir = None
+        self.control_path = None
+        self._master = None
+        # True while a thread logs in the bastion, out of the lock
+        self._opening = False
+        self._channels = []
+        self._reserved = 0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def get(cls, host: str, user: str, port: int = SSH_PORT, **opts) -> 'Bastion':
+        """ Returns the shared bastion for a host, user and port, creating it on the first call.
+        The options are only used on creation.
+        @param host  The bastion host name or IP address.
+        @param user  The bastion user.
+        @param port  The bastion SSH port. Default is 22.
+        @param opts  Same options as Bastion initializer.
+        """
+        with cls._registry_lock:
+            key = (host, user, port)
+            if key not in cls._registry:
+                cls._registry[key] = cls(host, user, port, **opts)
+            return cls._registry[key]
+
+    @classmethod
+    def close_all(cls):
+        """ Closes all the shared bastions.
+        """
+        with cls._registry_lock:
+            (bastions, cls._registry) = (list(cls._registry.values()), {})
+        for bastion in bastions:
+            bastion.close()
+
+
+    def open(self):
+        """ Opens the control master connection to the bastion, if not open yet. Only one
+        thread logs in, the others wait for it.
+        """
+        with self._cond:
+            while self._opening:
+                self._cond.wait()
+            if self._master != None and self._master.isalive():
+                return
+            if self._control_dir == None:
+                # Short path: unix sockets paths are limited to about 100 characters
+                self._control_dir = tempfile.mkdtemp(prefix='climatic-')
+                self.control_path = os.path.join(self._control_dir, 'bastion')
+            # The login may take up to the login timeout: the channels are released meanwhile
+            self._opening = True
+
+        master = None
+        try:
+            master = pexpect.spawn('ssh -M -S {0} -N -o ControlPersist=no {1}'.format(
+                self.control_path, self._destination(self.ssh._options())), encoding='utf-8',
+                codec_errors='replace')
+            self._login(master)
+        except:
+            if master != None:
+                master.close(force=True)
+            master = None
+            raise
+        finally:
+            with self._cond:
+                self._master = master
+                self._opening = False
+                self._cond.notify_all()
+
+
+    def close(self):
+        """ Closes the connection to the bastion, and so all its channels.
+        """
+        with self._cond:
+            if self._master != None:
+                subprocess.run(['ssh', '-S', self.control_path, '-O', 'exit'] +
+                               self._destination().split(), stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+                self._master.close(force=True)
+                self._master = None
+            if self._control_dir != None:
+                shutil.rmtree(self._control_dir, ignore_errors=True)
+                self._control_dir = None
+            self._channels = []
+            self._cond.notify_all()
+
+
+    def open_channel(self, spawn: Callable, timeout: float = None):
+        """ Opens a channel, waiting for a free one if all of them are in use.
+        @param spawn    Callable spawning the channel terminal.
+        @param timeout  Maximum time to wait for a free channel. Default is to wait forever.
+        @return         The channel terminal.
+        """
+        self.open()
+        deadline = time.time() + timeout if timeout != None else None
+        with self._cond:
+            while self._in_use() >= self.max_channels:
+                remaining = deadline - time.time() if deadline != None else 0.1
+                if remaining <= 0:
+                    raise ConnectionError("All the {0} channels of bastion '{1}' are in "
+                                          "use".format(self.max_channels, self.host))
+                # Channels may also be freed by their process exiting: poll them
+                self._cond.wait(min(remaining, 0.1))
+            self._reserved += 1
+
+        try:
+            terminal = spawn()
+        finally:
+            with self._cond:
+                self._reserved -= 1
+        with self._cond:
+            self._channels.append(terminal)
+        return terminal
+
+
+    def close_channel(self, terminal):
+        """ Releases a channel.
+        @param terminal  The channel terminal.
+        """
+        with self._cond:
+            if terminal in self._channels:
+                self._channels.remove(terminal)
+            self._cond.notify_all()
+
+
+    def channels(self) -> int:
+        """ Returns the number of channels in use.
+        """
+        with self._cond:
+            return self._in_use()
+
+
+    def ssh_command(self) -> str:
+        """ Returns the ssh command forwarding a connection to the host and port given by the
+        '%h' and '%p' tokens through the bastion, to be used as 'ProxyCommand'.
+        """
+        return 'ssh -S {0} -W %h:%p {1}'.format(self.control_path, self._destination())
+
+
+    def remote_command(self, command: str) -> str:
+        """ Returns the ssh command running a command on the bastion, in a terminal.
+        @param command  The command.
+        """
+        return 'ssh -S {0} -tt {1} {2}'.format(self.control_path, self._destination(), command)
+
+
+    def _in_use(self) -> int:
+        """ Counts the channels in use, forgetting the ones whose process ended.
+        """
+        self._channels = [terminal for terminal in self._channels if terminal.isalive()]
+        return len(self._channels) + self._reserved
+
+
+    def _destination(self, options: List[str] = None) -> str:
+        return ' '.join(['-p {0}'.format(self.port)] + (options or []) +
+                        ['{0}@{1}'.format(self.user, self.host)])
+
+
+    def _login(self, master):
+        """ Answers the bastion login questions until the control master is ready.
+        @param master  The control master terminal.
+        """
+        deadline = time.time() + self.login_timeout
+        while True:
+            index = master.expect(['Are you sure you want to continue connecting', '.assword',
+                                   'Permission denied', pexpect.EOF, pexpect.TIMEOUT],
+                                  timeout=0.1)
+            if index == 0:
+                master.sendline('yes')
+            elif index == 1 and self.password != None:
+                master.sendline(self.password)
+            elif index in (1, 2, 3):
+                output = (master.before or '') + str(master.after)
+                raise ConnectionError("Login to bastion '{0}@{1}' failed: {2}".format(
+                    self.user, self.host, output.strip()))
+            elif self._ready():
+                return
+            elif time.time() > deadline:
+                raise ConnectionError("Timeout logging in bastion '{0}@{1}'".format(
+                    self.user, self.host))
+
+
+    def _ready(self) -> bool:
+        """ Tells if the control master accepts channels.
+        """
+        if not os.path.exists(self.control_path):
+            return False
+        return subprocess.run(['ssh', '-S', self.control_path, '-O', 'check'] +
+                              self._destination().split(), stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL).returncode == 0
+
+
+atexit.register(Bastion.close_all)
+
+####################################################################################################
+## BastionSsh
+
+class BastionSsh(Ssh):
+    """ Connects to a CLI using SSH, through a bastion.
+    """
+
+    def __init__(self, bastion: Bastion, ip: str, user: str, port=SSH_PORT,
+                 channel_timeout: float = None, **opts):
+        """ Initialize the SSH connection object.
+        @param bastion          The bastion. Use Bastion.get to share it among connections.
+        @param ip               IP address of the device, as seen from the bastion.
+        @param user             The SSH connection user.
+        @param port             The SSH connection port. Default is 22.
+        @param channel_timeout  Maximum time to wait for a free bastion channel.
+        @param opts             Same options as Ssh initializer.
+        """
+        self.bastion = bastion
+        self.channel_timeout = channel_timeout
+        Ssh.__init__(self, ip, user, port=port, **opts)
+
+    def connect(self, logfile, logger=None):
+        """ Start the SSH connection, forwarded by the bastion.
+        @param logfile  Log file to save connection outputs.
+        @param logger   Optional logger for debug messages
+        """
+        if logger != None:
+            logger.debug("Connecting to SSH (%s) through bastion (%s).", self.ip,
+                         self.bastion.host)
+        self.terminal = self.bastion.open_channel(lambda: self._connect(logfile),
+                                                  self.channel_timeout)
+
+    def disconnect(self, logger=None):
+        """ The connection is closed during the logout. The bastion channel is released.
+        @param logger   Optional logger for debug messages
+        """
+        Ssh.disconnect(self, logger)
+        self.bastion.close_channel(self.terminal)
+
+    def _connect(self, logfile):
+        Ssh.connect(self, logfile)
+        return self.terminal
+
+    def _options(self) -> List[str]:
+        return Ssh._options(self) + ['-o "ProxyCommand={0}"'.format(self.bastion.ssh_command())]
+
+####################################################################################################
+## BastionTelnet
+
+class BastionTelnet(Connection):
+    """ Connects to a CLI using Telnet, from a bastion: the 'telnet' client runs on the
+    bastion, in a channel of the bastion connection.
+    """
+
+    def __init__(self, bastion: Bastion, ip: str, user: str, port=TELNET_PORT,
+                 channel_timeout: float = None, **opts):
+        """ Initialize the Telnet connection object.
+        @param bastion          The bastion. Use Bastion.get to share it among connections.
+        @param ip               IP address of the device, as seen from the bastion.
+        @param user             The Telnet connection user.
+        @param port             The Telnet connection port. Default is 23.
+        @param channel_timeout  Maximum time to wait for a free bastion channel.
+        @param opts             Same options as Connection initializer.
+        """
+        self.bastion = bastion
+        self.ip = ip
+        self.user = user
+        self.port = port
+        self.channel_timeout = channel_timeout
+
+        Connection.__init__(self, **opts)
+
+    def connect(self, logfile, logger=None):
+        """ Start the Telnet connection from the bastion.
+        @param logfile  Log file to save connection outputs.
+        @param logger   Optional logger for debug messages
+        """
+        if logger != None:
+            logger.debug("Connecting to Telnet (%s) through bastion (%s).", self.ip,
+                         self.bastion.host)
+        command = self.bastion.remote_command('telnet {0} {1}'.format(self.ip, self.port))
+        self.terminal = self.bastion.open_channel(lambda: self._spawn(command, logfile),
+                                                  self.channel_timeout)
+        self.terminal.setwinsize(PTY_WINSIZE_ROWS, PTY_WINSIZE_COLS)
+
+    def disconnect(self, logger=None):
+        """ The connection is closed during the logout. The bastion channel is released.
+        @param logger   Optional logger for debug messages
+        """
+        if logger != None:
+            logger.debug("Disconnecting from Telnet (%s) through bastion (%s).", self.ip,
+                         self.bastion.host)
+        self.bastion.close_channel(self.terminal)
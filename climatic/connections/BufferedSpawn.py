@@ -0,0 +1,176 @@
+import errno
+import os
+import select
+import threading
+
+import pexpect
+
+# Overflow policies for the read buffer
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+# Default maximum size of the read buffer
+READ_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Maximum number of bytes read from the pty at once
+READ_CHUNK_SIZE = 65536
+
+
+class BufferedSpawn(pexpect.spawn):
+    """ A pexpect spawn whose pty is continuously drained by a background reader thread.
+
+    pexpect only reads from the pty while 'expect' is running, so output produced between
+    commands piles up in the kernel pty buffer and the remote side blocks once it is full.
+    Here a thread keeps moving the pty output into an in-memory buffer, and 'expect' waits on
+    that buffer through a condition variable.
+
+    The buffer is bounded. When it is full, the overflow policy decides what happens:
+    - 'block': stop reading from the pty until 'expect' consumes the buffer (back-pressure);
+    - 'drop_oldest': discard the oldest buffered output;
+    - 'drop_newest': discard the output just read.
+    The number of discarded bytes is kept in 'dropped_bytes'.
+
+    Do not use 'interact' with this terminal, as it reads straight from the pty.
+    """
+
+    def __init__(self,
+                 command: str,
+                 buffer_size: int = READ_BUFFER_SIZE,
+                 overflow: str = OVERFLOW_BLOCK,
+                 **spawn_opts):
+        """ Spawn the command and start the background reader.
+        @param command      The command line to be spawned.
+        @param buffer_size  Maximum number of bytes kept in the read buffer.
+        @param overflow     Overflow policy: 'block', 'drop_oldest' or 'drop_newest'.
+        @param spawn_opts   Same options as pexpect.spawn.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Invalid overflow policy '{0}'. Use one of: {1}".format(
+                overflow, ', '.join(OVERFLOW_POLICIES)))
+
+        # Consume the buffer in large chunks: the data is already in memory
+        spawn_opts.setdefault('maxread', READ_CHUNK_SIZE)
+
+        self.buffer_size = buffer_size
+        self.overflow = overflow
+        self.dropped_bytes = 0
+        self.high_watermark = 0
+        self._read_buffer = bytearray()
+        self._read_cond = threading.Condition()
+        self._read_eof = False
+        self._stop_reader = False
+
+        pexpect.spawn.__init__(self, command, **spawn_opts)
+
+        # Pipe used to wake the reader up when the terminal is being closed
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._reader = threading.Thread(target=self._drain,
+                                        name='climatic-reader-{0}'.format(self.pid),
+                                        daemon=True)
+        self._reader.start()
+
+    @property
+    def buffered(self) -> int:
+        """ Number of bytes read from the pty and not yet consumed by 'expect'.
+        """
+        with self._read_cond:
+            return len(self._read_buffer)
+
+    def _drain(self):
+        """ Reader thread loop: moves the pty output into the read buffer until EOF.
+        """
+        while True:
+            with self._read_cond:
+                while (not self._stop_reader and self.overflow == OVERFLOW_BLOCK and
+                       len(self._read_buffer) >= self.buffer_size):
+                    self._read_cond.wait()
+                if self._stop_reader:
+                    return
+
+            ready = select.select([self.child_fd, self._wakeup_r], [], [])[0]
+            if self._wakeup_r in ready:
+                return
+
+            try:
+                data = os.read(self.child_fd, READ_CHUNK_SIZE)
+            except OSError as err:
+                if err.errno == errno.EINTR:
+                    continue
+                # EIO is the Linux way of telling the child closed the pty
+                data = b''
+
+            with self._read_cond:
+                if not data:
+                    self._read_eof = True
+                    self._read_cond.notify_all()
+                    return
+                self._store(data)
+                self._read_cond.notify_all()
+
+    def _store(self, data: bytes):
+        """ Appends data to the read buffer applying the overflow policy.
+        Must be called with the condition lock held.
+        """
+        if self.overflow == OVERFLOW_DROP_NEWEST:
+            room = max(self.buffer_size - len(self._read_buffer), 0)
+            self.dropped_bytes += max(len(data) - room, 0)
+            data = data[:room]
+
+        self._read_buffer += data
+
+        if self.overflow == OVERFLOW_DROP_OLDEST:
+            excess = len(self._read_buffer) - self.buffer_size
+            if excess > 0:
+                del self._read_buffer[:excess]
+                self.dropped_bytes += excess
+
+        self.high_watermark = max(self.high_watermark, len(self._read_buffer))
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        """ Reads at most size bytes from the read buffer, waiting up to timeout seconds for
+        the reader thread to provide them. Same semantics as pexpect.spawn.read_nonblocking.
+        """
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+
+        if timeout == -1:
+            timeout = self.timeout
+
+        with self._read_cond:
+            if not self._read_buffer and not self._read_eof:
+                self._read_cond.wait_for(lambda: self._read_buffer or self._read_eof, timeout)
+
+            if self._read_buffer:
+                data = bytes(self._read_buffer[:size])
+                del self._read_buffer[:size]
+                self._read_cond.notify_all()
+            elif self._read_eof:
+                data = None
+            else:
+                raise pexpect.TIMEOUT('Timeout exceeded.')
+
+        if data is None:
+            # Maybe the child is dead: update some attributes in that case
+            self.isalive()
+            self.flag_eof = True
+            raise pexpect.EOF('End Of File (EOF). Background reader reached the end.')
+
+        data = self._decoder.decode(data, final=False)
+        self._log(data, 'read')
+        return data
+
+    def close(self, force=True):
+        """ Stop the reader thread and close the terminal.
+        """
+        if not self.closed:
+            with self._read_cond:
+                self._stop_reader = True
+                self._read_cond.notify_all()
+            os.write(self._wakeup_w, b'\0')
+            self._reader.join()
+            os.close(self._wakeup_r)
+            os.close(self._wakeup_w)
+        pexpect.spawn.close(self, force=force)
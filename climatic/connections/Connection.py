@@ -1,9 +1,57 @@
+import pexpect
+
+
 class Connection():
     """ Interface class for CLI connections.
     """
 
-    def __init__(self):
+    def __init__(self,
+                 bytes_mode: bool = False,
+                 encoding: str = 'utf-8',
+                 codec_errors: str = None,
+                 background_reader: bool = False,
+                 read_buffer_size: int = None,
+                 read_overflow: str = None,
+                 pace_rate: float = None,
+                 pace_burst: int = None,
+                 adaptive_pacing: bool = False):
+        """ Initialize the connection attributes shared by all connection types.
+        @param bytes_mode    If True, the terminal works with bytes: no incremental decoding is
+                             done while reading, and outputs are only decoded when accessed.
+                             Default is False.
+        @param encoding      The encoding of the CLI outputs. Default is 'utf-8'.
+        @param codec_errors  Policy for undecodable bytes, as the 'errors' argument of
+                             bytes.decode (ex: 'strict', 'replace', 'ignore'). Default is
+                             'replace' in bytes mode, otherwise 'strict' as in pexpect.
+        @param background_reader  If True, a background thread continuously drains the terminal
+                                  output into an in-memory buffer, so the device never stalls
+                                  while the CLI output is not being consumed. Default is False.
+        @param read_buffer_size   Maximum size in bytes of the background reader buffer.
+                                  Default is 4 MiB.
+        @param read_overflow      What to do when the background reader buffer is full: 'block'
+                                  (stop reading until it is consumed), 'drop_oldest' or
+                                  'drop_newest'. Default is 'block'.
+        @param pace_rate          If set, the data sent to the terminal is paced to this rate, in
+                                  bytes per second. Ex: 960 for a 9600 bauds serial console.
+        @param pace_burst         Maximum size in bytes of each paced write. Default is 16.
+        @param adaptive_pacing    If True, the pace is slowed down when the echo of the commands
+                                  lags, and recovers while the echo is on time. Default is False.
+        """
         self.terminal = None
+        self.bytes_mode = bytes_mode
+        self.encoding = encoding
+        if codec_errors == None:
+            codec_errors = 'replace' if bytes_mode else 'strict'
+        self.codec_errors = codec_errors
+        self.background_reader = background_reader
+        self.read_buffer_size = read_buffer_size
+        self.read_overflow = read_overflow
+        self.pacer = None
+        if pace_rate != None:
+            # Only imported when needed, as the BufferedSpawn: most connections are not paced
+            from .Pacer import Pacer, PACE_BURST
+            self.pacer = Pacer(pace_rate, pace_burst if pace_burst != None else PACE_BURST,
+                               adaptive=adaptive_pacing)
 
     def connect(self, logfile, logger=None):
         """ Open the connection to the CLI.
@@ -23,3 +71,51 @@ class Connection():
         """
         raise NotImplementedError(
                 "The 'disconnect' method MUST be implemented in inherit connection class.")
+
+    def _spawn(self, command: str, logfile):
+        """ Spawn the pexpect terminal for the command, in text or bytes mode according to
+        the connection options.
+        @param command  The command line to be spawned.
+        @param logfile  Log file to save connection outputs.
+        @return         The spawned pexpect terminal.
+        """
+        encoding = None if self.bytes_mode else self.encoding
+        if self.background_reader:
+            from .BufferedSpawn import BufferedSpawn, OVERFLOW_BLOCK, READ_BUFFER_SIZE
+            buffer_size = self.read_buffer_size if self.read_buffer_size != None \
+                else READ_BUFFER_SIZE
+            overflow = self.read_overflow if self.read_overflow != None else OVERFLOW_BLOCK
+            terminal = BufferedSpawn(command, buffer_size=buffer_size, overflow=overflow,
+                                     logfile=logfile, encoding=encoding,
+                                     codec_errors=self.codec_errors)
+        else:
+            terminal = pexpect.spawn(command, logfile=logfile, encoding=encoding,
+                                     codec_errors=self.codec_errors)
+        return self._pace(terminal)
+
+    def _open_telnet(self, ip: str, port: int, logfile):
+        """ Open an in-process Telnet terminal, in text or bytes mode according to the
+        connection options.
+        @param ip       IP address to connect to.
+        @param port     The Telnet port.
+        @param logfile  Log file to save connection outputs.
+        @return         The TelnetSpawn terminal.
+        """
+        if self.background_reader:
+            raise ValueError("The background reader is not available for native Telnet "
+                             "connections.")
+        # Only imported by the native Telnet connections
+        from .TelnetSpawn import TelnetSpawn
+
+        encoding = None if self.bytes_mode else self.encoding
+        return self._pace(TelnetSpawn(ip, port, logfile=logfile, encoding=encoding,
+                                      codec_errors=self.codec_errors))
+
+    def _pace(self, terminal):
+        """ Paces the data sent to the terminal, if the connection has a pace rate.
+        @param terminal  The pexpect terminal.
+        @return          The terminal.
+        """
+        if self.pacer != None:
+            self.pacer.attach(terminal)
+        return terminal
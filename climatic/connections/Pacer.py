@@ -0,0 +1,137 @@
+import threading
+import time
+
+from typing import Iterator, Optional, Union
+
+# Default burst, in bytes: the size of a common UART FIFO
+PACE_BURST = 16
+
+# Echo lag, in seconds, above which the adaptive pacing slows down
+ECHO_LAG_THRESHOLD = 0.5
+
+# Factors applied to the rate by the adaptive pacing
+BACKOFF_FACTOR = 0.5
+RECOVER_FACTOR = 1.25
+
+
+class Pacer(object):
+    """ Token bucket pacing the data sent to a terminal.
+
+    The data is sent in chunks of at most 'burst' bytes, and the average throughput never
+    exceeds 'rate' bytes per second. Slow links, such as serial consoles behind Ser2Net, then
+    receive the data as fast as they can process it, instead of overrunning the device UART.
+
+    With adaptive pacing, the CLI reports the echo lag of each command: the rate is halved
+    when the echo is late (or missing), and recovers gradually up to the configured rate
+    while the echoes are on time.
+    """
+
+    def __init__(self,
+                 rate: float,
+                 burst: Optional[int]=PACE_BURST,
+                 adaptive: Optional[bool]=False,
+                 min_rate: Optional[float]=None,
+                 lag_threshold: Optional[float]=ECHO_LAG_THRESHOLD):
+        """ Initialize Pacer
+        @param rate           Maximum throughput, in bytes per second. Ex: 960 for 9600 bauds.
+        @param burst          Maximum size of a chunk, in bytes. Default is 16.
+        @param adaptive       If True, adapt the rate to the echo lag. Default is False.
+        @param min_rate       Minimum rate of the adaptive pacing. Default is rate / 16.
+        @param lag_threshold  Echo lag, in seconds, above which the adaptive pacing slows down.
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.adaptive = adaptive
+        self.min_rate = min_rate if min_rate != None else rate / 16.0
+        self.lag_threshold = lag_threshold
+
+        # Statistics
+        self.bytes_sent = 0
+        self.wait_time = 0.0
+        self.backoffs = 0
+
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+
+    def consume(self, size: int):
+        """ Waits until size bytes may be sent.
+        @param size  Number of bytes. Must not exceed the burst.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < size:
+                wait = (size - self._tokens) / self.rate
+                time.sleep(wait)
+                self.wait_time += wait
+                self._refill()
+            self._tokens -= size
+            self.bytes_sent += size
+
+
+    def chunks(self, data: Union[str, bytes]) -> Iterator[Union[str, bytes]]:
+        """ Splits data in chunks of at most burst size.
+        """
+        for start in range(0, len(data), self.burst):
+            yield data[start:start + self.burst]
+
+
+    def attach(self, terminal):
+        """ Paces the 'send' method of a pexpect terminal. As 'sendline' calls 'send', the
+        lines are paced too.
+        @param terminal  The terminal.
+        @return          The terminal.
+        """
+        send = terminal.send
+
+        def paced_send(s) -> int:
+            sent = 0
+            delay = terminal.delaybeforesend
+            try:
+                for chunk in self.chunks(s):
+                    self.consume(len(chunk))
+                    sent += send(chunk)
+                    # The delay before sending is only needed once, the pacing does the rest
+                    terminal.delaybeforesend = None
+            finally:
+                terminal.delaybeforesend = delay
+            return sent
+
+        terminal.send = paced_send
+        return terminal
+
+
+    def report_echo(self, lag: Optional[float]):
+        """ Reports the echo lag of a command, for the adaptive pacing.
+        @param lag  Time between the end of the sending and the end of the echo, in seconds, or
+                    None if the echo was not received.
+        """
+        if not self.adaptive:
+            return
+        if lag == None or lag > self.lag_threshold:
+            self.backoff()
+        else:
+            self.recover()
+
+
+    def backoff(self):
+        """ Slows down, as the device does not keep up.
+        """
+        with self._lock:
+            self.rate = max(self.rate * BACKOFF_FACTOR, self.min_rate)
+            self.backoffs += 1
+
+
+    def recover(self):
+        """ Speeds up, back to the configured rate.
+        """
+        with self._lock:
+            self.rate = min(self.rate * RECOVER_FACTOR, self.max_rate)
+
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._last_refill) * self.rate, self.burst)
+        self._last_refill = now
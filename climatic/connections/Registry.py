@@ -0,0 +1,145 @@
+import importlib
+import threading
+
+from typing import Dict, List, Union
+
+# Entry point group where the packages declare their connection types
+ENTRY_POINT_GROUP = 'climatic.connections'
+
+# Connection types of climatic itself, available even when it is not installed as a package
+BUILTIN_CONNECTIONS = {
+    'ssh': 'climatic.connections.Ssh:Ssh',
+    'telnet': 'climatic.connections.Telnet:Telnet',
+    'ser2net': 'climatic.connections.Ser2Net:Ser2Net',
+    'bastion-ssh': 'climatic.connections.Bastion:BastionSsh',
+    'bastion-telnet': 'climatic.connections.Bastion:BastionTelnet',
+}
+
+
+class ConnectionRegistry(object):
+    """ Registry of the connection types, by name.
+
+    The connection types are referenced as 'module:class' and only imported on their first
+    use, so a tool using one connection type does not pay for the imports of the others. Besides
+    the built-in ones, the connection types declared by the installed packages in the
+    'climatic.connections' entry point group are discovered on the first lookup of an unknown
+    name. Ex, in setup.cfg:
+
+        [options.entry_points]
+        climatic.connections =
+            netconf = climatic_netconf.Netconf:Netconf
+
+    Usage:
+        Ssh = registry.get('ssh')
+        connection = registry.create('ssh', '10.0.0.1', 'user')
+    """
+
+    def __init__(self,
+                 group: str = ENTRY_POINT_GROUP,
+                 builtins: Dict[str, str] = BUILTIN_CONNECTIONS):
+        """ Initialize ConnectionRegistry
+        @param group     The entry point group of the connection types.
+        @param builtins  Dictionary of the connection types always available, by name.
+        """
+        self.group = group
+        self._targets = dict(builtins)
+        self._loaded = {}
+        self._discovered = False
+        # Reentrant: an imported module may register connection types
+        self._lock = threading.RLock()
+
+    def register(self, name: str, target: Union[str, type]):
+        """ Registers a connection type, replacing any other with the same name.
+        @param name    The connection type name.
+        @param target  The connection class, or its 'module:class' reference.
+        """
+        with self._lock:
+            self._loaded.pop(name, None)
+            if isinstance(target, str):
+                self._targets[name] = target
+            else:
+                self._targets[name] = '{0}:{1}'.format(target.__module__, target.__qualname__)
+                self._loaded[name] = target
+
+    def names(self) -> List[str]:
+        """ Returns the names of all the connection types, including the discovered ones.
+        """
+        self._discover()
+        with self._lock:
+            return sorted(self._targets)
+
+    def get(self, name: str) -> type:
+        """ Returns a connection class, importing it on the first call.
+        @param name  The connection type name.
+        """
+        with self._lock:
+            if name in self._loaded:
+                return self._loaded[name]
+        if name not in self._targets:
+            self._discover()
+        with self._lock:
+            if name not in self._targets:
+                raise ValueError("Unknown connection type '{0}'. Available types: {1}".format(
+                    name, ', '.join(sorted(self._targets))))
+            (module_name, _, attribute) = self._targets[name].partition(':')
+            connection_class = importlib.import_module(module_name)
+            for part in attribute.split('.'):
+                connection_class = getattr(connection_class, part)
+            self._loaded[name] = connection_class
+            return connection_class
+
+    def create(self, name: str, *args, **opts):
+        """ Creates a connection.
+        @param name  The connection type name.
+        @param args  The arguments of the connection initializer.
+        @param opts  The options of the connection initializer.
+        """
+        return self.get(name)(*args, **opts)
+
+    def _discover(self):
+        """ Adds the connection types of the installed packages entry points. The built-in and
+        registered connection types take precedence over them.
+        """
+        with self._lock:
+            if self._discovered:
+                return
+            self._discovered = True
+            for entry_point in _entry_points(self.group):
+                self._targets.setdefault(entry_point.name, entry_point.value)
+
+
+def _entry_points(group: str) -> List:
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            # Python < 3.8 without the importlib_metadata backport: only built-in types
+            return []
+    selected = entry_points()
+    if hasattr(selected, 'select'):
+        return list(selected.select(group=group))
+    return list(selected.get(group, []))
+
+
+# The registry of the connection types
+registry = ConnectionRegistry()
+
+
+def get_connection(name: str) -> type:
+    """ Returns a connection class of the registry, by name. See ConnectionRegistry.get.
+    """
+    return registry.get(name)
+
+
+def register_connection(name: str, target: Union[str, type]):
+    """ Registers a connection type in the registry. See ConnectionRegistry.register.
+    """
+    registry.register(name, target)
+
+
+def create_connection(name: str, *args, **opts):
+    """ Creates a connection of a type of the registry. See ConnectionRegistry.create.
+    """
+    return registry.create(name, *args, **opts)
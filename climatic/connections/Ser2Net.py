@@ -1,5 +1,3 @@
-import pexpect
-
 from .Connection import Connection
 
 # Increase the PTY window size to to try to avoid truncating command output
@@ -12,15 +10,19 @@ class Ser2Net(Connection):
     The Ser2Net should be available and configured with an IP and port
     """
 
-    def __init__(self, ip: str, port: int):
+    def __init__(self, ip: str, port: int, native: bool = False, **opts):
         """ Initialize the Ser2Net connection object.
-        @param ip    IP address to connect to. Ex: '192.168.33.4'.
-        @param port  The port corresponding to the desired serial device.
+        @param ip      IP address to connect to. Ex: '192.168.33.4'.
+        @param port    The port corresponding to the desired serial device.
+        @param native  If True, use the in-process Telnet client instead of spawning the
+                       'telnet' binary. Default is False.
+        @param opts    Same options as Connection initializer.
         """
         self.ip = ip
         self.port = port
+        self.native = native
 
-        Connection.__init__(self)
+        Connection.__init__(self, **opts)
 
     def connect(self, logfile, logger=None):
         """ Start the Ser2Net connection.
@@ -30,8 +32,10 @@ class Ser2Net(Connection):
         if logger != None:
             logger.debug("Connecting to Ser2Net (%s %s).", self.ip, self.port)
 
-        self.terminal = pexpect.spawn(
-            'telnet {0} {1}'.format(self.ip, self.port), logfile=logfile, encoding='utf-8')
+        if self.native:
+            self.terminal = self._open_telnet(self.ip, self.port, logfile)
+        else:
+            self.terminal = self._spawn('telnet {0} {1}'.format(self.ip, self.port), logfile)
         self.terminal.sendline()
         self.terminal.setwinsize(PTY_WINSIZE_ROWS, PTY_WINSIZE_COLS)
 
@@ -1,4 +1,6 @@
-import pexpect
+import os
+
+from typing import List
 
 from .Connection import Connection
 
@@ -14,19 +16,44 @@ class Ssh(Connection):
     The device should have the IP configured.
     """
 
-    def __init__(self, ip: str, user: str, port=SSH_PORT, ciphers: str = None):
+    def __init__(self,
+                 ip: str,
+                 user: str,
+                 port=SSH_PORT,
+                 ciphers: str = None,
+                 identity_file: str = None,
+                 key_auth: bool = False,
+                 known_hosts: str = None,
+                 host_key_checking: str = None,
+                 connect_timeout: int = None,
+                 **opts):
         """ Initialize the SSH connection object.
-        @param ip       IP address to connect to. Ex: '192.168.33.4'.
-        @param user     The SSH connection user.
-        @param port     The SSH connection port. Default is 22.
-        @param ciphers  A comma sepparated list of ciphers. Ex: 'blowfish-cbc,3des-cbc'
+        @param ip                 IP address to connect to. Ex: '192.168.33.4'.
+        @param user               The SSH connection user.
+        @param port               The SSH connection port. Default is 22.
+        @param ciphers            A comma sepparated list of ciphers. Ex: 'blowfish-cbc,3des-cbc'
+        @param identity_file      Private key file. Only this key is offered to the server.
+        @param key_auth           If True, only authenticate with keys (the identity file or
+                                  the SSH agent keys): ssh runs in batch mode, and fails
+                                  instead of asking for a password or any question.
+        @param known_hosts        Known hosts file to use instead of the user one. See
+                                  seed_known_hosts.
+        @param host_key_checking  The ssh StrictHostKeyChecking option. Ex: 'accept-new' adds
+                                  unknown host keys without asking, but rejects changed keys.
+        @param connect_timeout    Maximum time, in seconds, to establish the TCP connection.
+        @param opts               Same options as Connection initializer.
         """
         self.user = user
         self.ip = ip
         self.port = port
         self.ciphers = ciphers
+        self.identity_file = identity_file
+        self.key_auth = key_auth
+        self.known_hosts = known_hosts
+        self.host_key_checking = host_key_checking
+        self.connect_timeout = connect_timeout
 
-        Connection.__init__(self)
+        Connection.__init__(self, **opts)
 
     def connect(self, logfile, logger=None):
         """ Start the SSH connection.
@@ -36,12 +63,13 @@ class Ssh(Connection):
         if logger != None:
             logger.debug("Connecting to SSH (%s).", self.ip)
 
-        cipher_spec = ''
+        options = []
         if self.ciphers != None:
-            cipher_spec = '-c {}'.format(self.ciphers)
+            options.append('-c {}'.format(self.ciphers))
+        options += self._options()
 
-        self.terminal = pexpect.spawn('ssh -p {2} {0}@{1} {3}'.format(
-            self.user, self.ip, self.port, cipher_spec), logfile=logfile, encoding='utf-8')
+        self.terminal = self._spawn('ssh -p {2} {0}@{1} {3}'.format(
+            self.user, self.ip, self.port, ' '.join(options)), logfile)
         self.terminal.setwinsize(PTY_WINSIZE_ROWS, PTY_WINSIZE_COLS)
 
     def disconnect(self, logger=None):
@@ -50,3 +78,59 @@ class Ssh(Connection):
         """
         if logger != None:
             logger.debug("Disconnecting from SSH (%s).", self.ip)
+
+    def _options(self) -> List[str]:
+        """ Returns the ssh command line options for the authentication and host keys.
+        """
+        options = []
+        if self.identity_file != None:
+            options.append('-i {0} -o IdentitiesOnly=yes'.format(self.identity_file))
+        if self.key_auth:
+            options.append('-o BatchMode=yes -o PreferredAuthentications=publickey')
+        if self.known_hosts != None:
+            options.append('-o UserKnownHostsFile={0}'.format(self.known_hosts))
+        if self.host_key_checking != None:
+            options.append('-o StrictHostKeyChecking={0}'.format(self.host_key_checking))
+        if self.connect_timeout != None:
+            options.append('-o ConnectTimeout={0}'.format(self.connect_timeout))
+        return options
+
+
+def seed_known_hosts(hosts: List[str], known_hosts: str, port: int = SSH_PORT,
+                     timeout: int = 5) -> int:
+    """ Adds the keys of the hosts to a known hosts file, with a single ssh-keyscan run, so
+    the SSH connections to them never ask to confirm the host key. The hosts already in the
+    file are not scanned again.
+
+    Only use it on trusted networks: the scanned keys are accepted without verification.
+
+    @param hosts        The hosts names or IP addresses.
+    @param known_hosts  The known hosts file. It is created if needed.
+    @param port         The SSH port of the hosts. Default is 22.
+    @param timeout      Maximum time, in seconds, to wait for each host.
+    @return             Number of keys added.
+    """
+    import subprocess
+
+    known = set()
+    if os.path.exists(known_hosts):
+        with open(known_hosts) as known_file:
+            for line in known_file:
+                if line.strip() and not line.startswith('#'):
+                    known.update(line.split()[0].split(','))
+
+    def entry(host):
+        return host if port == SSH_PORT else '[{0}]:{1}'.format(host, port)
+
+    hosts = [host for host in hosts if entry(host) not in known]
+    if not hosts:
+        return 0
+
+    scan = subprocess.run(['ssh-keyscan', '-p', str(port), '-T', str(timeout)] + hosts,
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                          universal_newlines=True)
+    keys = [line for line in scan.stdout.splitlines() if line and not line.startswith('#')]
+    with open(known_hosts, 'a') as known_file:
+        for key in keys:
+            known_file.write(key + '\n')
+    return len(keys)
@@ -1,29 +1,32 @@
-from telnetlib import TELNET_PORT
-import pexpect
-
 from .Connection import Connection
 
 # Increase the PTY window size to to try to avoid truncating command output
 PTY_WINSIZE_ROWS = 24
 PTY_WINSIZE_COLS = 500
 
+TELNET_PORT = 23
+
 
 class Telnet(Connection):
     """ Connects to a CLI using Telnet.
     The device should have the IP configured.
     """
 
-    def __init__(self, ip: str, user: str, port=TELNET_PORT):
+    def __init__(self, ip: str, user: str, port=TELNET_PORT, native: bool = False, **opts):
         """ Initialize the Telnet connection object.
-        @param ip    IP address to connect to. Ex: '192.168.33.4'.
-        @param user  The Telnet connection user.
-        @param port  The Telnet connection port. Default is 23.
+        @param ip      IP address to connect to. Ex: '192.168.33.4'.
+        @param user    The Telnet connection user.
+        @param port    The Telnet connection port. Default is 23.
+        @param native  If True, use the in-process Telnet client instead of spawning the
+                       'telnet' binary. Default is False.
+        @param opts    Same options as Connection initializer.
         """
         self.user = user
         self.ip = ip
         self.port = port
+        self.native = native
 
-        Connection.__init__(self)
+        Connection.__init__(self, **opts)
 
     def connect(self, logfile, logger=None):
         """ Start the Telnet connection.
@@ -32,8 +35,10 @@ class Telnet(Connection):
         """
         if logger != None:
             logger.debug("Connecting to Telnet (%s).", self.ip)
-        self.terminal = pexpect.spawn(
-            'telnet {0} {1}'.format(self.ip, self.port), logfile=logfile, encoding='utf-8')
+        if self.native:
+            self.terminal = self._open_telnet(self.ip, self.port, logfile)
+        else:
+            self.terminal = self._spawn('telnet {0} {1}'.format(self.ip, self.port), logfile)
         self.terminal.setwinsize(PTY_WINSIZE_ROWS, PTY_WINSIZE_COLS)
 
     def disconnect(self, logger=None):
@@ -0,0 +1,255 @@
+import socket
+import struct
+
+import pexpect
+
+from pexpect.fdpexpect import fdspawn
+from pexpect.utils import select_ignore_interrupts
+
+# Telnet commands (RFC 854)
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+# Telnet options
+ECHO = 1            # RFC 857
+SGA = 3             # RFC 858, suppress go ahead
+TTYPE = 24          # RFC 1091, terminal type
+NAWS = 31           # RFC 1073, negotiate about window size
+
+TTYPE_IS = 0
+TTYPE_SEND = 1
+
+# Options this client agrees to enable on its side (answer DO with WILL)
+LOCAL_OPTIONS = (SGA, TTYPE, NAWS)
+# Options this client agrees the server enables (answer WILL with DO)
+REMOTE_OPTIONS = (ECHO, SGA)
+
+# Parser states
+_DATA, _IAC, _VERB, _SB, _SB_IAC, _CR = range(6)
+
+
+class TelnetSpawn(fdspawn):
+    """ An in-process Telnet client with the pexpect interface (expect, send, sendline...).
+
+    Instead of spawning the 'telnet' binary in a pty, the connection is a plain socket and the
+    Telnet protocol is handled here: option negotiation (answering the IAC DO/DONT/WILL/WONT
+    commands), terminal type and window size (NAWS) subnegotiations, and escaping of IAC bytes
+    in the sent data. Only the CLI data reaches 'expect' and the logs.
+
+    No process nor pty is created, so a single process can drive many consoles.
+    """
+
+    def __init__(self,
+                 ip: str,
+                 port: int,
+                 connect_timeout: float = 10,
+                 rows: int = 24,
+                 cols: int = 80,
+                 terminal_type: str = 'VT100',
+                 **spawn_opts):
+        """ Open the Telnet connection.
+        @param ip               IP address to connect to. Ex: '192.168.33.4'.
+        @param port             The Telnet port.
+        @param connect_timeout  Maximum time to establish the TCP connection.
+        @param rows             Number of rows of the window reported to the server.
+        @param cols             Number of columns of the window reported to the server.
+        @param terminal_type    Terminal type reported to the server.
+        @param spawn_opts       Same options as pexpect fdspawn (logfile, encoding...).
+        """
+        self.socket = socket.create_connection((ip, port), timeout=connect_timeout)
+        self.socket.settimeout(None)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        fdspawn.__init__(self, self.socket.fileno(), **spawn_opts)
+        self.name = '<telnet {0}:{1}>'.format(ip, port)
+
+        # NVT end of line
+        self.linesep = self.crlf
+
+        self.rows = rows
+        self.cols = cols
+        self.terminal_type = terminal_type
+        self.local_options = {}
+        self.remote_options = {}
+        self._state = _DATA
+        self._verb = None
+        self._subnegotiation = bytearray()
+
+    ################################################################################################
+    ## pexpect interface
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        """ Reads at most size bytes from the socket, waiting up to timeout seconds, and
+        returns them without the Telnet commands.
+        """
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+
+        if timeout == -1:
+            timeout = self.timeout
+
+        if not select_ignore_interrupts([self.child_fd], [], [], timeout)[0]:
+            raise pexpect.TIMEOUT('Timeout exceeded.')
+
+        try:
+            raw = self.socket.recv(size)
+        except ConnectionError:
+            raw = b''
+        if not raw:
+            self.flag_eof = True
+            raise pexpect.EOF('End Of File (EOF). Telnet connection closed.')
+
+        data = self._decoder.decode(self._process(raw), final=False)
+        self._log(data, 'read')
+        return data
+
+    def send(self, s) -> int:
+        """ Sends data to the server, escaping the IAC bytes.
+        """
+        s = self._coerce_send_string(s)
+        self._log(s, 'send')
+        data = self._encoder.encode(s, final=False)
+        self.socket.sendall(data.replace(bytes([IAC]), bytes([IAC, IAC])))
+        return len(data)
+
+    def sendline(self, s='') -> int:
+        """ Sends data followed by the NVT end of line (CR LF).
+        """
+        s = self._coerce_send_string(s)
+        return self.send(s + self.linesep)
+
+    def sendcontrol(self, char: str) -> int:
+        """ Sends a control character. Ex: sendcontrol('c') sends Ctrl-C.
+        """
+        return self.send(chr(ord(char.lower()) & 0x1f))
+
+    def setwinsize(self, rows: int, cols: int):
+        """ Sets the window size reported to the server through NAWS.
+        """
+        self.rows = rows
+        self.cols = cols
+        if self.local_options.get(NAWS):
+            self._send_naws()
+
+    def isalive(self) -> bool:
+        """ The connection is alive until it is closed by any of the sides.
+        """
+        return not self.closed and not self.flag_eof
+
+    def close(self, force: bool = True):
+        """ Close the socket.
+        @param force  Unused, for compatibility with pexpect.spawn.close().
+        """
+        if not self.closed:
+            self.socket.close()
+            self.child_fd = -1
+            self.closed = True
+
+    ################################################################################################
+    ## Telnet protocol
+
+    def _process(self, raw: bytes) -> bytes:
+        """ Removes the Telnet commands from the received bytes, answering them.
+        The parser state is kept between calls, as commands may be split among reads.
+
+        @param raw  Bytes received from the socket.
+        @return     The data bytes.
+        """
+        # Fast path: nothing to parse
+        if self._state == _DATA and IAC not in raw and b'\r\0' not in raw and raw[-1:] != b'\r':
+            return raw
+
+        data = bytearray()
+        for byte in raw:
+            if self._state == _DATA:
+                if byte == IAC:
+                    self._state = _IAC
+                else:
+                    data.append(byte)
+                    if byte == 13:
+                        self._state = _CR
+            elif self._state == _CR:
+                # NVT carriage return is sent as CR NUL
+                self._state = _DATA
+                if byte == IAC:
+                    self._state = _IAC
+                elif byte != 0:
+                    data.append(byte)
+                    if byte == 13:
+                        self._state = _CR
+            elif self._state == _IAC:
+                if byte == IAC:
+                    data.append(IAC)
+                    self._state = _DATA
+                elif byte in (DO, DONT, WILL, WONT):
+                    self._verb = byte
+                    self._state = _VERB
+                elif byte == SB:
+                    self._subnegotiation = bytearray()
+                    self._state = _SB
+                else:
+                    # Other commands (NOP, GA...) carry no data
+                    self._state = _DATA
+            elif self._state == _VERB:
+                self._negotiate(self._verb, byte)
+                self._state = _DATA
+            elif self._state == _SB:
+                if byte == IAC:
+                    self._state = _SB_IAC
+                else:
+                    self._subnegotiation.append(byte)
+            elif self._state == _SB_IAC:
+                if byte == SE:
+                    self._subnegotiate(bytes(self._subnegotiation))
+                    self._state = _DATA
+                else:
+                    self._subnegotiation.append(byte)
+                    self._state = _SB
+        return bytes(data)
+
+    def _negotiate(self, verb: int, option: int):
+        """ Answers an option negotiation command. Answers are only sent when the option
+        state changes, avoiding negotiation loops.
+        """
+        if verb == DO:
+            enable = option in LOCAL_OPTIONS
+            if self.local_options.get(option) != enable:
+                self.local_options[option] = enable
+                self._send_command(WILL if enable else WONT, option)
+                if enable and option == NAWS:
+                    self._send_naws()
+        elif verb == DONT:
+            if self.local_options.get(option) != False:
+                self.local_options[option] = False
+                self._send_command(WONT, option)
+        elif verb == WILL:
+            enable = option in REMOTE_OPTIONS
+            if self.remote_options.get(option) != enable:
+                self.remote_options[option] = enable
+                self._send_command(DO if enable else DONT, option)
+        elif verb == WONT:
+            if self.remote_options.get(option) != False:
+                self.remote_options[option] = False
+                self._send_command(DONT, option)
+
+    def _subnegotiate(self, subnegotiation: bytes):
+        """ Answers a subnegotiation (IAC SB ... IAC SE) request.
+        """
+        if subnegotiation[:2] == bytes([TTYPE, TTYPE_SEND]):
+            self._send_raw(bytes([IAC, SB, TTYPE, TTYPE_IS]) +
+                           self.terminal_type.encode('ascii') + bytes([IAC, SE]))
+
+    def _send_command(self, verb: int, option: int):
+        self._send_raw(bytes([IAC, verb, option]))
+
+    def _send_naws(self):
+        size = struct.pack('>HH', self.cols, self.rows).replace(bytes([IAC]), bytes([IAC, IAC]))
+        self._send_raw(bytes([IAC, SB, NAWS]) + size + bytes([IAC, SE]))
+
+    def _send_raw(self, data: bytes):
+        self.socket.sendall(data)
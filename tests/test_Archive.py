@@ -0,0 +1,93 @@
+import pytest
+
+from expects import *
+from unittest.mock import MagicMock
+from unittest.mock import Mock
+
+from climatic.Archive import ArchiveReader, ArchiveWriter
+from climatic.CoreCli import CoreCli
+
+
+def test_archive_query(archive_path):
+    with ArchiveReader(archive_path) as archive:
+        expect(len(archive)).to(equal(300))
+        expect(archive.devices()).to(equal(["dev0", "dev1", "dev2"]))
+
+        records = archive.query(device="dev1", command="show log")
+        expect(records).to(have_len(50))
+        expect(set([r.device for r in records])).to(equal(set(["dev1"])))
+
+        records = archive.query(contains="Kernel panic")
+        expect([(r.device, r.command) for r in records]).to(equal([("dev1", "show version")]))
+        expect(records[0].output).to(contain("Kernel panic at 0x00ff"))
+        expect(records[0].failed).to(be_true)
+
+        expect(archive.query(regex=r"panic at 0x[0-9a-f]+", device="dev1")).to(have_len(1))
+        expect(archive.query(regex=r"panic at 0x[0-9a-f]+", device="dev0")).to(have_len(0))
+        expect(archive.query(contains="dev2")).to(have_len(0))
+        expect(archive.query(contains="line", limit=7)).to(have_len(7))
+        expect(archive.query(failed=True)).to(have_len(1))
+        expect(archive.query(device="unknown")).to(equal([]))
+
+def test_archive_time_range(archive_path):
+    with ArchiveReader(archive_path) as archive:
+        records = archive.query(since=1000.0 + 10, until=1000.0 + 20)
+        expect([r.timestamp for r in records]).to(equal([1000.0 + i for i in range(10, 20)]))
+        records = archive.query(since=1000.0 + 290, contains="line 291\nline 292")
+        expect([r.id for r in records]).to(equal([291]))
+
+def test_archive_trigrams(archive_path):
+    with ArchiveReader(archive_path, trigrams=True) as archive:
+        expect([r.id for r in archive.query(contains="Kernel panic")]).to(equal([250]))
+        expect([r.id for r in archive.query(contains="line 12\nline 13")]).to(equal([12]))
+        expect(archive.query(contains="not in the archive")).to(equal([]))
+
+def test_archive_refresh(archive_path):
+    with ArchiveReader(archive_path, trigrams=True) as archive:
+        with ArchiveWriter(archive_path) as writer:
+            writer.append("dev3", "uptime", b"up 3 days \xff\n", timestamp=2000.0)
+        expect(archive.query(device="dev3")).to(equal([]))
+        expect(archive.refresh()).to(equal(1))
+        records = archive.query(contains="up 3 days")
+        expect([r.device for r in records]).to(equal(["dev3"]))
+        expect(records[0].raw_output).to(equal(b"up 3 days \xff\n"))
+        expect(archive[300].command).to(equal("uptime"))
+
+def test_core_cli_archives_runs(core_cli, tmp_path):
+    path = str(tmp_path / "session")
+    connection = Mock()
+    terminal = Mock()
+    terminal.expect.side_effect = [0, 1, 0, 0, 0, 0, 1, 0, 0, 3, 0]
+    terminal.sendline = MagicMock(return_value=0)
+    connection.terminal = terminal
+    with ArchiveWriter(path) as writer:
+        cmd = core_cli(connection, device="router", archive=writer)
+        cmd.run("show version")
+        expect(lambda: cmd.run("show bogus")).to(raise_error(AssertionError))
+    with ArchiveReader(path) as archive:
+        expect([(r.device, r.command, r.failed) for r in archive.query()]).to(equal([
+            ("router", "show version", False), ("router", "show bogus", True)]))
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    path = str(tmp_path / "night")
+    with ArchiveWriter(path) as writer:
+        for i in range(300):
+            output = "line {0}\nline {1}\n".format(i, i + 1)
+            if i == 250:
+                output += "Kernel panic at 0x00ff\n"
+            writer.append("dev{}".format(i % 3), "show log" if i % 2 else "show version",
+                          output, timestamp=1000.0 + i, duration=0.5, failed=(i == 250))
+    return path
+
+@pytest.fixture
+def core_cli():
+    class CoreCliExtension(CoreCli):
+        def login(self):
+            pass
+        def logout(self):
+            pass
+        def _get_prompt_size(self):
+            return 3
+    return CoreCliExtension
@@ -0,0 +1,129 @@
+import os
+import stat
+import sys
+import threading
+import time
+
+import pytest
+
+from expects import *
+
+from climatic.cli.Linux import SshLinux
+from climatic.connections.Bastion import Bastion, BastionTelnet
+
+FAKE_SSH = """#!{python}
+import getpass, os, signal, socket, sys, time
+args = sys.argv[1:]
+control = args[args.index("-S") + 1] if "-S" in args else None
+if "-O" in args:
+    # Control commands: the master is up while its socket exists
+    if not os.path.exists(control):
+        sys.exit(255)
+    if args[args.index("-O") + 1] == "exit":
+        with open(control + ".pid") as pid_file:
+            os.kill(int(pid_file.read()), signal.SIGTERM)
+        os.remove(control)
+    sys.exit(0)
+with open(os.environ["FAKE_SSH_LOG"], "a") as log:
+    log.write(" ".join(args) + "\\n")
+if "-M" in args:
+    if getpass.getpass("me@jump's password: ") != "jump-secret":
+        print("Permission denied, please try again.")
+        sys.exit(255)
+    with open(control + ".pid", "w") as pid_file:
+        pid_file.write(str(os.getpid()))
+    socket.socket(socket.AF_UNIX).bind(control)
+    while True:
+        time.sleep(1)
+if "-tt" not in args and getpass.getpass("user@host's password: ") != "secret":
+    print("Permission denied, please try again.")
+    sys.exit(255)
+os.execvp("env", ["env", "PS1=host# ", "sh"])
+"""
+
+
+def test_bastion_shared_by_clis(fake_ssh):
+    bastion = Bastion.get("jump", "me", password="jump-secret")
+    expect(Bastion.get("jump", "me")).to(be(bastion))
+    expect(Bastion.get("jump", "other")).not_to(be(bastion))
+
+    cli1 = SshLinux("10.0.0.1", "user", "secret", bastion=bastion, quiet=True)
+    cli2 = SshLinux("10.0.0.2", "user", "secret", bastion=bastion, quiet=True)
+    expect(cli1.run("echo one").output).to(contain("one"))
+    expect(cli2.run("echo two").output).to(contain("two"))
+    expect(bastion.channels()).to(equal(2))
+
+    with open(fake_ssh) as log:
+        commands = log.read().splitlines()
+    # A single login to the bastion, the device connections are forwarded by it
+    expect([c for c in commands if "-M" in c]).to(have_len(1))
+    expect(commands[1]).to(start_with("-p 22 user@10.0.0.1 -o ProxyCommand=ssh -S " +
+                                      bastion.control_path + " -W %h:%p -p 22 me@jump"))
+
+    cli1.__del__()
+    expect(bastion.channels()).to(equal(1))
+    Bastion.close_all()
+    expect(os.path.exists(bastion.control_path)).to(be_false)
+
+def test_bastion_channels_limit(fake_ssh):
+    bastion = Bastion("jump", "me", password="jump-secret", max_channels=1)
+    cli = SshLinux("10.0.0.1", "user", "secret", bastion=bastion, quiet=True)
+    telnet = BastionTelnet(bastion, "10.0.0.2", "user", channel_timeout=0.3)
+    expect(lambda: telnet.connect(None)).to(raise_error(ConnectionError, contain("in use")))
+
+    # The channel of a connection is freed when its process ends
+    cli.connection.terminal.close(force=True)
+    telnet.connect(None)
+    telnet.terminal.expect("host# ")
+    with open(fake_ssh) as log:
+        expect(log.read().splitlines()[-1]).to(equal(
+            "-S {0} -tt -p 22 me@jump telnet 10.0.0.2 23".format(bastion.control_path)))
+    telnet.terminal.sendline("exit")
+    telnet.disconnect()
+    expect(bastion.channels()).to(equal(0))
+    bastion.close()
+
+def test_bastion_login_failure(fake_ssh):
+    bastion = Bastion("jump", "me", password="wrong")
+    expect(lambda: SshLinux("10.0.0.1", "user", "secret", bastion=bastion, quiet=True)).to(
+        raise_error(ConnectionError, contain("Login to bastion 'me@jump' failed")))
+    bastion.close()
+
+def test_bastion_login_out_of_the_lock(fake_ssh, monkeypatch):
+    bastion = Bastion("jump", "me", password="jump-secret")
+    login = bastion._login
+    started = threading.Event()
+    def slow_login(master):
+        started.set()
+        time.sleep(1)
+        login(master)
+    monkeypatch.setattr(bastion, "_login", slow_login)
+    openers = [threading.Thread(target=bastion.open) for _ in range(2)]
+    for opener in openers:
+        opener.start()
+    expect(started.wait(5)).to(be_true)
+
+    # The channels are released and counted while a thread logs in
+    start = time.time()
+    bastion.close_channel(None)
+    expect(bastion.channels()).to(equal(0))
+    expect(time.time() - start).to(be_below(0.5))
+    for opener in openers:
+        opener.join()
+    with open(fake_ssh) as log:
+        expect([c for c in log.read().splitlines() if "-M" in c]).to(have_len(1))
+    bastion.close()
+
+
+@pytest.fixture
+def fake_ssh(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    path = bin_dir / "ssh"
+    path.write_text(FAKE_SSH.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    log = str(tmp_path / "ssh.log")
+    monkeypatch.setenv("PATH", "{0}{1}{2}".format(bin_dir, os.pathsep, os.environ["PATH"]))
+    monkeypatch.setenv("FAKE_SSH_LOG", log)
+    yield log
+    Bastion.close_all()
@@ -0,0 +1,64 @@
+import pexpect
+import pytest
+import time
+
+from expects import *
+
+from climatic.connections.BufferedSpawn import BufferedSpawn
+from climatic.connections.Connection import Connection
+
+
+BULK_CMD = "sh -c 'head -c 300000 /dev/zero | tr \"\\0\" x; echo; echo done; sleep 5'"
+
+
+def test_buffered_spawn_drains_without_expect():
+    terminal = BufferedSpawn(BULK_CMD, encoding='utf-8')
+    try:
+        wait_for(lambda: terminal.buffered >= 300000)
+        expect(terminal.buffered).to(be_above_or_equal(300000))
+        terminal.expect('done', timeout=5)
+        expect(len(terminal.before)).to(be_above_or_equal(300000))
+    finally:
+        terminal.close()
+
+def test_buffered_spawn_drop_oldest():
+    terminal = BufferedSpawn(BULK_CMD, buffer_size=1000, overflow='drop_oldest')
+    try:
+        wait_for(lambda: terminal.dropped_bytes > 0 and b'done' in terminal._read_buffer)
+        expect(terminal.buffered).to(be_below_or_equal(1000))
+        terminal.expect(b'done', timeout=5)
+    finally:
+        terminal.close()
+
+def test_buffered_spawn_drop_newest():
+    terminal = BufferedSpawn(BULK_CMD, buffer_size=1000, overflow='drop_newest')
+    try:
+        wait_for(lambda: terminal.dropped_bytes >= 299000)
+        expect(terminal.buffered).to(equal(1000))
+        expect(terminal.expect([b'done', pexpect.TIMEOUT], timeout=0.5)).to(equal(1))
+    finally:
+        terminal.close()
+
+def test_buffered_spawn_eof():
+    terminal = BufferedSpawn('echo bye')
+    terminal.expect(pexpect.EOF, timeout=5)
+    expect(terminal.before).to(contain(b'bye'))
+    terminal.close()
+
+def test_buffered_spawn_invalid_overflow():
+    with pytest.raises(ValueError):
+        BufferedSpawn('true', overflow='explode')
+
+def test_connection_spawns_background_reader():
+    connection = Connection(background_reader=True, read_buffer_size=2048)
+    terminal = connection._spawn('echo hello', None)
+    expect(terminal).to(be_a(BufferedSpawn))
+    expect(terminal.buffer_size).to(equal(2048))
+    terminal.expect('hello', timeout=5)
+    terminal.close()
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
@@ -0,0 +1,74 @@
+from expects import *
+from unittest.mock import patch
+
+from climatic.Compare import Comparator, Mask
+from climatic.CoreCli import RunResults
+from climatic.OutputStore import OutputStore
+
+VERSION = """Software version 4.2.1, uptime is 3 days, 4 hours, 12 minutes
+Last reboot: 2024-03-0{0} 10:22:03
+  {1} packets input, {2} bytes
+Serial number {3}
+"""
+
+
+def fleet_version(device: int, release: str = "4.2.1") -> str:
+    output = VERSION.format(device % 9 + 1, device * 7, device * 311, "SN-LAB")
+    return output.replace("4.2.1", release)
+
+
+def test_compare_masks_volatile_fields():
+    comparator = Comparator()
+    for device in range(50):
+        comparator.add("r{0:02}".format(device), "show version", fleet_version(device))
+    comparator.add("r50", "show version", fleet_version(50, release="4.1.9"))
+    comparator.add("r51", "show version", RunResults(1, fleet_version(51, release="4.1.9")))
+
+    comparison = comparator.compare("show version")
+    expect(comparison.clusters).to(have_len(2))
+    expect(comparison.majority.representative).to(equal("r00"))
+    expect(len(comparison.majority)).to(equal(50))
+    expect(comparison.outliers()).to(equal(["r50", "r51"]))
+    expect(comparison.diff("r07")).to(equal([]))
+    expect(comparison.diff("r51")).to(equal([
+        "--- r00", "+++ r50", "@@ -1 +1 @@",
+        "-Software version 4.2.1, uptime is <UPTIME>",
+        "+Software version 4.1.9, uptime is <UPTIME>"]))
+    expect(str(comparison)).to(contain("52 devices",
+                                    "2 device(s): r50, r51"))
+
+def test_compare_diffs_once_per_cluster():
+    comparator = Comparator(masks=[Mask(r"SN-\w+", "<SN>")], context=1)
+    for device in range(300):
+        release = "4.2.1" if device % 3 else "4.3.0"
+        comparator.add("r{0}".format(device), "show version",
+                       fleet_version(0, release=release).encode())
+    with patch("climatic.Compare.difflib.unified_diff", return_value=iter([])) as diff:
+        comparison = comparator.compare("show version")
+    expect(diff.call_count).to(equal(1))
+    expect(comparison.outliers()).to(have_len(100))
+
+def test_compare_custom_masks_and_commands():
+    comparator = Comparator(masks=[str.lower])
+    comparator.add("a", "show clock", "MON 10")
+    comparator.add("b", "show clock", "mon 10")
+    comparator.add("a", "show users", "admin")
+    expect(comparator.commands()).to(equal(["show clock", "show users"]))
+    comparisons = comparator.compare_all()
+    expect(comparisons["show clock"].outliers()).to(equal([]))
+    expect(comparator.compare("show ip route").clusters).to(equal([]))
+
+def test_compare_output_store():
+    store = OutputStore()
+    for device in range(20):
+        store.put("r{0:02}".format(device), "show version", fleet_version(device % 2))
+    store.put("r20", "show version", fleet_version(0, release="5.0.0"))
+    store.put("r00", "show clock", "10:22:03")
+
+    comparator = Comparator()
+    with patch.object(comparator, "normalize", wraps=comparator.normalize) as normalize:
+        expect(comparator.add_store(store)).to(equal(22))
+    # Each distinct stored output is only read and normalized once
+    expect(normalize.call_count).to(equal(4))
+    expect(comparator.compare("show version").outliers()).to(equal(["r20"]))
+    expect(comparator.compare("show clock").majority.lines).to(equal(["<TIME>"]))
@@ -0,0 +1,78 @@
+import pytest
+
+from expects import *
+from unittest.mock import MagicMock
+from unittest.mock import Mock
+
+from climatic import Compression
+from climatic.Compression import DecompressedCache
+from climatic.CoreCli import CoreCli, RunResults
+
+OUTPUT = "".join(["Gi0/{0}    up    up    1000Mb/s full\r\n".format(i) for i in range(200)])
+
+
+def test_run_results_compressed_output():
+    out = RunResults(1, OUTPUT, compress_threshold=1024)
+    expect(out.compressed).to(be_true)
+    expect(out.size).to(equal(len(OUTPUT)))
+    expect(out.stored_size).to(be_below(out.size // 5))
+    expect(out.compression_ratio).to(be_above(5))
+    expect(out.output).to(equal(OUTPUT))
+    expect(out.raw_output).to(equal(OUTPUT))
+
+    out.output = "replaced"
+    expect(out.compressed).to(be_false)
+    expect(out.compression_ratio).to(equal(1.0))
+
+def test_run_results_compression_threshold():
+    out = RunResults(1, "short output", compress_threshold=1024)
+    expect(out.compressed).to(be_false)
+    expect(out.stored_size).to(equal(12))
+
+    raw = b"caf\xc3\xa9 \xff\r\n" * 200
+    out = RunResults(1, raw, errors='ignore')
+    expect(out.compress(threshold=1024, codec='zlib')).to(be_true)
+    expect(out.raw_output).to(equal(raw))
+    expect(out.output).to(equal(u"café \r\n" * 200))
+
+def test_decompressed_cache(monkeypatch):
+    cache = DecompressedCache(size=2)
+    monkeypatch.setattr(Compression, "decompressed_cache", cache)
+    outs = [RunResults(1, OUTPUT + str(i), compress_threshold=0) for i in range(3)]
+    for out in outs + [outs[2], outs[2], outs[0]]:
+        out.output
+    # The third output stays cached, the first one was evicted by the others
+    expect(cache.hits).to(equal(2))
+    expect(cache.misses).to(equal(4))
+
+    expect(lambda: Compression.compress(b"data", "lz4")).to(raise_error(ValueError))
+
+def test_cli_compresses_outputs_after_storing(core_cli):
+    connection = Mock()
+    connection.bytes_mode = False
+    connection.terminal.sendline = MagicMock(return_value=0)
+    indexes = [1, 0, 0, 0]
+    def read_output(*args, **kwargs):
+        if len(indexes) == 1:
+            connection.terminal.logfile_read.write("show interfaces\r\n" + OUTPUT + "#")
+        return indexes.pop(0)
+    connection.terminal.expect.side_effect = read_output
+    archive = Mock()
+    cmd = core_cli(connection, archive=archive, compress_threshold=1024)
+    out = cmd.run("show interfaces")
+    expect(out.compressed).to(be_true)
+    expect(out.output).to(contain("Gi0/199"))
+    # The archive received the output before its compression
+    expect(archive.append.call_args[0][2]).to(equal(out.output))
+
+
+@pytest.fixture
+def core_cli():
+    class CoreCliExtension(CoreCli):
+        def login(self):
+            pass
+        def logout(self):
+            pass
+        def _get_prompt_size(self):
+            return 3
+    return CoreCliExtension
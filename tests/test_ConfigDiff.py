@@ -0,0 +1,123 @@
+import pytest
+
+from expects import *
+from unittest.mock import MagicMock
+from unittest.mock import Mock
+
+from climatic.ConfigDiff import ConfigDiff, parse_config
+from climatic.CoreCli import CoreCli, RunResults
+
+CURRENT = """
+! Last configuration change at 10:00
+hostname router
+interface eth0
+ description uplink
+ ip address 10.0.0.1 255.255.255.0
+ shutdown
+interface eth1
+ description old
+router ospf 1
+ area 0
+  range 10.0.0.0 255.0.0.0
+"""
+
+DESIRED = """
+hostname router
+interface eth0
+ description uplink
+ ip address 10.0.0.2 255.255.255.0
+interface eth1
+ description old
+router ospf 1
+ area 0
+  range 10.0.0.0 255.0.0.0
+  authentication
+ntp server 10.0.0.100
+"""
+
+
+def test_parse_config():
+    nodes = parse_config(CURRENT)
+    expect([node.line for node in nodes]).to(equal(
+        ["hostname router", "interface eth0", "interface eth1", "router ospf 1"]))
+    expect([node.line for node in nodes[1].children]).to(equal(
+        ["description uplink", "ip address 10.0.0.1 255.255.255.0", "shutdown"]))
+    expect(nodes[3].children[0].children[0].line).to(equal("range 10.0.0.0 255.0.0.0"))
+
+def test_config_diff():
+    diff = ConfigDiff(CURRENT, DESIRED)
+    expect(diff.commands).to(equal([
+        "interface eth0",
+        " no ip address 10.0.0.1 255.255.255.0",
+        " no shutdown",
+        " ip address 10.0.0.2 255.255.255.0",
+        " exit",
+        "router ospf 1",
+        " area 0",
+        "  authentication",
+        "  exit",
+        " exit",
+        "ntp server 10.0.0.100"]))
+    expect(diff.added).to(equal(3))
+    expect(diff.removed).to(equal(2))
+    expect(diff.full_size).to(equal(11))
+
+def test_config_diff_blocks():
+    diff = ConfigDiff("vlan 10\n name a\nno ip routing\n", "vlan 20\n name b\nip routing\n",
+                      exit_cmd=None)
+    expect(diff.commands).to(equal(["no vlan 10", "ip routing", "vlan 20", " name b"]))
+    expect(ConfigDiff(CURRENT, CURRENT + "\n! comment\n")).to(have_len(0))
+
+def test_push_config(core_cli):
+    cmd = core_cli(Mock())
+    prompt = "\r\nrouter# "
+    cmd.run = Mock(side_effect=[
+        RunResults(1, "\x1b[?2004hrouter# show running-config\r\n" + CURRENT + prompt),
+        RunResults(1, "configure"),
+        RunResults(1, "router# show running-config\r\n" + DESIRED + prompt)])
+    results = cmd.push_config(DESIRED, config_cmd="configure", end_cmd="end")
+    sent = cmd.run.call_args_list[1][0][0].splitlines()
+    expect(sent[0]).to(equal("configure"))
+    expect(sent[-1]).to(equal("end"))
+    expect(sent).to(have_len(13))
+    expect(results.verified).to(be_true)
+    expect(results.lines_sent).to(equal(11))
+    expect(results.lines_saved).to(equal(0))
+    expect(results.round_trips).to(equal(15))
+    expect(results.round_trips_full).to(equal(13))
+
+def test_push_config_saves_round_trips(core_cli):
+    cmd = core_cli(Mock())
+    config = "".join(["interface eth{0}\n mtu 1500\n".format(i) for i in range(500)])
+    show = lambda config: RunResults(1, "show running-config\r\n" + config + "\r\nrouter# ")
+    cmd.run = Mock(side_effect=[show(config), RunResults(1, ""),
+                                show(config.replace("eth7\n mtu 1500", "eth7\n mtu 9000"))])
+    results = cmd.push_config(config.replace("eth7\n mtu 1500", "eth7\n mtu 9000"))
+    expect(str(results.diff)).to(equal("interface eth7\n no mtu 1500\n mtu 9000\n exit"))
+    expect(results.round_trips).to(equal(6))
+    expect(results.round_trips_saved).to(equal(994))
+
+def test_push_config_verification_fails(core_cli):
+    cmd = core_cli(Mock())
+    show = RunResults(1, "show running-config\r\nhostname a\r\nrouter# ")
+    cmd.run = Mock(side_effect=[show, RunResults(1, ""), show])
+    expect(lambda: cmd.push_config("hostname b")).to(
+        raise_error(AssertionError, contain("hostname b")))
+
+def test_push_config_no_changes(core_cli):
+    cmd = core_cli(Mock())
+    cmd.run = Mock(return_value=RunResults(1, "show running-config\r\nhostname a\r\nrouter# "))
+    results = cmd.push_config("hostname a")
+    expect(cmd.run.call_count).to(equal(1))
+    expect(results.verified).to(be_true)
+    expect(results.lines_sent).to(equal(0))
+
+
+@pytest.fixture
+def core_cli():
+    class CoreCliExtension(CoreCli):
+        def login(self):
+            pass
+        def logout(self):
+            pass
+    return CoreCliExtension
@@ -16,6 +16,39 @@ def test_core_cli_constructor_destructor(core_cli):
     connection.connect.assert_called_once()
     connection.disconnect.assert_called_once()
 
+def test_core_cli_login_running_commands():
+    class LoginRunCli(CoreCli):
+        def login(self):
+            self.login_output = self.run("terminal length 0").output
+            self.reattached = self.connection.terminal.logfile_read is self.login_timeline
+        def logout(self):
+            pass
+        def _get_prompt_size(self):
+            return 3
+    connection = Mock()
+    terminal = Mock()
+    indexes = [1, 0, 0, 0]
+    def stream_output(*args, **kwargs):
+        if len(indexes) == 1:
+            terminal.logfile_read.write("terminal length 0\r\ndev# ")
+        return indexes.pop(0)
+    terminal.expect.side_effect = stream_output
+    connection.terminal = terminal
+    cmd = LoginRunCli(connection)
+    expect(cmd.login_output).to(equal("terminal length 0\r\ndev# "))
+    # The output of the command reached the timeline, which stayed attached until the end
+    expect(list(cmd.login_timeline.phases())).to(equal(["spawn", "banner", "prompt"]))
+    expect(cmd.reattached).to(be_true)
+
+def test_core_cli_reconnect_disconnects_after_close_error(core_cli):
+    connection = Mock()
+    cmd = core_cli(connection)
+    connection.terminal.close.side_effect = OSError("Bad file descriptor")
+    cmd.reconnect()
+    connection.terminal.close.assert_called_once_with(force=True)
+    connection.disconnect.assert_called_once()
+    expect(connection.connect.call_count).to(equal(2))
+
 @pytest.fixture
 def core_cli():
     class CoreCliExtension(CoreCli):
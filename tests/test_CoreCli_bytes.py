@@ -0,0 +1,66 @@
+import pexpect
+import pytest
+import re
+
+from expects import *
+from unittest.mock import MagicMock
+from unittest.mock import Mock
+
+from climatic.CoreCli import CoreCli, RunResults
+
+
+def test_run_bytes_mode_patterns(core_cli, bytes_connection):
+    terminal = bytes_connection.terminal
+    terminal.expect.side_effect = [1, 0, 0, 0]
+    cmd = core_cli(bytes_connection)
+    cmd.run("run this")
+    terminal.sendline.assert_called_with("run this")
+    terminal.expect.assert_any_call(b"#", timeout=2)
+    terminal.expect.assert_any_call(re.escape("run this").encode(), timeout=2)
+    terminal.expect.assert_called_with([b"#", pexpect.TIMEOUT, pexpect.EOF, b"%"], timeout=15)
+
+def test_run_bytes_mode_lazy_output(core_cli, bytes_connection):
+    terminal = bytes_connection.terminal
+    indexes = [1, 0, 0, 0]
+    def read_output(*args, **kwargs):
+        if len(indexes) == 1:
+            terminal.logfile_read.write(b"run this\r\r\ncaf\xc3\xa9 \xff\r\n#")
+        return indexes.pop(0)
+    terminal.expect.side_effect = read_output
+    cmd = core_cli(bytes_connection)
+    out = cmd.run("run this")
+    expect(out.raw_output).to(equal(b"run this\r\ncaf\xc3\xa9 \xff\r\n#"))
+    expect(out.output).to(equal(u"run this\r\ncafé �\r\n#"))
+
+def test_run_results_decoding_policy():
+    out = RunResults(1, b"bad \xff byte", errors='ignore')
+    expect(out.output).to(equal("bad  byte"))
+    out = RunResults(1, b"bad \xff byte", errors='strict')
+    with pytest.raises(UnicodeDecodeError):
+        out.output
+
+def test_run_results_text_output():
+    out = RunResults(1, "text")
+    expect(out.output).to(be(out.raw_output))
+
+@pytest.fixture
+def bytes_connection():
+    connection = Mock()
+    connection.bytes_mode = True
+    connection.encoding = 'utf-8'
+    connection.codec_errors = 'replace'
+    terminal = Mock()
+    terminal.sendline = MagicMock(return_value=0)
+    connection.terminal = terminal
+    return connection
+
+@pytest.fixture
+def core_cli():
+    class CoreCliExtension(CoreCli):
+        def login(self):
+            pass
+        def logout(self):
+            pass
+        def _get_prompt_size(self):
+            return 3
+    return CoreCliExtension
@@ -107,6 +107,83 @@ def test_cli_custom_params(core_cli):
     expect(out[2].output).to(contain("expect this\r\n\r\nand that"))
 
 
+def test_cli_fail_fast_monitor(core_cli):
+    connection = Mock()
+    cmd = core_cli(connection)
+    cmd.run = Mock()
+    cmd.run.side_effect = [RunResults(1, "first interface   200 Mbps")]
+    cmd.cli(r"""
+        os#show interfaces
+        first interface   \d+ Mbps
+        """, fail_fast=True, forbidden=["Error"], timeout=60)
+    monitor = cmd.run.call_args[1]['monitor']
+    expect(cmd.run.call_args[1]['timeout']).to(equal(60))
+    expect([p.pattern for p in monitor.expected_lines]).to(equal([r"first interface   \d+ Mbps"]))
+    expect([p.pattern for p in monitor.forbidden]).to(equal(["Error"]))
+
+def test_cli_fail_fast_aborts_command(core_cli):
+    connection = Mock()
+    terminal = Mock()
+    indexes = [1, 0, 0, 0]
+    def stream_output(*args, **kwargs):
+        if len(indexes) == 1:
+            terminal.logfile_read.write("show interfaces\r\nsecond interface   100 Mbps\r\n")
+        return indexes.pop(0)
+    terminal.expect.side_effect = stream_output
+    connection.terminal = terminal
+    cmd = core_cli(connection)
+    with pytest.raises(AssertionError) as error:
+        cmd.cli(r"""
+            os#show interfaces
+            first interface   \d+ Mbps
+            """, fail_fast=True, timeout=120)
+    expect(str(error.value)).to(contain("Expected line 'first interface   \\d+ Mbps' is missing"))
+    expect(str(error.value)).to(contain("saving up to"))
+    terminal.sendcontrol.assert_called_once_with('c')
+
+def test_cli_fail_fast_abort_ignores_leftover_output(core_cli):
+    connection = Mock()
+    terminal = Mock()
+    indexes = [1, 0, 0, 0, 1, 0]
+    def stream_output(*args, **kwargs):
+        index = indexes.pop(0)
+        if len(indexes) == 2:
+            terminal.logfile_read.write("show interfaces\r\nsecond interface   100 Mbps\r\n")
+        if len(indexes) == 1:
+            # Leftover output after the first Ctrl-C, which does not interrupt the command
+            terminal.logfile_read.write("^C\r\nthird interface   10 Mbps\r\n")
+        return index
+    terminal.expect.side_effect = stream_output
+    connection.terminal = terminal
+    cmd = core_cli(connection)
+    with pytest.raises(AssertionError) as error:
+        cmd.cli(r"""
+            os#show interfaces
+            first interface   \d+ Mbps
+            """, fail_fast=True)
+    expect(str(error.value)).to(contain("Expected line 'first interface   \\d+ Mbps'"))
+    # Ctrl-C is sent again, and the abort waits for the prompt
+    expect(terminal.sendcontrol.call_count).to(equal(2))
+    expect(indexes).to(equal([]))
+
+def test_cli_forbidden_aborts_command(core_cli):
+    connection = Mock()
+    terminal = Mock()
+    indexes = [1, 0, 0, 0]
+    def stream_output(*args, **kwargs):
+        if len(indexes) == 1:
+            terminal.logfile_read.write("copy Error\r\nCopying...\r\nError: disk full\r\n")
+        return indexes.pop(0)
+    terminal.expect.side_effect = stream_output
+    connection.terminal = terminal
+    cmd = core_cli(connection)
+    with pytest.raises(AssertionError) as error:
+        cmd.cli("os#copy Error", forbidden=["Error:"])
+    expect(str(error.value)).to(contain("Forbidden pattern 'Error:' found in line "
+                                        "'Error: disk full'"))
+    terminal.sendcontrol.assert_called_once_with('c')
+
+
 @pytest.fixture
 def core_cli():
     class CoreCliExtension(CoreCli):
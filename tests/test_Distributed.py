@@ -0,0 +1,118 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from expects import *
+
+from climatic.CoreCli import RunResults, SessionError
+from climatic.Distributed import Coordinator, recv_message, send_message
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class FakeCli(object):
+    """ Session opened by the workers: the output tells the device and the worker process.
+    """
+
+    def __init__(self, device):
+        self.device = device
+
+    def run(self, cmds, delay=0):
+        if cmds == "fail":
+            raise AssertionError("'fail' failed on {0}".format(self.device))
+        if cmds == "lost":
+            raise SessionError("Session lost on {0}".format(self.device))
+        time.sleep(delay)
+        return RunResults(delay, "{0} {1} {2}".format(self.device, os.getpid(), cmds))
+
+    def cli(self, cmds):
+        return [self.run(cmd) for cmd in cmds.splitlines()]
+
+
+def open_fake_cli(device):
+    return FakeCli(device)
+
+
+def test_protocol_messages():
+    (left, right) = socket.socketpair()
+    sender = threading.Thread(target=send_message, args=(left, {"cmds": "é" * 100000}))
+    sender.start()
+    expect(recv_message(right)).to(equal({"cmds": "é" * 100000}))
+    sender.join()
+    left.close()
+    expect(recv_message(right)).to(be_none)
+
+def test_coordinator_device_affinity(coordinator, workers):
+    devices = ["dev{0}".format(i) for i in range(12)]
+    first = coordinator.run_all(devices, "uptime", timeout=10)
+    second = coordinator.run_all(devices, "uname", timeout=10)
+    for device in devices:
+        (name, pid, cmd) = first[device].output.split()
+        expect(name).to(equal(device))
+        expect(second[device].output.split()[1]).to(equal(pid))
+    expect([len(w['devices']) for w in coordinator.workers().values()]).to(equal([4, 4, 4]))
+    expect(set([r.output.split()[1] for r in first.values()])).to(have_len(3))
+
+def test_coordinator_cli_and_errors(coordinator, workers):
+    results = coordinator.cli("dev0", "cmd1\ncmd2").result(timeout=10)
+    expect([r.output.split()[2] for r in results]).to(equal(["cmd1", "cmd2"]))
+    failure = coordinator.run("dev0", "fail").exception(timeout=10)
+    expect(failure).to(be_an(AssertionError))
+    expect(str(failure)).to(contain("failed on dev0"))
+    # Not built-in errors arrive as their nearest built-in base
+    lost = coordinator.run("dev0", "lost").exception(timeout=10)
+    expect(lost).to(be_an(AssertionError))
+    expect(str(lost)).to(equal("SessionError: Session lost on dev0"))
+
+def test_coordinator_silent_client(coordinator):
+    # A client that never introduces itself does not delay the workers registration
+    silent = socket.create_connection(coordinator.address)
+    worker = socket.create_connection(coordinator.address)
+    send_message(worker, {"type": "hello", "name": "worker-1"})
+    expect(coordinator.wait_for_workers(1, timeout=2)).to(be_true)
+    silent.close()
+    worker.close()
+
+def test_coordinator_rebalances_on_worker_death(coordinator, workers):
+    devices = ["dev{0}".format(i) for i in range(6)]
+    coordinator.run_all(devices, "uptime", timeout=10)
+    victim = coordinator.worker_of("dev0")
+    slow = coordinator.run("dev0", "slow", delay=2)
+    time.sleep(0.5)
+    process = [p for p in workers if victim.endswith(":{0}".format(p.pid))][0]
+    process.kill()
+
+    results = slow.result(timeout=10)
+    expect(results.output.split()[1]).not_to(equal(str(process.pid)))
+    expect(coordinator.workers()).to(have_len(2))
+    expect(coordinator.worker_of("dev0")).not_to(equal(victim))
+    after = coordinator.run_all(devices, "uptime", timeout=10)
+    expect([type(r) for r in after.values()]).to(equal([RunResults] * 6))
+
+
+@pytest.fixture
+def coordinator():
+    coordinator = Coordinator(port=0)
+    yield coordinator
+    coordinator.shutdown()
+
+@pytest.fixture
+def workers(coordinator):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [os.path.dirname(TESTS_DIR), TESTS_DIR, os.environ.get('PYTHONPATH', '')]))
+    address = "{0}:{1}".format(*coordinator.address)
+    processes = [subprocess.Popen([sys.executable, "-m", "climatic.Distributed", address,
+                                   "test_Distributed:open_fake_cli"], env=env)
+                 for _ in range(3)]
+    try:
+        expect(coordinator.wait_for_workers(3, timeout=20)).to(be_true)
+        yield processes
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
@@ -0,0 +1,122 @@
+import json
+
+import pexpect
+import pytest
+
+from expects import *
+from unittest.mock import Mock
+
+from climatic.Journal import Journal
+from climatic.cli.Linux import Linux
+from climatic.connections.Connection import Connection
+
+
+def test_journal_records_and_torn_record(tmp_path):
+    path = str(tmp_path / "push.journal")
+    with Journal(path) as journal:
+        journal.begin("r1", ["a", "b", "c"])
+        journal.record(0, "a", 0.1, "out a", [0])
+        journal.record(1, "b", 0.2, "out b")
+    with open(path, "a") as journal_file:
+        journal_file.write('{"type": "done", "index": 2, "comm')
+
+    with Journal(path) as journal:
+        expect(journal.device).to(equal("r1"))
+        expect(sorted(journal.completed())).to(equal([0, 1]))
+        expect(journal.completed()[0]["exit_codes"]).to(equal([0]))
+        journal.begin("r1", ["a", "b", "c"])
+        journal.record(2, "c", 0.1, "out c")
+        journal.end()
+        expect(lambda: journal.begin("r1", ["a", "b"])).to(raise_error(ValueError))
+        expect(lambda: journal.begin("r2", ["a", "b", "c"])).to(raise_error(ValueError))
+    with open(path) as journal_file:
+        entries = [json.loads(line) for line in journal_file]
+    expect([entry["type"] for entry in entries]).to(equal(["begin", "done", "done", "done", "end"]))
+
+def test_run_journaled_reconnects_and_resumes(local_linux, tmp_path):
+    side_effects = tmp_path / "applied"
+    drop = tmp_path / "dropped"
+    script = """
+        echo 1 >> {0}
+        [ -e {1} ] || {{ touch {1}; kill -9 $$; }}
+        echo 2 >> {0}
+        """.format(side_effects, drop)
+    journal = str(tmp_path / "push.journal")
+    cli = local_linux(framed=True)
+    is_applied = Mock(return_value=False)
+    results = cli.run_journaled(script, journal, is_applied=is_applied, reconnect_delay=0,
+                                timeout=5)
+    expect(results).to(have_len(3))
+    expect([r.exit_codes for r in results]).to(equal([[0], [0], [0]]))
+    # Only the command in flight during the drop was checked, then run again
+    expect(is_applied.call_count).to(equal(1))
+    expect(is_applied.call_args[0][1]).to(start_with("[ -e"))
+    expect(side_effects.read_text()).to(equal("1\n2\n"))
+
+    # A completed journal is not run again
+    expect(cli.run_journaled(script, journal)[2].exit_codes).to(equal([0]))
+    expect(side_effects.read_text()).to(equal("1\n2\n"))
+
+def test_run_journaled_resumes_an_interrupted_script(local_linux, tmp_path):
+    side_effects = tmp_path / "applied"
+    commands = ["echo {0} >> {1}".format(i, side_effects) for i in range(4)]
+    path = str(tmp_path / "push.journal")
+    with Journal(path) as journal:
+        journal.begin("host", commands)
+        journal.record(0, commands[0], 0.1, "")
+        journal.record(1, commands[1], 0.1, "")
+    cli = local_linux(framed=True, device="host")
+    applied = Mock(return_value=True)
+    results = cli.run_journaled("\n".join(commands), path, is_applied=applied)
+    expect(results).to(have_len(4))
+    # The first pending command was found applied, so only the last one ran
+    expect(side_effects.read_text()).to(equal("3\n"))
+    with Journal(path) as journal:
+        expect(journal.completed()[2]["skipped"]).to(be_true)
+
+def test_run_journaled_retries_a_failed_reconnection(local_linux, tmp_path):
+    cli = local_linux(framed=True)
+    reconnect = cli.reconnect
+    attempts = []
+    def flaky_reconnect():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise pexpect.EOF("device still rebooting")
+        reconnect()
+    cli.reconnect = flaky_reconnect
+    results = cli.run_journaled("echo ok\n[ -e {0} ] || {{ touch {0}; kill -9 $$; }}".format(
+        tmp_path / "dropped"), str(tmp_path / "journal"), reconnect_delay=0, timeout=5)
+    expect(attempts).to(equal([0, 1]))
+    expect(results[1].exit_codes).to(equal([0]))
+
+def test_run_journaled_gives_up_after_max_reconnects(local_linux, tmp_path):
+    cli = local_linux(framed=True)
+    with pytest.raises(AssertionError):
+        cli.run_journaled("echo ok\nkill -9 $$", str(tmp_path / "journal"), max_reconnects=1,
+                          reconnect_delay=0, timeout=5)
+    with Journal(str(tmp_path / "journal")) as journal:
+        expect(journal.completed()).to(have_len(1))
+
+
+@pytest.fixture
+def local_linux():
+    class LocalShell(Connection):
+        def connect(self, logfile, logger=None):
+            self.terminal = self._spawn('env PS1="host# " sh', logfile)
+        def disconnect(self, logger=None):
+            self.terminal.close()
+
+    class LocalLinux(Linux):
+        def login(self):
+            self.connection.terminal.expect(self._terminal_pattern(self.marker), timeout=5)
+        def logout(self):
+            self.connection.terminal.sendline('exit')
+
+    clis = []
+    def create(**opts):
+        cli = LocalLinux(LocalShell(), marker="# ", quiet=True, **opts)
+        clis.append(cli)
+        return cli
+    yield create
+    for cli in clis:
+        cli.connection.terminal.close()
@@ -0,0 +1,128 @@
+import pexpect
+import pytest
+import re
+import time
+
+from expects import *
+from unittest.mock import MagicMock
+from unittest.mock import Mock
+
+from climatic.cli.Linux import Linux
+from climatic.connections.Connection import Connection
+
+
+def test_framed_run_sentinels(linux):
+    connection = Mock()
+    terminal = Mock()
+    terminal.before = "output\r\n"
+    terminal.match.group.return_value = "3"
+    connection.terminal = terminal
+    cmd = linux(connection, framed=True)
+    out = cmd.run("  false \t")
+    frame_id = cmd._frame_session + "-2"
+    terminal.sendline.assert_called_with(
+        "printf '<<%s:%s>>\\n' B {0}; eval 'false'; "
+        "printf '\\n<<%s:%s:%s>>\\n' E {0} \"$?\"".format(frame_id))
+    terminal.expect.assert_any_call(r"<<B:{0}>>\r?\n".format(frame_id), timeout=15)
+    terminal.expect.assert_called_with(r"\r?\n<<E:{0}:(\d+)>>".format(frame_id), timeout=15)
+    expect(out.output).to(equal("output\r\n"))
+    expect(out.exit_codes).to(equal([3]))
+
+def test_framed_run_quotes(linux):
+    connection = Mock()
+    connection.terminal.before = ""
+    connection.terminal.match.group.return_value = "0"
+    cmd = linux(connection)
+    cmd.run("echo 'a b'", framed=True)
+    expect(connection.terminal.sendline.call_args[0][0]).to(contain("eval 'echo '\\''a b'\\'''"))
+
+def test_framed_run_timeout(linux):
+    connection = Mock()
+    connection.terminal.expect.side_effect = [0, 0, pexpect.TIMEOUT("")]
+    cmd = linux(connection, framed=True)
+    with pytest.raises(AssertionError):
+        cmd.run("sleep 100", timeout=1)
+
+def test_framed_run_local_shell(local_linux):
+    cmd = local_linux(framed=True)
+    out = cmd.run("""
+        echo '# not a prompt'
+        false
+        cd /tmp; pwd
+        printf 'no line break'
+        """)
+    expect(out.output).to(equal("# not a prompt\r\n/tmp\r\nno line break"))
+    expect(out.exit_codes).to(equal([0, 1, 0, 0]))
+
+def test_framed_run_local_shell_bytes_mode(local_linux):
+    cmd = local_linux(framed=True, bytes_mode=True)
+    out = cmd.run("printf 'caf\\303\\251\\377'")
+    expect(out.raw_output).to(equal(b"caf\xc3\xa9\xff"))
+    expect(out.output).to(equal(u"café�"))
+
+def test_connection_codec_errors():
+    expect(Connection().codec_errors).to(equal("strict"))
+    expect(Connection(bytes_mode=True).codec_errors).to(equal("replace"))
+    expect(Connection(codec_errors="ignore").codec_errors).to(equal("ignore"))
+
+def test_run_parallel_local_shell(local_linux):
+    cmd = local_linux()
+    start = time.time()
+    results = cmd.run_parallel("""
+        sleep 1; echo 'first done'
+        sleep 1; echo second >&2; exit 3
+        echo third
+        """, poll_interval=0.1)
+    expect(time.time() - start).to(be_below(1.9))
+    expect([r.output for r in results]).to(equal(["first done\r\n", "second\r\n", "third\r\n"]))
+    expect([r.exit_codes for r in results]).to(equal([[0], [3], [0]]))
+    expect(results[2].duration).to(be_below(results[0].duration))
+    expect(cmd.run("echo alive", framed=True).output).to(equal("alive\r\n"))
+
+def test_run_parallel_many_jobs(local_linux):
+    cmd = local_linux()
+    # Longer than the terminal input line limit, once joined
+    jobs = ["echo {0} {1}".format(index, "x" * 200) for index in range(30)]
+    results = cmd.run_parallel("\n".join(jobs), poll_interval=0.1, timeout=10)
+    expect([r.output.split()[0] for r in results]).to(equal([str(i) for i in range(30)]))
+
+def test_run_parallel_timeout(local_linux):
+    cmd = local_linux()
+    with pytest.raises(AssertionError, match="sleep 10"):
+        cmd.run_parallel("sleep 10\necho fast", poll_interval=0.1, timeout=1)
+    expect(cmd.run("echo alive", framed=True).output).to(equal("alive\r\n"))
+    # The kill helper is not left in the shell
+    expect(cmd.run("type _climatic_kill", framed=True).exit_codes).not_to(equal([0]))
+
+
+@pytest.fixture
+def linux():
+    class LinuxExtension(Linux):
+        def login(self):
+            pass
+        def logout(self):
+            pass
+    return LinuxExtension
+
+@pytest.fixture
+def local_linux():
+    class LocalShell(Connection):
+        def connect(self, logfile, logger=None):
+            self.terminal = self._spawn('env PS1="host# " sh', logfile)
+        def disconnect(self, logger=None):
+            self.terminal.close()
+
+    class LocalLinux(Linux):
+        def login(self):
+            self.connection.terminal.expect(self._terminal_pattern(self.marker), timeout=5)
+        def logout(self):
+            self.connection.terminal.sendline('exit')
+
+    clis = []
+    def create(bytes_mode=False, **opts):
+        cli = LocalLinux(LocalShell(bytes_mode=bytes_mode), marker="# ", quiet=True, **opts)
+        clis.append(cli)
+        return cli
+    yield create
+    for cli in clis:
+        cli.connection.terminal.close()
@@ -0,0 +1,108 @@
+import pytest
+
+from expects import *
+from unittest.mock import MagicMock
+from unittest.mock import Mock
+
+from climatic.CoreCli import CoreCli
+from climatic.OutputStore import OutputStore
+
+
+def test_output_store_deduplicates():
+    store = OutputStore()
+    keys = [store.put("dev{}".format(i), "uname", "Linux 5.10\r\n") for i in range(100)]
+    store.put("dev100", "uname", "Linux 6.1\r\n")
+    expect(set(keys)).to(have_len(1))
+    expect(store.output("dev42", "uname")).to(equal("Linux 5.10\r\n"))
+    expect(store.lookup("dev42", "uptime")).to(be_none)
+    stats = store.stats()
+    expect(stats['references']).to(equal(101))
+    expect(stats['blobs']).to(equal(2))
+    expect(stats['stored_size']).to(be_below(stats['raw_size']))
+
+def test_output_store_group_by_output():
+    store = OutputStore()
+    for i in range(5):
+        store.put("dev{}".format(i), "show version", "1.0")
+    store.put("dev5", "show version", "2.0")
+    store.put("dev0", "show clock", "12:00")
+    groups = store.group_by_output("show version")
+    expect(list(groups.values())).to(equal([["dev0", "dev1", "dev2", "dev3", "dev4"], ["dev5"]]))
+    expect(store.get(list(groups)[1])).to(equal("2.0"))
+
+def test_output_store_chunking():
+    config = "".join(["interface eth{0}\n  mtu 1500\n".format(i) for i in range(2000)])
+    chunked = OutputStore(chunking=True)
+    whole = OutputStore()
+    for i in range(5):
+        for store in (chunked, whole):
+            store.put("dev{}".format(i), "show config", "hostname dev{}\n".format(i) + config)
+    stats = chunked.stats()
+    expect(stats['blobs']).to(equal(5))
+    expect(stats['chunks']).to(be_above(5))
+    expect(stats['stored_size']).to(be_below(whole.stats()['stored_size']))
+    expect(chunked.output("dev1", "show config")).to(equal("hostname dev1\n" + config))
+
+def test_output_store_bytes_and_normalize():
+    store = OutputStore(normalize=lambda output: output.replace(b"dev1", b"dev0"))
+    key0 = store.put("dev0", "cmd", b"dev0 \xff")
+    key1 = store.put("dev1", "cmd", b"dev1 \xff")
+    expect(key0).to(equal(key1))
+    expect(store.get_bytes(key0)).to(equal(b"dev0 \xff"))
+
+def test_output_store_persistence(tmp_path):
+    store = OutputStore(path=str(tmp_path), chunking=True)
+    store.put("dev0", "cmd", "output 0")
+    store.put("dev0", "cmd", "output 1")
+    reloaded = OutputStore(path=str(tmp_path), chunking=True)
+    expect(reloaded.output("dev0", "cmd")).to(equal("output 1"))
+    expect(reloaded.devices()).to(equal(["dev0"]))
+
+def test_core_cli_stores_run_output(core_cli):
+    connection = Mock()
+    connection.ip = "10.0.0.1"
+    connection.port = 22
+    terminal = Mock()
+    terminal.expect.side_effect = [1, 0, 0, 0]
+    terminal.sendline = MagicMock(return_value=0)
+    connection.terminal = terminal
+    store = OutputStore()
+    cmd = core_cli(connection, output_store=store)
+    out = cmd.run("run this")
+    expect(cmd.device).to(equal("10.0.0.1:22"))
+    expect(out.digest).to(equal(store.lookup("10.0.0.1:22", "run this")))
+
+def test_core_cli_stores_output_without_echo_and_prompt(core_cli):
+    store = OutputStore()
+    for device in ("dev0", "dev1"):
+        connection = Mock()
+        terminal = Mock()
+        indexes = [1, 0, 0, 0]
+        def stream_output(*args, **kwargs):
+            if len(indexes) == 1:
+                terminal.logfile_read.write(
+                    "show version\r\nversion 1.0\r\n{0}# ".format(device))
+            return indexes.pop(0)
+        terminal.expect.side_effect = stream_output
+        connection.terminal = terminal
+        cmd = core_cli(connection, device=device, output_store=store)
+        # The multi-line form, as the commands are usually written
+        out = cmd.run("""
+            show version
+            """)
+        expect(out.output).to(end_with("{0}# ".format(device)))
+    expect(store.stats()['blobs']).to(equal(1))
+    expect(store.group_by_output("show version")).to(have_len(1))
+    expect(store.output("dev1", "show version")).to(equal("version 1.0\r\n"))
+
+
+@pytest.fixture
+def core_cli():
+    class CoreCliExtension(CoreCli):
+        def login(self):
+            pass
+        def logout(self):
+            pass
+        def _get_prompt_size(self):
+            return 3
+    return CoreCliExtension
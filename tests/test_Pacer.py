@@ -0,0 +1,87 @@
+import pexpect
+import pytest
+import time
+
+from expects import *
+from unittest.mock import MagicMock
+from unittest.mock import Mock
+
+from climatic.CoreCli import CoreCli
+from climatic.connections.Connection import Connection
+from climatic.connections.Pacer import Pacer
+
+
+def test_pacer_limits_rate():
+    pacer = Pacer(2000, burst=100)
+    start = time.monotonic()
+    for chunk in pacer.chunks(b"x" * 1100):
+        expect(len(chunk)).to(be_below_or_equal(100))
+        pacer.consume(len(chunk))
+    elapsed = time.monotonic() - start
+    # The first burst is sent right away
+    expect(elapsed).to(be_above(0.45))
+    expect(elapsed).to(be_below(1.0))
+    expect(pacer.bytes_sent).to(equal(1100))
+
+def test_pacer_attach():
+    terminal = Mock()
+    terminal.delaybeforesend = 0.05
+    sent = []
+    terminal.send = lambda s: sent.append((s, terminal.delaybeforesend)) or len(s)
+    Pacer(100000, burst=4).attach(terminal)
+    expect(terminal.send("0123456789")).to(equal(10))
+    expect(sent).to(equal([("0123", 0.05), ("4567", None), ("89", None)]))
+    expect(terminal.delaybeforesend).to(equal(0.05))
+
+def test_pacer_adaptive():
+    pacer = Pacer(960, adaptive=True)
+    pacer.report_echo(2.0)
+    pacer.report_echo(None)
+    expect(pacer.rate).to(equal(240))
+    expect(pacer.backoffs).to(equal(2))
+    for _ in range(10):
+        pacer.report_echo(0.01)
+    expect(pacer.rate).to(equal(960))
+    for _ in range(10):
+        pacer.report_echo(None)
+    expect(pacer.rate).to(equal(60))
+    fixed = Pacer(960)
+    fixed.report_echo(None)
+    expect(fixed.rate).to(equal(960))
+
+def test_connection_paces_terminal():
+    connection = Connection(pace_rate=1000, pace_burst=50)
+    terminal = connection._spawn("cat", None)
+    try:
+        start = time.time()
+        terminal.sendline("x" * 299)
+        expect(time.time() - start).to(be_above(0.2))
+        terminal.expect("x" * 299 + "\r\n", timeout=5)
+        expect(connection.pacer.bytes_sent).to(equal(300))
+    finally:
+        terminal.close()
+
+def test_core_cli_reports_echo_lag(core_cli):
+    connection = Mock()
+    connection.pacer = Pacer(960, adaptive=True)
+    terminal = Mock()
+    terminal.expect.side_effect = [0, 1, 0, 0, 0, 1, 0, pexpect.TIMEOUT("echo")]
+    terminal.sendline = MagicMock(return_value=0)
+    connection.terminal = terminal
+    cmd = core_cli(connection)
+    cmd.run("run this")
+    expect(connection.pacer.backoffs).to(equal(0))
+    expect(lambda: cmd.run("run this")).to(raise_error(pexpect.TIMEOUT))
+    expect(connection.pacer.rate).to(equal(480))
+
+
+@pytest.fixture
+def core_cli():
+    class CoreCliExtension(CoreCli):
+        def login(self):
+            pass
+        def logout(self):
+            pass
+        def _get_prompt_size(self):
+            return 3
+    return CoreCliExtension
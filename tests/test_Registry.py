@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+from expects import *
+from unittest.mock import Mock
+
+from climatic.cli.Linux import SshLinux
+from climatic.connections import Registry
+from climatic.connections.Registry import ConnectionRegistry
+from climatic.connections.Ssh import Ssh
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_registry_builtin_connections():
+    registry = ConnectionRegistry()
+    expect(registry.get("ssh")).to(be(Ssh))
+    connection = registry.create("ssh", "10.0.0.1", "user", port=2222)
+    expect(connection).to(be_an(Ssh))
+    expect(connection.port).to(equal(2222))
+    expect(lambda: registry.get("carrier-pigeon")).to(
+        raise_error(ValueError, contain("Available types: bastion-ssh")))
+
+def test_registry_entry_points(monkeypatch):
+    entry_point = Mock(value="climatic.connections.Ser2Net:Ser2Net")
+    entry_point.name = "console-server"
+    discover = Mock(return_value=[entry_point])
+    monkeypatch.setattr(Registry, "_entry_points", discover)
+    registry = ConnectionRegistry()
+    registry.register("my-ssh", Ssh)
+    expect(registry.get("my-ssh")).to(be(Ssh))
+    expect(discover.called).to(be_false)
+
+    expect(registry.get("console-server").__name__).to(equal("Ser2Net"))
+    expect(registry.names()).to(contain("console-server", "my-ssh", "telnet"))
+    discover.assert_called_once_with("climatic.connections")
+
+def test_ssh_linux_connection_from_registry(monkeypatch):
+    class MySsh(Ssh):
+        def connect(self, logfile, logger=None):
+            raise OSError("connect {0}".format(self.ip))
+    registry = ConnectionRegistry()
+    registry.register("my-ssh", MySsh)
+    monkeypatch.setattr(Registry, "registry", registry)
+    expect(lambda: SshLinux("10.0.0.1", "user", "password", connection_type="my-ssh")).to(
+        raise_error(OSError, "connect 10.0.0.1"))
+
+def test_lazy_imports():
+    # The optional dependencies and the unused backends are only imported on first use
+    lazy = ["expects", "concurrent.futures", "subprocess", "json", "zstandard",
+            "climatic.Compression", "climatic.ConfigDiff", "climatic.Journal",
+            "climatic.StreamCheck", "climatic.connections.Bastion",
+            "climatic.connections.BufferedSpawn", "climatic.connections.Pacer",
+            "climatic.connections.Telnet", "climatic.connections.TelnetSpawn"]
+    script = ("import sys\nfrom climatic.cli.Linux import SshLinux\n"
+              "print([m for m in {0} if m in sys.modules])".format(lazy))
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.check_output([sys.executable, "-c", script], env=env,
+                                     universal_newlines=True)
+    expect(output.strip()).to(equal("[]"))
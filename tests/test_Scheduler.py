@@ -0,0 +1,102 @@
+import pytest
+import threading
+import time
+
+from concurrent.futures import CancelledError
+from expects import *
+from unittest.mock import Mock
+
+from climatic.CoreCli import RunResults
+from climatic.Scheduler import SessionScheduler, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+
+
+def test_scheduler_priority_order(blocked_scheduler):
+    scheduler, cli, release = blocked_scheduler
+    futures = [scheduler.run("bulk", priority=PRIORITY_LOW),
+               scheduler.run("normal"),
+               scheduler.run("health", priority=PRIORITY_HIGH),
+               scheduler.run("normal 2", priority=PRIORITY_NORMAL)]
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    expect(cli.executed).to(equal(["block", "health", "normal", "normal 2", "bulk"]))
+    expect(futures[2].result().output).to(equal("health"))
+
+def test_scheduler_cancel_pending(blocked_scheduler):
+    scheduler, cli, release = blocked_scheduler
+    high = scheduler.run("health", priority=PRIORITY_HIGH)
+    low = [scheduler.run("bulk", priority=PRIORITY_LOW) for _ in range(3)]
+    expect(scheduler.pending()).to(equal(4))
+    expect(scheduler.cancel_pending(min_priority=PRIORITY_NORMAL)).to(equal(3))
+    release.set()
+    expect(high.result(timeout=5).output).to(equal("health"))
+    for future in low:
+        with pytest.raises(CancelledError):
+            future.result()
+    expect(scheduler.metrics()['cancelled']).to(equal(3))
+
+def test_scheduler_exception_and_metrics():
+    cli = Mock()
+    cli.run.side_effect = [RunResults(0, "ok"), AssertionError("Timeout")]
+    with SessionScheduler(cli) as scheduler:
+        ok = scheduler.run("first")
+        failure = scheduler.run("second", timeout=3)
+        expect(ok.result(timeout=5).output).to(equal("ok"))
+        with pytest.raises(AssertionError):
+            failure.result(timeout=5)
+    cli.run.assert_called_with("second", timeout=3)
+    metrics = scheduler.metrics()
+    expect(metrics['completed']).to(equal(1))
+    expect(metrics['failed']).to(equal(1))
+    expect(metrics['queue_wait']['count']).to(equal(2))
+    expect(metrics['queue_wait_by_priority']).to(have_key(PRIORITY_NORMAL))
+    expect(metrics['running_for']).to(be_none)
+
+def test_scheduler_serializes_threads():
+    cli = FakeCli()
+    scheduler = SessionScheduler(cli)
+    threads = [threading.Thread(target=lambda i=i: scheduler.run("cmd {}".format(i)).result())
+               for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.shutdown()
+    expect(cli.max_concurrency).to(equal(1))
+    expect(len(cli.executed)).to(equal(20))
+
+def test_scheduler_rejects_after_shutdown():
+    scheduler = SessionScheduler(FakeCli())
+    scheduler.shutdown()
+    with pytest.raises(RuntimeError):
+        scheduler.run("late")
+
+
+class FakeCli(object):
+    def __init__(self, release=None):
+        self.executed = []
+        self.release = release
+        self.concurrency = 0
+        self.max_concurrency = 0
+
+    def run(self, cmds, **run_opts):
+        self.concurrency += 1
+        self.max_concurrency = max(self.max_concurrency, self.concurrency)
+        if cmds == "block":
+            self.release.wait(5)
+        time.sleep(0.001)
+        self.executed.append(cmds)
+        self.concurrency -= 1
+        return RunResults(0, cmds)
+
+@pytest.fixture
+def blocked_scheduler():
+    release = threading.Event()
+    cli = FakeCli(release)
+    scheduler = SessionScheduler(cli)
+    scheduler.run("block")
+    while scheduler.metrics()['running_for'] == None:
+        time.sleep(0.001)
+    yield scheduler, cli, release
+    release.set()
+    scheduler.shutdown()
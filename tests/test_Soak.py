@@ -0,0 +1,65 @@
+import pytest
+import time
+
+from expects import *
+
+from climatic.CoreCli import RunResults
+from climatic.Soak import Soak, SoakReport
+
+
+def test_soak_samples():
+    clis = [FakeCli(), FakeCli(fail_on="bad")]
+    report = Soak(clis, ["show version", "bad"], duration=0.35, sample_interval=0.1,
+                  timeout=3).run()
+    expect(len(report.samples)).to(be_within(3, 5))
+    sample = report.samples[-1]
+    for metric in ('elapsed', 'commands', 'errors', 'cmds_per_sec', 'latency_p50',
+                   'latency_p99', 'rss', 'traced_blocks', 'open_fds', 'loggers', 'top_growth'):
+        expect(sample).to(have_key(metric))
+    expect(report.summary()['commands']).to(be_above(10))
+    expect(report.summary()['errors']).to(be_above(0))
+    expect(clis[0].executed[:2]).to(equal(["show version", "bad"]))
+    expect(clis[1].executed[:2]).to(equal(["bad", "show version"]))
+    expect(clis[0].run_opts).to(equal({'timeout': 3}))
+
+def test_soak_regressions_against_baseline():
+    baseline = SoakReport([sample(latency=0.10, rate=100, rss=1000, fds=10)])
+    report = SoakReport([sample(latency=0.11, rate=60, rss=1500, fds=10)])
+    regressions = report.regressions(baseline, tolerance=0.2)
+    expect(regressions).to(have_len(2))
+    expect(regressions[0]).to(start_with("cmds_per_sec went from 100 (baseline) to 60"))
+    expect(regressions[1]).to(start_with("rss"))
+
+def test_soak_regressions_drift():
+    report = SoakReport([sample(latency=0.10, rate=100, rss=1000, fds=10),
+                         sample(latency=0.30, rate=100, rss=1000, fds=14)])
+    expect(report.regressions()).to(equal([
+        "latency_p50 went from 0.1 (first sample) to 0.3",
+        "latency_p99 went from 0.1 (first sample) to 0.3",
+        "open_fds went from 10 (first sample) to 14"]))
+
+def test_soak_report_write_load(tmp_path):
+    report = SoakReport([sample(latency=0.10, rate=100, rss=1000, fds=10)])
+    path = str(tmp_path / "soak.json")
+    report.write(path, baseline=report)
+    expect(SoakReport.load(path).samples).to(equal(report.samples))
+
+
+def sample(latency, rate, rss, fds):
+    return {'elapsed': 1, 'commands': 10, 'errors': 0, 'cmds_per_sec': rate,
+            'latency_p50': latency, 'latency_p90': latency, 'latency_p99': latency,
+            'latency_max': latency, 'rss': rss, 'traced_memory': None, 'traced_blocks': None,
+            'top_growth': [], 'open_fds': fds, 'loggers': 5}
+
+class FakeCli(object):
+    def __init__(self, fail_on=None):
+        self.executed = []
+        self.fail_on = fail_on
+
+    def run(self, cmds, **run_opts):
+        self.run_opts = run_opts
+        self.executed.append(cmds)
+        time.sleep(0.005)
+        if cmds == self.fail_on:
+            raise AssertionError("failed")
+        return RunResults(0.005, "output")
@@ -0,0 +1,106 @@
+import os
+import stat
+import sys
+import time
+
+import pytest
+
+from expects import *
+from unittest.mock import Mock
+
+from climatic.CoreCli import prelogin
+from climatic.cli.Linux import SshLinux
+from climatic.connections.Ssh import Ssh, seed_known_hosts
+
+FAKE_SSH = """#!{python}
+import getpass, os, sys
+with open(os.environ["FAKE_SSH_LOG"], "a") as log:
+    log.write(" ".join(sys.argv[1:]) + "\\n")
+if "BatchMode=yes" in sys.argv:
+    if os.environ.get("FAKE_SSH_NO_KEY"):
+        print("user@host: Permission denied (publickey).")
+        sys.exit(255)
+elif getpass.getpass("user@host's password: ") != "secret":
+    print("Permission denied, please try again.")
+    sys.exit(255)
+os.execvp("env", ["env", "PS1=host# ", "sh"])
+"""
+
+FAKE_KEYSCAN = """#!/bin/sh
+echo "$@" >> "$FAKE_SSH_LOG"
+for host in "$@"; do
+    case "$host" in -*|[0-9]*) ;; *) echo "$host ssh-ed25519 AAAAKEY$host" ;; esac
+done
+"""
+
+
+def test_ssh_command_line():
+    ssh = Ssh("10.0.0.1", "user", port=2222, identity_file="/keys/id", key_auth=True,
+              known_hosts="/tmp/known", host_key_checking="accept-new", connect_timeout=3)
+    ssh._spawn = Mock()
+    ssh.connect(None)
+    command = ssh._spawn.call_args[0][0]
+    expect(command).to(start_with("ssh -p 2222 user@10.0.0.1 -i /keys/id -o IdentitiesOnly=yes"))
+    expect(command).to(contain("-o BatchMode=yes", "-o UserKnownHostsFile=/tmp/known",
+                               "-o StrictHostKeyChecking=accept-new", "-o ConnectTimeout=3"))
+
+    default = Ssh("10.0.0.1", "user")
+    default._spawn = Mock()
+    default.connect(None)
+    expect(default._spawn.call_args[0][0]).to(equal("ssh -p 22 user@10.0.0.1 "))
+
+def test_ssh_password_login_timeline(fake_ssh):
+    cli = SshLinux("10.0.0.1", "user", "secret", quiet=True)
+    expect(list(cli.login_timeline.phases())).to(equal(["spawn", "banner", "auth", "prompt"]))
+    expect(cli.login_timeline.total).to(be_below(5))
+    expect(str(cli.login_timeline)).to(contain("auth"))
+    expect(cli.run("echo logged").output).to(contain("logged"))
+
+def test_ssh_key_login(fake_ssh):
+    cli = SshLinux("10.0.0.1", "user", None, key_auth=True, quiet=True)
+    expect(list(cli.login_timeline.phases())).to(equal(["spawn", "banner", "prompt"]))
+    expect(cli.run("echo logged").output).to(contain("logged"))
+
+def test_ssh_login_failures(fake_ssh, monkeypatch):
+    expect(lambda: SshLinux("10.0.0.1", "user", "wrong", quiet=True)).to(
+        raise_error(AssertionError, contain("authentication failed")))
+    monkeypatch.setenv("FAKE_SSH_NO_KEY", "1")
+    expect(lambda: SshLinux("10.0.0.1", "user", None, key_auth=True, quiet=True)).to(
+        raise_error(AssertionError))
+
+def test_seed_known_hosts(fake_ssh, tmp_path):
+    known_hosts = str(tmp_path / "known_hosts")
+    expect(seed_known_hosts(["alpha", "beta"], known_hosts)).to(equal(2))
+    expect(seed_known_hosts(["alpha", "beta", "gamma"], known_hosts)).to(equal(1))
+    with open(known_hosts) as known_file:
+        expect(known_file.read()).to(contain("alpha ssh-ed25519", "gamma ssh-ed25519"))
+    with open(fake_ssh) as log:
+        expect(log.read().splitlines()[-1]).to(equal("-p 22 -T 5 gamma"))
+
+def test_prelogin_in_parallel():
+    def open_cli(host):
+        time.sleep(0.5)
+        if host == "down":
+            raise AssertionError("Timeout")
+        return host.upper()
+
+    start = time.time()
+    clis = prelogin(open_cli, ["a", "b", "c", "d", "down"])
+    expect(time.time() - start).to(be_below(1.5))
+    expect(clis["a"]).to(equal("A"))
+    expect(clis["down"]).to(be_an(AssertionError))
+
+
+@pytest.fixture
+def fake_ssh(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for (name, script) in (("ssh", FAKE_SSH.format(python=sys.executable)),
+                           ("ssh-keyscan", FAKE_KEYSCAN)):
+        path = bin_dir / name
+        path.write_text(script)
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    log = str(tmp_path / "ssh.log")
+    monkeypatch.setenv("PATH", "{0}{1}{2}".format(bin_dir, os.pathsep, os.environ["PATH"]))
+    monkeypatch.setenv("FAKE_SSH_LOG", log)
+    return log
@@ -0,0 +1,45 @@
+import pytest
+
+from expects import *
+
+from climatic.StreamCheck import StreamChecker, StreamCheckFailure
+
+
+def test_stream_checker_ignores_output_before_start_and_echo():
+    checker = StreamChecker(["^line 1$"], ["Error"])
+    checker.feed("Error from a previous command\r\n")
+    checker.start("show Error")
+    checker.feed("show Error\r\n")
+    checker.feed("line 1\r\n")
+    checker.feed("anything else\r\nprompt# ")
+
+def test_stream_checker_wrapped_echo():
+    checker = StreamChecker(["^10 packets transmitted"], ["No route"])
+    cmd = "ping -c 10 -i 0.2 -W 1 -s 1400 no-route-to-this-host.example.com"
+    checker.start(cmd)
+    # The terminal wraps the echo of the long command at 30 columns
+    checker.feed("host# " + cmd[:24] + "\r\n" + cmd[24:54] + "\r\n" + cmd[54:] + "\r\n")
+    checker.feed("10 packets transmitted\r\n")
+    with pytest.raises(StreamCheckFailure):
+        checker.feed("No route to host\r\n")
+
+def test_stream_checker_lines_split_among_chunks():
+    checker = StreamChecker(["first", "second", "fourth"])
+    checker.start("cmd")
+    checker.feed(b"cmd\r\nfir")
+    checker.feed(b"st\r\n\r\nsec")
+    with pytest.raises(StreamCheckFailure):
+        checker.feed(b"ond-hand\r\nthird\r\n")
+
+def test_stream_checker_forbidden_after_expected():
+    checker = StreamChecker(["first"], ["(?i)fail"])
+    checker.start("cmd")
+    checker.feed("cmd\r\nfirst\r\nok\r\n")
+    with pytest.raises(StreamCheckFailure):
+        checker.feed("test FAILED\r\n")
+
+def test_stream_checker_bytes_decoding():
+    checker = StreamChecker(["café"])
+    checker.start("cmd")
+    checker.feed(b"cmd\r\ncaf\xc3")
+    checker.feed(b"\xa9\r\n")
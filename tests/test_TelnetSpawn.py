@@ -0,0 +1,137 @@
+import pexpect
+import pytest
+import socket
+import struct
+import threading
+import time
+
+from expects import *
+
+from climatic.CoreCli import CoreCli
+from climatic.connections.Ser2Net import Ser2Net
+from climatic.connections.Telnet import Telnet
+from climatic.connections.TelnetSpawn import TelnetSpawn
+from climatic.connections.TelnetSpawn import IAC, DO, DONT, WILL, WONT, SB, SE, ECHO, SGA, NAWS
+from climatic.connections.TelnetSpawn import TTYPE
+
+
+def test_telnet_negotiation(telnet_server):
+    server = telnet_server(negotiation=bytes([IAC, DO, NAWS, IAC, DO, TTYPE, IAC, WILL, ECHO,
+                                              IAC, DO, 39, IAC, SB, TTYPE, 1, IAC, SE]))
+    terminal = TelnetSpawn('127.0.0.1', server.port, rows=24, cols=500, encoding='utf-8')
+    terminal.expect('login: ', timeout=5)
+    expect(terminal.before).to(equal('welcome\r\n'))
+    wait_for(lambda: bytes([IAC, SE]) in server.received[-2:])
+    received = bytes(server.received)
+    expect(received).to(contain(bytes([IAC, WILL, NAWS])))
+    expect(received).to(contain(bytes([IAC, SB, NAWS]) + struct.pack('>HH', 500, 24) +
+                                bytes([IAC, SE])))
+    expect(received).to(contain(bytes([IAC, WILL, TTYPE])))
+    expect(received).to(contain(bytes([IAC, DO, ECHO])))
+    expect(received).to(contain(bytes([IAC, WONT, 39])))
+    expect(received).to(contain(bytes([IAC, SB, TTYPE, 0]) + b'VT100' + bytes([IAC, SE])))
+    terminal.close()
+
+def test_telnet_split_commands_and_escapes(telnet_server):
+    server = telnet_server(negotiation=b'', banner=[b'ab', bytes([IAC]), bytes([IAC, IAC]),
+                                                    bytes([DO]), bytes([SGA]), b'cd\r', b'\0e\r',
+                                                    b'\nlogin: '])
+    terminal = TelnetSpawn('127.0.0.1', server.port)
+    terminal.expect(b'login: ', timeout=5)
+    expect(terminal.before).to(equal(b'ab\xffcd\re\r\n'))
+    terminal.send(b'x\xffy')
+    terminal.sendline('z')
+    wait_for(lambda: server.received.endswith(b'z\r\n'))
+    expect(bytes(server.received)).to(equal(bytes([IAC, WILL, SGA]) + b'x\xff\xffyz\r\n'))
+    terminal.close()
+
+def test_telnet_eof(telnet_server):
+    server = telnet_server(negotiation=b'', banner=[b'bye'], close=True)
+    terminal = TelnetSpawn('127.0.0.1', server.port)
+    expect(terminal.expect([pexpect.EOF], timeout=5)).to(equal(0))
+    expect(terminal.isalive()).to(be_false)
+    terminal.close(force=True)
+
+def test_core_cli_over_native_telnet(telnet_server, core_cli):
+    server = telnet_server(negotiation=bytes([IAC, DO, NAWS]), device=True)
+    cmd = core_cli(Telnet('127.0.0.1', 'admin', port=server.port, native=True), quiet=True)
+    out = cmd.run("show version")
+    expect(out.output).to(contain("show version\r\nversion 1.0\r\n"))
+    expect(cmd.connection.terminal.cols).to(equal(500))
+
+def test_core_cli_over_native_ser2net(telnet_server, core_cli):
+    server = telnet_server(negotiation=b'', device=True)
+    cmd = core_cli(Ser2Net('127.0.0.1', server.port, native=True, bytes_mode=True), quiet=True)
+    out = cmd.run("show version")
+    expect(out.raw_output).to(contain(b"version 1.0"))
+
+def test_native_telnet_rejects_background_reader():
+    with pytest.raises(ValueError):
+        Telnet('127.0.0.1', 'admin', native=True, background_reader=True).connect(None)
+
+
+class TelnetServer(object):
+    """ Fake Telnet device accepting a single connection
+    """
+    def __init__(self, negotiation, banner, close, device):
+        self.negotiation = negotiation
+        self.banner = banner
+        self.close = close
+        self.device = device
+        self.received = bytearray()
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        conn = self.listener.accept()[0]
+        conn.sendall(self.negotiation)
+        for chunk in self.banner:
+            conn.sendall(chunk)
+            time.sleep(0.02)
+        if self.close:
+            conn.close()
+            return
+        if self.device:
+            conn.sendall(b'dev# ')
+        line = b''
+        while True:
+            data = conn.recv(1024)
+            if not data:
+                return
+            self.received += data
+            if self.device:
+                line += data.replace(bytes([IAC, WILL, NAWS]), b'')
+                while b'\r\n' in line:
+                    cmd, line = line.split(b'\r\n', 1)
+                    cmd = cmd.split(bytes([IAC, SE]))[-1]
+                    reply = b'\r\nversion 1.0' if cmd == b'show version' else b''
+                    conn.sendall(cmd + reply + b'\r\ndev# ')
+
+@pytest.fixture
+def telnet_server():
+    servers = []
+    def create(negotiation, banner=(b'welcome\r\nlogin: ',), close=False, device=False):
+        server = TelnetServer(negotiation, banner, close, device)
+        servers.append(server)
+        return server
+    yield create
+    for server in servers:
+        server.listener.close()
+
+@pytest.fixture
+def core_cli():
+    class CoreCliExtension(CoreCli):
+        def login(self):
+            self.connection.terminal.expect(self._terminal_pattern(self.marker), timeout=5)
+        def logout(self):
+            self.connection.terminal.close()
+    return CoreCliExtension
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)